@@ -0,0 +1,86 @@
+"""
+Primary/replica database routing.
+
+Reads go to ``settings.READ_REPLICA_ALIAS`` only inside a request that
+``ReplicaReadMiddleware`` has marked as replica-safe (GET/HEAD requests for
+the public site: page serving, search and the booking APIs). Everything else
+- writes, the admin, POSTs, models listed in ``PRIMARY_ONLY_MODELS`` - uses
+the primary. Once a request writes anything, its remaining reads stick to the
+primary as well, so read-after-write in the booking flow never sees replica
+lag.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_ALIAS = 'default'
+
+# Models whose reads always need to see their own writes
+PRIMARY_ONLY_MODELS = {
+    'sessions.Session',
+    'booking.FormSubmission',
+}
+
+# Requests under these paths always use the primary (editors expect to see
+# what they just saved)
+PRIMARY_ONLY_PATHS = ('/admin/', '/django-admin/')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def get_replica_alias():
+    """Configured replica alias, or None when read routing is disabled"""
+    alias = getattr(settings, 'READ_REPLICA_ALIAS', None)
+    if alias and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Allow (or forbid) replica reads for the duration of the block"""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_primary():
+    """Force all reads in the block onto the primary"""
+    return replica_reads(False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or model._meta.label in PRIMARY_ONLY_MODELS:
+            return PRIMARY_ALIAS
+        return get_replica_alias() or PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Read-after-write: the rest of this request reads from the primary
+        _replica_reads.set(False)
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replica hold the same data
+        return True
+
+
+class ReplicaReadMiddleware:
+    """Marks read-only public requests as safe to serve from the replica"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or request.path.startswith(PRIMARY_ONLY_PATHS)
+            or not get_replica_alias()
+        ):
+            return self.get_response(request)
+
+        with replica_reads():
+            return self.get_response(request)
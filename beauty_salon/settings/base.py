@@ -51,12 +51,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "beauty_salon.db_routing.ReplicaReadMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "home.frontend_cache.FrontendCacheMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
 ]
 
@@ -81,6 +83,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "beauty_salon.wsgi.application"
+ASGI_APPLICATION = "beauty_salon.asgi.application"
 
 
 # Database
@@ -93,6 +96,38 @@ DATABASES = {
     }
 }
 
+# Read-only public traffic (page serving, search, booking APIs) can be served
+# from a replica. Add the replica to DATABASES (e.g. in settings/local.py) and
+# point READ_REPLICA_ALIAS at it; writes and the admin always use "default".
+# See beauty_salon/db_routing.py.
+DATABASE_ROUTERS = ["beauty_salon.db_routing.PrimaryReplicaRouter"]
+
+READ_REPLICA_ALIAS = None
+
+# SQLite tuning for serving concurrent traffic (applied by settings/production.py
+# and compared against the defaults by `manage.py benchmark_sqlite`):
+# - WAL lets readers run while a booking is being written
+# - synchronous=NORMAL is durable in WAL mode and avoids an fsync per commit
+# - a larger page cache / mmap keeps the catalog in memory
+# - busy_timeout/timeout make writers queue for the lock instead of failing
+#   with "database is locked"
+# Transactions stay DEFERRED: an IMMEDIATE transaction_mode here would take the
+# write lock at the start of every atomic block, read-only ones in the admin
+# and middleware included, and serialize them behind bookings. The booking
+# write paths, which read before writing, begin IMMEDIATE themselves (see
+# booking/transactions.py).
+SQLITE_PRODUCTION_OPTIONS = {
+    "init_command": (
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        "PRAGMA cache_size=-64000;"
+        "PRAGMA mmap_size=268435456;"
+        "PRAGMA temp_store=MEMORY;"
+        "PRAGMA busy_timeout=20000;"
+    ),
+    "timeout": 20,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -143,6 +178,61 @@ STATIC_URL = "/static/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
+# Content pages pre-rendered to HTML by `manage.py prerender_pages`, for the
+# web server to serve directly. With STATIC_PRERENDER_ON_PUBLISH the affected
+# pages are queued whenever a page is published, unpublished, moved or deleted,
+# for `manage.py prerender_pages --queued` (e.g. with --every 10) to re-render.
+STATIC_PRERENDER_ROOT = os.path.join(BASE_DIR, "prerendered")
+STATIC_PRERENDER_ON_PUBLISH = False
+
+# Front-end (reverse proxy / CDN) cache. Anonymous page responses are marked
+# cacheable by shared caches for FRONTEND_CACHE_MAX_AGE seconds and tagged
+# with surrogate keys, which are purged through FRONTEND_CACHE_PURGER when
+# pages change (see home/frontend_cache.py). LocalPurger only logs; use
+# home.frontend_cache.HTTPPurger with your proxy's purge endpoint, e.g.
+#   {"BACKEND": "home.frontend_cache.HTTPPurger",
+#    "OPTIONS": {"URL": "http://varnish:6081/", "METHOD": "PURGE", "KEY_HEADER": "xkey"}}
+FRONTEND_CACHE_MAX_AGE = 60 * 60
+FRONTEND_CACHE_KEY_HEADER = "Surrogate-Key"
+FRONTEND_CACHE_PURGER = {
+    "BACKEND": "home.frontend_cache.LocalPurger",
+}
+
+# Appointment reminders (manage.py send_reminders). EmailReminderBackend sends
+# through EMAIL_BACKEND; booking.reminders.LocalReminderBackend only logs.
+BOOKING_REMINDER_BACKEND = {
+    "BACKEND": "booking.reminders.EmailReminderBackend",
+}
+
+# Caches. The throttle cache holds the booking rate limit buckets and has to
+# be shared by all worker processes: a file-based cache works on one server,
+# use Redis or Memcached when running on several.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "throttle": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "throttle"),
+    },
+}
+
+# Rate limits of the booking endpoints (see booking/throttling.py), as
+# "<requests>/<sec|min|hour|day>" token buckets per client IP and, for
+# submissions, per customer email. Behind a reverse proxy, set
+# BOOKING_THROTTLE_IP_HEADER to the header it puts the client address in,
+# e.g. "HTTP_X_FORWARDED_FOR"; otherwise every visitor counts as the proxy.
+# `manage.py check` fails (booking.E001) if SECURE_PROXY_SSL_HEADER or
+# USE_X_FORWARDED_HOST/PORT are set without it.
+BOOKING_THROTTLE_ENABLED = True
+BOOKING_THROTTLE_CACHE = "throttle"
+BOOKING_THROTTLE_IP_HEADER = None
+BOOKING_THROTTLE_RATES = {
+    "booking_ip": "20/hour",
+    "booking_email": "5/hour",
+    "availability_ip": "120/min",
+}
+
 # Default storage settings
 # See https://docs.djangoproject.com/en/5.2/ref/settings/#std-setting-STORAGES
 STORAGES = {
@@ -165,9 +255,12 @@ WAGTAIL_SITE_NAME = "beauty_salon"
 
 # Search
 # https://docs.wagtail.org/en/stable/topics/search/backends.html
+# Index updates are queued and sent in batches by `manage.py update_search_index`
+# (see home/search_index.py) rather than written during the editor's request
 WAGTAILSEARCH_BACKENDS = {
     "default": {
         "BACKEND": "wagtail.search.backends.database",
+        "AUTO_UPDATE": False,
     }
 }
 
@@ -21,6 +21,17 @@ CSRF_TRUSTED_ORIGINS = [
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
+# Replica alias for trying out read routing locally: it opens the same file as
+# "default", but the test suite gets a separate database for it (created from
+# the models rather than migrated, like a real replica that copies the
+# primary's schema). Set READ_REPLICA_ALIAS = "replica" (e.g. in local.py) to
+# route reads to it.
+DATABASES["replica"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": DATABASES["default"]["NAME"],
+    "TEST": {"MIGRATE": False},
+}
+
 
 try:
     from .local import *
@@ -14,6 +14,7 @@ urlpatterns = [
     path("documents/", include(wagtaildocs_urls)),
     path("search/", search_views.search, name="search"),
     path("booking/", include("booking.urls")),
+    path("api/v1/", include("home.urls")),
 ]
 
 
@@ -0,0 +1,98 @@
+"""
+Warm-up for preloaded application servers.
+
+Runs once in the gunicorn master after the application is loaded
+(``preload_app``, see gunicorn.conf.py), so every forked worker starts with
+compiled templates, a populated URL resolver and cached catalog data instead
+of paying for them on its first requests.
+"""
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Apps whose templates are compiled up front (the admin's are left to warm up
+# on use)
+PROJECT_APPS = ['home', 'booking', 'search']
+
+
+def iter_template_names():
+    """Names of the project's .html templates"""
+    template_dirs = [
+        *settings.TEMPLATES[0]['DIRS'],
+        *(os.path.join(apps.get_app_config(label).path, 'templates') for label in PROJECT_APPS),
+    ]
+    for template_dir in template_dirs:
+        for dirpath, dirnames, filenames in os.walk(template_dir):
+            for filename in filenames:
+                if filename.endswith('.html'):
+                    yield os.path.relpath(os.path.join(dirpath, filename), template_dir).replace(os.sep, '/')
+
+
+def warm_templates():
+    """Compile every project template into the cached template loader"""
+    count = 0
+    for name in iter_template_names():
+        try:
+            get_template(name)
+        except (TemplateDoesNotExist, TemplateSyntaxError):
+            logger.warning("Could not pre-compile template %s", name, exc_info=True)
+        else:
+            count += 1
+    return count
+
+
+def warm_urls():
+    get_resolver()._populate()
+
+
+def warm_catalog():
+    """Prime the site root paths, availability map, location index and home/listing pages"""
+    from booking.availability import get_availability_map
+    from booking.nearest import get_index
+    from home import prerender
+    from wagtail.models import Site
+
+    Site.get_site_root_paths()
+    get_availability_map()
+    get_index()
+
+    # Rendering the home page and its top-level listings also resolves their
+    # image renditions and fills any per-process caches they use
+    site = prerender.get_default_site()
+    if site is None:
+        return 0
+    client = prerender.get_client(site)
+    pages = prerender.prerenderable_pages(site).filter(depth__lte=site.root_page.depth + 1)
+    for page in pages:
+        prerender.render_page(client, site, prerender.page_path_for_url_path(site, page.url_path))
+    return len(pages)
+
+
+def warm_up():
+    """Warm this process's caches; call before forking workers"""
+    start = time.perf_counter()
+    templates = warm_templates()
+    warm_urls()
+    try:
+        pages = warm_catalog()
+    except Exception:
+        # A missing table or unreachable database mustn't stop the server starting
+        logger.exception("Catalog warm-up failed")
+        pages = 0
+    finally:
+        # Forked workers must open their own database connections
+        connections.close_all()
+
+    logger.info(
+        "Warm-up: %d templates, %d pages in %.0f ms",
+        templates, pages, (time.perf_counter() - start) * 1000,
+    )
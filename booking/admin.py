@@ -1,13 +1,102 @@
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
+from wagtail.admin.paginator import WagtailPaginator
+from wagtail.permission_policies import ModelPermissionPolicy
 from wagtail.snippets.models import register_snippet
-from wagtail.snippets.views.snippets import SnippetViewSet
-from .models import FormSubmission
+from wagtail.snippets.views.snippets import IndexView, SnippetViewSet
+from .models import ArchivedFormSubmission, FormSubmission, WaitlistEntry
+
+
+def estimate_row_count(model, using):
+    """
+    Row count from the database's planner statistics, without scanning the table.
+    Returns None if the backend (or a never-analyzed SQLite database) has none.
+    """
+    table = model._meta.db_table
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate > 0 else None
+
+
+class EstimatedCountPaginator(WagtailPaginator):
+    """
+    Paginator that, for the unfiltered listing of a large table, reports the
+    planner's row estimate instead of running COUNT(*) over every row.
+    Filtered/searched listings and small tables still get an exact count.
+    """
+    exact_count_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate and estimate > self.exact_count_threshold:
+                return estimate
+        return super().count
+
+
+class FormSubmissionIndexView(IndexView):
+    paginator_class = EstimatedCountPaginator
+
+    def get_search_form(self):
+        form = super().get_search_form()
+        if form:
+            # Words only match the start of a name, email or phone number
+            form.fields['q'].widget.attrs['placeholder'] = "Search by first letters of name, email or phone…"
+        return form
+
+    def search_queryset(self, queryset):
+        """
+        Case-insensitive prefix search: every word has to match the start of
+        one of the fields ("jane do"; "smi" finds Smith but not Goldsmith),
+        which the LOWER(field) expression indexes on FormSubmission can answer,
+        instead of an icontains scan over four columns.
+        """
+        if not self.is_searching:
+            return queryset
+
+        queryset = queryset.alias(
+            **{f'{field}_lower': Lower(field) for field in self.search_fields}
+        )
+        # SQLite won't use an index for LIKE, but its default (BINARY)
+        # collation compares bytes, so a range is exactly a prefix match.
+        # Elsewhere the collation may not be byte order, so use LIKE 'term%'
+        # (indexed with text_pattern_ops on PostgreSQL, see PrefixSearchIndex).
+        byte_order = connections[queryset.db].vendor == 'sqlite'
+        for term in self.search_query.lower().split():
+            query = Q()
+            for field in self.search_fields:
+                if byte_order:
+                    upper_bound = term[:-1] + chr(ord(term[-1]) + 1)
+                    query |= Q(**{f'{field}_lower__gte': term, f'{field}_lower__lt': upper_bound})
+                else:
+                    query |= Q(**{f'{field}_lower__startswith': term})
+            queryset = queryset.filter(query)
+        return queryset
 
 
 class FormSubmissionAdmin(SnippetViewSet):
     model = FormSubmission
+    index_view_class = FormSubmissionIndexView
     menu_label = 'Booking Submissions'
     menu_icon = 'calendar'
-    list_display = ['customer_full_name', 'service', 'location', 'preferred_date', 'preferred_time', 'status', 'submitted_at']
+    list_display = ['customer_full_name', 'service', 'location', 'preferred_date', 'preferred_time', 'status', 'submitted_at', 'get_duplicate_flag']
     list_filter = ['status', 'location', 'preferred_date']
     search_fields = ['customer_first_name', 'customer_last_name', 'customer_email', 'customer_phone']
     ordering = ['-submitted_at']
@@ -15,5 +104,68 @@ class FormSubmissionAdmin(SnippetViewSet):
     # Enable adding/editing
     add_to_admin_menu = True
 
+    def get_queryset(self, request):
+        # Service and location are shown in every row (and in __str__)
+        return FormSubmission.objects.select_related('service', 'location')
+
+
+class ReadOnlyPermissionPolicy(ModelPermissionPolicy):
+    """Model permissions, minus creating and editing"""
+    read_only_actions = {'add', 'change'}
+
+    def user_has_permission(self, user, action):
+        return action not in self.read_only_actions and super().user_has_permission(user, action)
+
+    def user_has_any_permission(self, user, actions):
+        return super().user_has_any_permission(user, set(actions) - self.read_only_actions)
+
+    def users_with_any_permission(self, actions):
+        return super().users_with_any_permission(set(actions) - self.read_only_actions)
+
+
+class ArchivedFormSubmissionAdmin(SnippetViewSet):
+    """
+    Read-only listing of archived bookings. Rows can be put back into the
+    live table with the "Restore" bulk action (or `manage.py restore_bookings`).
+    """
+    model = ArchivedFormSubmission
+    menu_label = 'Archived Bookings'
+    menu_icon = 'folder-inverse'
+    list_display = ['customer_full_name', 'service_name', 'location_name', 'preferred_date', 'preferred_time', 'status', 'archived_at']
+    list_filter = ['status', 'preferred_date']
+    search_fields = ['customer_first_name', 'customer_last_name', 'customer_email', 'customer_phone']
+    ordering = ['-preferred_date', '-original_id']
+    inspect_view_enabled = True
+    copy_view_enabled = False
+    add_to_admin_menu = True
+
+    @property
+    def permission_policy(self):
+        return ReadOnlyPermissionPolicy(self.model)
+
+
+class WaitlistEntryAdmin(SnippetViewSet):
+    """
+    Customers waiting for a slot. Entries move to "Offered a Slot" on their own
+    when a cancellation is backfilled; the offer shows up as a pending booking.
+    """
+    model = WaitlistEntry
+    menu_label = 'Waitlist'
+    menu_icon = 'time'
+    list_display = ['customer_full_name', 'service', 'location', 'earliest_date', 'latest_date', 'status', 'offered_submission', 'created_at']
+    list_filter = ['status', 'location']
+    search_fields = ['customer_first_name', 'customer_last_name', 'customer_email', 'customer_phone']
+    ordering = ['created_at']
+    add_to_admin_menu = True
+
+    def get_queryset(self, request):
+        # The offered booking is listed by its __str__, which names its
+        # service and location
+        return WaitlistEntry.objects.select_related(
+            'service', 'location', 'offered_submission__service', 'offered_submission__location',
+        )
+
 # Register as snippet
-register_snippet(FormSubmission, FormSubmissionAdmin)
\ No newline at end of file
+register_snippet(FormSubmission, FormSubmissionAdmin)
+register_snippet(ArchivedFormSubmission, ArchivedFormSubmissionAdmin)
+register_snippet(WaitlistEntry, WaitlistEntryAdmin)
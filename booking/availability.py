@@ -0,0 +1,75 @@
+"""
+Location -> services/employees availability data for the booking form.
+
+The booking page can embed the whole map so the dropdowns update without
+calling the API endpoints. The map is cached under the catalog version
+(home.models.CatalogVersion), so publishing, unpublishing, moving or deleting
+a location, service or employee page, or a catalog import, naturally
+invalidates it.
+"""
+from django.core.cache import cache
+
+from home.models import CatalogVersion, EmployeePage, LocationPage, ServiceLocation
+
+CACHE_KEY_PREFIX = 'booking:availability'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def service_data(service):
+    """Dropdown payload for a service (shared with the API endpoints)"""
+    return {
+        'id': service.id,
+        'name': service.display_name,
+        'price': str(service.price_display),
+        'duration': service.duration_display
+    }
+
+
+def employee_data(employee):
+    """Dropdown payload for an employee (shared with the API endpoints)"""
+    return {
+        'id': employee.id,
+        'name': employee.display_name,
+        'job_title': employee.job_title
+    }
+
+
+def build_availability_map():
+    """
+    {location_id: {'services': [...], 'employees': [...], 'service_employees':
+    {service_id: [employee ids]}}} for all live locations
+    """
+    availability = {
+        location_id: {'services': [], 'employees': []}
+        for location_id in LocationPage.objects.live().values_list('id', flat=True)
+    }
+
+    service_locations = (
+        ServiceLocation.objects
+        .filter(location_id__in=list(availability), service__live=True)
+        .select_related('service')
+        .order_by('location_id', 'sort_order', 'id')
+    )
+    for sl in service_locations:
+        availability[sl.location_id]['services'].append(service_data(sl.service))
+
+    employees = EmployeePage.objects.live().filter(work_location_id__in=list(availability)).order_by('path')
+    for employee in employees:
+        availability[employee.work_location_id]['employees'].append(employee_data(employee))
+
+    # Which of those employees perform each service
+    from .eligibility import get_index
+    eligibility = get_index()
+    for location_id, location_data in availability.items():
+        location_data['service_employees'] = {
+            service['id']: [employee['id'] for employee in eligibility.employees_for(location_id, service['id'])]
+            for service in location_data['services']
+        }
+
+    return availability
+
+
+def get_availability_map():
+    """Cached availability map, rebuilt after any catalog publish"""
+    key = f'{CACHE_KEY_PREFIX}:{CatalogVersion.get()}'
+    return cache.get_or_set(key, build_availability_map, CACHE_TIMEOUT)
@@ -0,0 +1,153 @@
+"""
+iCalendar (.ics) feeds of bookings, one per employee and one per location.
+
+Calendar apps poll feeds every few minutes, so each request first runs one
+aggregate query over the feed's date window (newest ``updated_at`` and row
+count, including cancelled bookings so that cancellations change it too) and
+answers If-None-Match / If-Modified-Since with a 304 when nothing changed.
+Otherwise the events are streamed straight from a database cursor.
+
+Feed URLs carry a signature instead of requiring a login, since calendar apps
+can't sign in; anyone with the URL can read the feed.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.signing import Signer
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from home.models import EmployeePage, LocationPage
+
+from .models import FormSubmission
+
+# Bookings from this many days ago up to this many days ahead are in a feed
+FEED_PAST_DAYS = 30
+FEED_FUTURE_DAYS = 180
+
+# Statuses shown as events (cancelled bookings drop out of the feed)
+FEED_STATUSES = ['pending', 'confirmed', 'completed']
+
+FEED_MODELS = {
+    'employee': EmployeePage,
+    'location': LocationPage,
+}
+
+_signer = Signer(salt='booking.calendar_feeds')
+
+
+# ============================================================================
+# FEED URLS
+# ============================================================================
+
+def feed_token(kind, pk):
+    return _signer.signature(f'{kind}:{pk}')
+
+
+def is_valid_token(kind, pk, token):
+    return constant_time_compare(token, feed_token(kind, pk))
+
+
+def feed_url(page):
+    """Path of ``page``'s feed (an EmployeePage or LocationPage)"""
+    kind = 'employee' if isinstance(page, EmployeePage) else 'location'
+    return reverse('booking:calendar_feed', kwargs={'kind': kind, 'pk': page.pk, 'token': feed_token(kind, page.pk)})
+
+
+# ============================================================================
+# FEED CONTENTS
+# ============================================================================
+
+def feed_window(today):
+    return today - timedelta(days=FEED_PAST_DAYS), today + timedelta(days=FEED_FUTURE_DAYS)
+
+
+def feed_submissions(kind, pk, today):
+    """Every booking in the feed's window, whatever its status"""
+    start, end = feed_window(today)
+    lookup = 'preferred_employee_id' if kind == 'employee' else 'location_id'
+    return FormSubmission.objects.filter(**{lookup: pk}, preferred_date__range=(start, end))
+
+
+def feed_validators(kind, pk, today):
+    """(ETag, Last-Modified) for a feed, from a single aggregate query"""
+    stats = feed_submissions(kind, pk, today).aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    last_modified = stats['last_modified']
+    # The window start is part of the ETag: bookings age out of the feed daily
+    fingerprint = f"{kind}:{pk}:{feed_window(today)[0]}:{stats['count']}:{last_modified and last_modified.isoformat()}"
+    return hashlib.md5(fingerprint.encode(), usedforsecurity=False).hexdigest(), last_modified
+
+
+def escape_text(value):
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold_line(line):
+    """Split a content line into 75-octet pieces (RFC 5545, 3.1)"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    pieces, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Don't split a UTF-8 sequence
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        pieces.append(encoded[start:end].decode())
+        start, limit = end, 74
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event_lines(submission, kind, domain):
+    start = timezone.make_aware(datetime.combine(submission.preferred_date, submission.preferred_time))
+    end = start + timedelta(minutes=submission.service.duration_minutes)
+    summary = f"{submission.service.display_name} - {submission.customer_full_name}"
+    if kind == 'location':
+        summary += f" ({submission.get_employee_preference()})"
+    description = f"Phone: {submission.customer_phone}"
+    if submission.notes:
+        description += f"\n{submission.notes}"
+
+    yield 'BEGIN:VEVENT'
+    yield f'UID:booking-{submission.pk}@{domain}'
+    yield f'DTSTAMP:{format_utc(submission.updated_at)}'
+    yield f'LAST-MODIFIED:{format_utc(submission.updated_at)}'
+    yield f'DTSTART:{format_utc(start)}'
+    yield f'DTEND:{format_utc(end)}'
+    yield f'SUMMARY:{escape_text(summary)}'
+    yield f'LOCATION:{escape_text(submission.location.display_name)}'
+    yield f'DESCRIPTION:{escape_text(description)}'
+    yield f"STATUS:{'TENTATIVE' if submission.status == 'pending' else 'CONFIRMED'}"
+    yield 'END:VEVENT'
+
+
+def feed_lines(page, kind, domain, today):
+    yield 'BEGIN:VCALENDAR'
+    yield 'VERSION:2.0'
+    yield f'PRODID:-//{domain}//Bookings//EN'
+    yield 'CALSCALE:GREGORIAN'
+    yield 'METHOD:PUBLISH'
+    yield f'X-WR-CALNAME:{escape_text(f"Bookings - {page.display_name}")}'
+    submissions = (
+        feed_submissions(kind, page.pk, today)
+        .filter(status__in=FEED_STATUSES)
+        .select_related('service', 'location', 'preferred_employee')
+        .order_by('preferred_date', 'preferred_time', 'pk')
+    )
+    for submission in submissions.iterator(chunk_size=500):
+        yield from event_lines(submission, kind, domain)
+    yield 'END:VCALENDAR'
+
+
+def stream_feed(page, kind, domain, today):
+    """The feed as an iterator of folded, CRLF-terminated lines"""
+    return (fold_line(line) for line in feed_lines(page, kind, domain, today))
@@ -0,0 +1,35 @@
+"""
+In-memory structures built from the live catalog (locations, services,
+employees), kept per process and rebuilt after the catalog changes.
+
+Each lookup reads the catalog version (home.models.CatalogVersion), a counter
+in one row that publishing, unpublishing, moving or deleting a page, or a bulk
+catalog import, bumps for every process as soon as it commits. A lookup costs
+that primary key read; the catalog itself is only read to rebuild.
+"""
+import threading
+
+from home.models import CatalogVersion
+
+
+class CatalogIndex:
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self._value = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """This process's copy, rebuilt if the catalog changed since it was built"""
+        version = CatalogVersion.get()
+        if self._value is None or self._version != version:
+            with self._lock:
+                if self._value is None or self._version != version:
+                    self._value, self._version = self.build(), version
+        return self._value
+
+    def invalidate(self):
+        """Drop this process's copy, e.g. after saving catalog pages without publishing them"""
+        with self._lock:
+            self._value = self._version = None
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.security)
+def check_throttle_ip_header(app_configs, **kwargs):
+    """
+    Settings that trust a reverse proxy's headers mean requests come through
+    one, and without BOOKING_THROTTLE_IP_HEADER the booking rate limits would
+    count every visitor as the proxy
+    """
+    behind_proxy = settings.SECURE_PROXY_SSL_HEADER or settings.USE_X_FORWARDED_HOST or settings.USE_X_FORWARDED_PORT
+    if (
+        behind_proxy
+        and getattr(settings, 'BOOKING_THROTTLE_ENABLED', True)
+        and not getattr(settings, 'BOOKING_THROTTLE_IP_HEADER', None)
+    ):
+        return [Error(
+            "The site runs behind a reverse proxy but BOOKING_THROTTLE_IP_HEADER isn't set, so all "
+            "visitors would share the proxy's booking rate limits.",
+            hint='Set BOOKING_THROTTLE_IP_HEADER to the header the proxy puts the client address in, '
+                 'e.g. "HTTP_X_FORWARDED_FOR", or BOOKING_THROTTLE_ENABLED = False.',
+            id='booking.E001',
+        )]
+    return []
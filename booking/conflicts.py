@@ -0,0 +1,70 @@
+"""
+Finding bookings that overlap for the same employee.
+
+Bookings are read in (employee, date, time) order, straight off the
+booking_sub_employee_day_idx index, and each employee's day is swept once.
+Bookings still running when the next one starts are kept in a heap ordered
+by end time, and every booking is pushed and popped once. That makes the pass
+O(n log n) plus one step per overlapping pair reported, rather than a check of
+every pair. A booking's length is its service's ``duration_minutes``.
+Cancelled bookings and bookings for "any available" employee are ignored.
+"""
+import heapq
+from collections import namedtuple
+from datetime import time
+
+from .models import FormSubmission
+
+Overlap = namedtuple('Overlap', [
+    'employee_id', 'date',
+    'first_id', 'first_start', 'first_end',
+    'second_id', 'second_start', 'second_end',
+])
+
+
+def seconds_to_time(seconds):
+    """Clock time for seconds since midnight (capped at the end of the day)"""
+    seconds = min(seconds, 24 * 60 * 60 - 1)
+    return time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def sweep(rows):
+    """
+    Overlapping pairs among ``rows`` of (id, employee id, date, start time,
+    duration in minutes), which must be sorted by employee, date and time.
+    The later-starting booking of each pair is ``second``.
+    """
+    running = []
+    current_day = None
+    for pk, employee_id, day, start_time, duration in rows:
+        if (employee_id, day) != current_day:
+            running.clear()
+            current_day = (employee_id, day)
+        start = start_time.hour * 3600 + start_time.minute * 60 + start_time.second
+        end = start + duration * 60
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for other_end, other_start, other_pk in sorted(running, key=lambda entry: (entry[1], entry[2])):
+            yield Overlap(
+                employee_id, day,
+                other_pk, seconds_to_time(other_start), seconds_to_time(other_end),
+                pk, start_time, seconds_to_time(end),
+            )
+        heapq.heappush(running, (end, start, pk))
+
+
+def sweep_rows(queryset=None):
+    """The (id, employee id, date, time, duration) rows sweep() needs, in index order"""
+    queryset = FormSubmission.objects.all() if queryset is None else queryset
+    return (
+        queryset
+        .filter(preferred_employee__isnull=False)
+        .exclude(status='cancelled')
+        .order_by('preferred_employee_id', 'preferred_date', 'preferred_time', 'pk')
+        .values_list('pk', 'preferred_employee_id', 'preferred_date', 'preferred_time', 'service__duration_minutes')
+    )
+
+
+def find_overlaps(queryset=None, chunk_size=10000):
+    """Every overlapping pair of bookings in ``queryset`` (default: all submissions)"""
+    return sweep(sweep_rows(queryset).iterator(chunk_size=chunk_size))
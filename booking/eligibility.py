@@ -0,0 +1,101 @@
+"""
+Which employees can perform which services where, as in-memory bitsets.
+
+Each live employee gets a bit. The index keeps, per location, the bits of the
+employees working there, and per service the bits of the employees with that
+skill (EmployeeSkill). Employees with no skills listed perform every service.
+"Employees for this service at this location" is then the AND of two
+integers, and validating a booking is a couple of bit tests, instead of joins
+across pages, skills and service locations. The index is rebuilt after a
+location, service or employee page changes (see booking/catalog_index.py).
+"""
+from home.models import EmployeePage, EmployeeSkill, ServiceLocation
+
+from .availability import employee_data
+from .catalog_index import CatalogIndex
+
+
+def iter_bits(mask):
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+class EligibilityIndex:
+    def __init__(self, employees, skills, service_locations):
+        """
+        ``employees``: (id, work location id, dropdown data) in display order;
+        ``skills``: (employee id, service id); ``service_locations``:
+        (location id, service id)
+        """
+        self.employees = []
+        self.bits = {}
+        self.at_location = {}
+        # Employees without a work location may be booked at any location
+        self.unassigned = 0
+        for bit, (employee_id, location_id, data) in enumerate(employees):
+            self.employees.append(data)
+            self.bits[employee_id] = bit
+            if location_id is None:
+                self.unassigned |= 1 << bit
+            else:
+                self.at_location[location_id] = self.at_location.get(location_id, 0) | 1 << bit
+
+        self.with_skill = {}
+        skilled = 0
+        for employee_id, service_id in skills:
+            bit = self.bits.get(employee_id)
+            if bit is not None:
+                self.with_skill[service_id] = self.with_skill.get(service_id, 0) | 1 << bit
+                skilled |= 1 << bit
+        # Employees without skills listed perform every service
+        self.all_services = ((1 << len(self.employees)) - 1) & ~skilled
+
+        self.services_at = {}
+        for location_id, service_id in service_locations:
+            self.services_at.setdefault(location_id, set()).add(service_id)
+
+    def employee_mask(self, location_id, service_id):
+        return self.at_location.get(location_id, 0) & (self.with_skill.get(service_id, 0) | self.all_services)
+
+    def employees_for(self, location_id, service_id):
+        """Dropdown data of the employees at a location who perform a service"""
+        if not self.offers(location_id, service_id):
+            return []
+        return [self.employees[bit] for bit in iter_bits(self.employee_mask(location_id, service_id))]
+
+    def offers(self, location_id, service_id):
+        return service_id in self.services_at.get(location_id, ())
+
+    def works_at(self, employee_id, location_id):
+        bit = self.bits.get(employee_id)
+        return bit is not None and bool((self.at_location.get(location_id, 0) | self.unassigned) >> bit & 1)
+
+    def performs(self, employee_id, service_id):
+        bit = self.bits.get(employee_id)
+        return bit is not None and bool((self.with_skill.get(service_id, 0) | self.all_services) >> bit & 1)
+
+
+def build_index():
+    employees = [
+        (employee.id, employee.work_location_id, employee_data(employee))
+        for employee in EmployeePage.objects.live().order_by('path')
+    ]
+    # Skills for unpublished services still count: those employees don't perform everything
+    skills = EmployeeSkill.objects.values_list('employee_id', 'service_id')
+    service_locations = ServiceLocation.objects.filter(
+        service__live=True, location__live=True,
+    ).values_list('location_id', 'service_id')
+    return EligibilityIndex(employees, skills, service_locations)
+
+
+_index = CatalogIndex('eligibility', build_index)
+
+
+def get_index():
+    return _index.get()
+
+
+def invalidate_index():
+    _index.invalidate()
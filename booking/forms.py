@@ -1,9 +1,66 @@
+import uuid
+
 from django import forms
 from django.core.exceptions import ValidationError
-from .models import FormSubmission
+from django.db import IntegrityError
+from .eligibility import get_index
+from .models import FormSubmission, WaitlistEntry
+from .transactions import write_transaction
+
+
+def validate_booking_choices(location, service, preferred_employee):
+    """
+    Check the employee works at the location and performs the service, and the
+    service is offered at the location, against the in-memory eligibility index
+    (rebuilt first if the catalog version in the database has moved on, so a
+    change published through another process counts straight away)
+    """
+    index = get_index()
+
+    # Validate employee works at selected location
+    if preferred_employee and location and not index.works_at(preferred_employee.pk, location.pk):
+        works_at = preferred_employee.work_location.display_name if preferred_employee.work_location else "another location"
+        raise ValidationError(
+            f"{preferred_employee.display_name} works at {works_at}, "
+            f"not at {location.display_name}. Please select a different employee or location."
+        )
+
+    # Validate service is available at selected location
+    if service and location and not index.offers(location.pk, service.pk):
+        available_locations = [sl.location.display_name for sl in service.service_locations.all()]
+        if available_locations:
+            locations_text = ", ".join(available_locations)
+            raise ValidationError(
+                f"{service.display_name} is only available at: {locations_text}. "
+                f"Please select a different service or location."
+            )
+        else:
+            raise ValidationError(
+                f"{service.display_name} is not available at any locations yet. "
+                f"Please select a different service."
+            )
+
+    # Validate employee performs the selected service
+    if preferred_employee and service and not index.performs(preferred_employee.pk, service.pk):
+        raise ValidationError(
+            f"{preferred_employee.display_name} doesn't offer {service.display_name}. "
+            f"Please select a different employee or service."
+        )
 
 
 class BookingForm(forms.ModelForm):
+    # Honeypot: hidden from people, so only bots fill it in. Requests with it
+    # are refused before the form is built (see booking/throttling.py); this
+    # catches forms validated elsewhere.
+    website = forms.CharField(
+        required=False,
+        label='Leave this field empty',
+        widget=forms.TextInput(attrs={'autocomplete': 'off', 'tabindex': '-1'}),
+    )
+    # A fresh key with each rendered form; resubmitting the same form (a
+    # retry, a double click, the back button) sends the same key again
+    idempotency_key = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = FormSubmission
         fields = [
@@ -75,6 +132,8 @@ class BookingForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        if not self.is_bound:
+            self.initial.setdefault('idempotency_key', uuid.uuid4())
         
         self.fields['preferred_employee'].required = False
         self.fields['preferred_employee'].empty_label = "Any Available Employee"
@@ -107,37 +166,108 @@ class BookingForm(forms.ModelForm):
             raise ValidationError("Please select a future date.")
         
         return preferred_date
+
+    def submitted_key(self):
+        """The idempotency key posted with the form, or None"""
+        try:
+            return self.fields['idempotency_key'].clean(self.data.get('idempotency_key'))
+        except ValidationError:
+            return None
+
+    def previous_submission(self):
+        """The submission already made with this form's idempotency key, if any"""
+        key = self.submitted_key()
+        if key is None:
+            return None
+        return FormSubmission.objects.filter(idempotency_key=key).first()
+
+    def save_once(self):
+        """
+        Save the (valid) form, unless a submission was already made with its
+        idempotency key. Returns (submission, created). A retry racing the
+        original is stopped by the unique constraint on the key.
+        """
+        submission = self.previous_submission()
+        if submission is not None:
+            return submission, False
+        self.instance.idempotency_key = self.submitted_key()
+        self.instance.possible_duplicate_of = self.instance.find_near_duplicate()
+        try:
+            # In its own transaction, which on SQLite takes the write lock up
+            # front (see booking/transactions.py)
+            with write_transaction():
+                return self.save(), True
+        except IntegrityError:
+            submission = self.previous_submission()
+            if submission is None:
+                raise
+            return submission, False
+
+    def clean_website(self):
+        if self.cleaned_data.get('website'):
+            raise ValidationError("Your request could not be processed.")
+        return ''
     
     def clean(self):
         cleaned_data = super().clean()
-        service = cleaned_data.get('service')
-        preferred_employee = cleaned_data.get('preferred_employee')
-        location = cleaned_data.get('location')
-        
-        # Validate employee works at selected location
-        if preferred_employee and location:
-            if preferred_employee.work_location and preferred_employee.work_location != location:
-                raise ValidationError(
-                    f"{preferred_employee.display_name} works at {preferred_employee.work_location.display_name}, "
-                    f"not at {location.display_name}. Please select a different employee or location."
-                )
-        
-        # Validate service is available at selected location
-        if service and location:
-            # Check if service is offered at the selected location through ServiceLocation model
-            from home.models import ServiceLocation
-            if not ServiceLocation.objects.filter(service=service, location=location).exists():
-                available_locations = [sl.location.display_name for sl in service.service_locations.all()]
-                if available_locations:
-                    locations_text = ", ".join(available_locations)
-                    raise ValidationError(
-                        f"{service.display_name} is only available at: {locations_text}. "
-                        f"Please select a different service or location."
-                    )
-                else:
-                    raise ValidationError(
-                        f"{service.display_name} is not available at any locations yet. "
-                        f"Please select a different service."
-                    )
-        
+        validate_booking_choices(
+            cleaned_data.get('location'), cleaned_data.get('service'), cleaned_data.get('preferred_employee'),
+        )
+        return cleaned_data
+
+
+class WaitlistForm(forms.ModelForm):
+    """Joining the waitlist for a location and service over a range of dates"""
+
+    class Meta:
+        model = WaitlistEntry
+        fields = [
+            'customer_first_name',
+            'customer_last_name',
+            'customer_email',
+            'customer_phone',
+            'location',
+            'service',
+            'preferred_employee',
+            'earliest_date',
+            'latest_date',
+        ]
+        widgets = {
+            'earliest_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'latest_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        from home.models import LocationPage, ServicePage, EmployeePage
+
+        self.fields['location'].queryset = LocationPage.objects.live()
+        self.fields['service'].queryset = ServicePage.objects.live()
+        self.fields['preferred_employee'].queryset = EmployeePage.objects.live()
+        self.fields['preferred_employee'].required = False
+
+    def clean_earliest_date(self):
+        from datetime import date
+        earliest_date = self.cleaned_data.get('earliest_date')
+
+        if earliest_date and earliest_date < date.today():
+            raise ValidationError("Please select a future date.")
+
+        return earliest_date
+
+    def clean(self):
+        cleaned_data = super().clean()
+        earliest_date = cleaned_data.get('earliest_date')
+        latest_date = cleaned_data.get('latest_date')
+
+        if earliest_date and latest_date:
+            if latest_date < earliest_date:
+                raise ValidationError("The last date must not be before the first date.")
+            if (latest_date - earliest_date).days >= WaitlistEntry.MAX_DAYS:
+                raise ValidationError(f"Please choose a range of at most {WaitlistEntry.MAX_DAYS} days.")
+
+        validate_booking_choices(
+            cleaned_data.get('location'), cleaned_data.get('service'), cleaned_data.get('preferred_employee'),
+        )
         return cleaned_data
@@ -0,0 +1,83 @@
+import gzip
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from booking.models import ArchivedFormSubmission, FormSubmission
+
+
+class ArchiveJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder rounds times to milliseconds; keep them exact so restores round-trip"""
+
+    def default(self, o):
+        if isinstance(o, (datetime, time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old completed/cancelled booking submissions out of the live table, "
+        "into the archive table or a gzipped JSONL file, in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=365,
+            help="Archive bookings whose appointment date is more than this many days ago",
+        )
+        parser.add_argument(
+            "--status", nargs="+", choices=ArchivedFormSubmission.ARCHIVABLE_STATUSES,
+            default=ArchivedFormSubmission.ARCHIVABLE_STATUSES,
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--to-file", metavar="PATH",
+            help="Append rows to this gzipped JSONL file instead of the archive table",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.localdate() - timedelta(days=options["days"])
+        archivable = ArchivedFormSubmission.archivable(cutoff, options["status"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"{archivable.count()} booking submissions would be archived.")
+            return
+
+        archive_file = gzip.open(options["to_file"], "at") if options["to_file"] else None
+        total = 0
+        try:
+            while True:
+                with transaction.atomic():
+                    batch_ids = list(
+                        archivable.order_by("pk").values_list("pk", flat=True)[:options["batch_size"]]
+                    )
+                    if not batch_ids:
+                        break
+                    rows = list(ArchivedFormSubmission.snapshot_values(
+                        FormSubmission.objects.filter(pk__in=batch_ids)
+                    ))
+                    if archive_file:
+                        for row in rows:
+                            archive_file.write(json.dumps(row, cls=ArchiveJSONEncoder) + "\n")
+                        archive_file.flush()
+                    else:
+                        ArchivedFormSubmission.objects.bulk_create(
+                            [ArchivedFormSubmission(**row) for row in rows]
+                        )
+                    FormSubmission.objects.filter(pk__in=batch_ids).delete()
+                total += len(batch_ids)
+                self.stdout.write(f"Archived {total} booking submissions...")
+        finally:
+            if archive_file:
+                archive_file.close()
+
+        destination = options["to_file"] or "the archive table"
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total} booking submissions dated before {cutoff} to {destination}."
+        ))
@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE booking (
+    id INTEGER PRIMARY KEY,
+    location_id INTEGER NOT NULL,
+    preferred_date TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX booking_location_date ON booking (location_id, preferred_date);
+"""
+
+LOCATIONS = 20
+DAYS = 60
+
+
+def sqlite_mode(options):
+    """Connection setup equivalent to a Django sqlite3 OPTIONS dict"""
+    init_command = options.get("init_command", "")
+    transaction_mode = options.get("transaction_mode")
+    return {
+        "pragmas": [stmt.strip() for stmt in init_command.split(";") if stmt.strip()],
+        # Python's sqlite3 default, which Django uses unless OPTIONS says otherwise
+        "timeout": options.get("timeout", 5.0),
+        "begin": f"BEGIN {transaction_mode}" if transaction_mode else "BEGIN",
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare default and production-tuned SQLite settings under parallel "
+        "readers and booking writers, on a scratch database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per mode")
+        parser.add_argument("--rows", type=int, default=20000, help="Rows seeded before each run")
+
+    def handle(self, *args, **options):
+        modes = {
+            "default": sqlite_mode({}),
+            # The writers stand in for the booking write paths, which begin
+            # IMMEDIATE under the tuned profile (see booking/transactions.py)
+            "tuned": sqlite_mode({**settings.SQLITE_PRODUCTION_OPTIONS, "transaction_mode": "IMMEDIATE"}),
+        }
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, "
+            f"{options['duration']}s per mode\n"
+        )
+        self.stdout.write(
+            f"{'mode':<8} {'reads/s':>9} {'writes/s':>9} {'read p50/p99 ms':>17} "
+            f"{'write p50/p99 ms':>18} {'locked':>7}"
+        )
+        for name, mode in modes.items():
+            with tempfile.TemporaryDirectory() as tmpdir:
+                result = self.run_mode(os.path.join(tmpdir, "bench.sqlite3"), mode, options)
+            self.stdout.write(
+                f"{name:<8} {result['reads'] / options['duration']:>9.0f} "
+                f"{result['writes'] / options['duration']:>9.0f} "
+                f"{self.percentiles(result['read_latencies']):>17} "
+                f"{self.percentiles(result['write_latencies']):>18} "
+                f"{result['errors']:>7}"
+            )
+
+    def percentiles(self, latencies):
+        if len(latencies) < 2:
+            return "-"
+        cuts = statistics.quantiles(latencies, n=100)
+        return f"{cuts[49] * 1000:.1f}/{cuts[98] * 1000:.1f}"
+
+    def connect(self, path, mode):
+        connection = sqlite3.connect(
+            path, timeout=mode["timeout"], isolation_level=None, check_same_thread=False
+        )
+        for pragma in mode["pragmas"]:
+            connection.execute(pragma)
+        return connection
+
+    def run_mode(self, path, mode, options):
+        connection = self.connect(path, mode)
+        connection.executescript(SCHEMA)
+        connection.executemany(
+            "INSERT INTO booking (location_id, preferred_date, customer, status) VALUES (?, ?, ?, ?)",
+            (
+                (i % LOCATIONS, f"2030-01-{i % DAYS // 2 + 1:02d}", f"customer{i}", "pending")
+                for i in range(options["rows"])
+            ),
+        )
+        connection.close()
+
+        result = {"reads": 0, "writes": 0, "errors": 0, "read_latencies": [], "write_latencies": []}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def reader(worker):
+            connection = self.connect(path, mode)
+            latencies, i = [], 0
+            while time.monotonic() < deadline:
+                i += 1
+                start = time.perf_counter()
+                connection.execute(
+                    "SELECT status, COUNT(*) FROM booking WHERE location_id = ? AND preferred_date >= ? "
+                    "GROUP BY status",
+                    ((worker + i) % LOCATIONS, "2030-01-10"),
+                ).fetchall()
+                latencies.append(time.perf_counter() - start)
+            connection.close()
+            with lock:
+                result["reads"] += len(latencies)
+                result["read_latencies"] += latencies
+
+        def writer(worker):
+            # Like a booking: check the slot, then insert, in one transaction
+            connection = self.connect(path, mode)
+            latencies, errors, i = [], 0, 0
+            while time.monotonic() < deadline:
+                i += 1
+                location = (worker + i) % LOCATIONS
+                start = time.perf_counter()
+                try:
+                    connection.execute(mode["begin"])
+                    connection.execute(
+                        "SELECT COUNT(*) FROM booking WHERE location_id = ? AND preferred_date = ?",
+                        (location, "2030-01-15"),
+                    ).fetchone()
+                    connection.execute(
+                        "INSERT INTO booking (location_id, preferred_date, customer, status) "
+                        "VALUES (?, ?, ?, ?)",
+                        (location, "2030-01-15", f"writer{worker}-{i}", "pending"),
+                    )
+                    connection.execute("COMMIT")
+                    latencies.append(time.perf_counter() - start)
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+            connection.close()
+            with lock:
+                result["writes"] += len(latencies)
+                result["write_latencies"] += latencies
+                result["errors"] += errors
+
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(options["readers"])]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(options["writers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return result
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.calendar_feeds import feed_url
+from home.models import EmployeePage, LocationPage
+from home.prerender import get_default_site
+
+
+class Command(BaseCommand):
+    help = (
+        "List the iCalendar feed URL of every employee and location, to "
+        "subscribe to from a calendar app. Anyone with a URL can read its feed."
+    )
+
+    def handle(self, *args, **options):
+        site = get_default_site()
+        if site is None:
+            raise CommandError("No default site is configured.")
+
+        for model in (EmployeePage, LocationPage):
+            for page in model.objects.live().order_by("path"):
+                self.stdout.write(f"{page.display_name}: {site.root_url}{feed_url(page)}")
@@ -0,0 +1,47 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from booking.conflicts import find_overlaps
+from booking.models import FormSubmission
+from home.models import EmployeePage
+
+
+class Command(BaseCommand):
+    help = (
+        "List every pair of bookings that overlap for the same employee, using "
+        "the services' durations (cancelled bookings are ignored)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat, metavar="YYYY-MM-DD")
+        parser.add_argument("--to", dest="date_to", type=date.fromisoformat, metavar="YYYY-MM-DD")
+        parser.add_argument("--employee", type=int, metavar="ID", help="Only this employee's bookings")
+        parser.add_argument("--count", action="store_true", help="Only count the overlapping pairs")
+
+    def handle(self, *args, **options):
+        queryset = FormSubmission.objects.all()
+        if options["date_from"]:
+            queryset = queryset.filter(preferred_date__gte=options["date_from"])
+        if options["date_to"]:
+            queryset = queryset.filter(preferred_date__lte=options["date_to"])
+        if options["employee"]:
+            queryset = queryset.filter(preferred_employee_id=options["employee"])
+
+        start = time.perf_counter()
+        employee_names = {}
+        pairs = 0
+        for overlap in find_overlaps(queryset):
+            pairs += 1
+            if options["count"]:
+                continue
+            if overlap.employee_id not in employee_names:
+                employee = EmployeePage.objects.filter(pk=overlap.employee_id).first()
+                employee_names[overlap.employee_id] = employee.display_name if employee else overlap.employee_id
+            self.stdout.write(
+                f"{employee_names[overlap.employee_id]}  {overlap.date}  "
+                f"#{overlap.first_id} {overlap.first_start:%H:%M}-{overlap.first_end:%H:%M}  "
+                f"#{overlap.second_id} {overlap.second_start:%H:%M}-{overlap.second_end:%H:%M}"
+            )
+        self.stdout.write(f"{pairs} overlapping pairs found in {time.perf_counter() - start:.1f}s")
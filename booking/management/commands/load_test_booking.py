@@ -0,0 +1,123 @@
+import logging
+import statistics
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from home.models import LocationPage, ServicePage
+
+
+class Command(BaseCommand):
+    help = (
+        "Flood the booking submission endpoint with bot traffic while "
+        "legitimate clients load the availability APIs, with throttling off "
+        "and on, and compare the legitimate clients' latency. Runs in-process "
+        "against the configured database; the bots' submissions are invalid, "
+        "so nothing is written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bots", type=int, default=8, help="Threads flooding the submission endpoint")
+        parser.add_argument("--bot-ips", type=int, default=2, help="Addresses the bots send from")
+        parser.add_argument("--clients", type=int, default=4, help="Legitimate client threads")
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per mode")
+
+    def handle(self, *args, **options):
+        location = LocationPage.objects.live().first()
+        service = ServicePage.objects.live().filter(service_locations__location=location).first()
+        if location is None or service is None:
+            raise CommandError("Needs a live location offering a live service.")
+
+        self.stdout.write(
+            f"{options['bots']} bots from {options['bot_ips']} addresses, {options['clients']} clients, "
+            f"{options['duration']}s per mode\n"
+        )
+        self.stdout.write(
+            f"{'throttling':<11} {'client req/s':>12} {'client p50/p99 ms':>18} {'bot req/s':>10} {'bots refused':>13}"
+        )
+        # Each refused request would log a warning
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            for enabled in (False, True):
+                self.run_and_report(enabled, location, service, options)
+        finally:
+            request_logger.setLevel(level)
+
+    def run_and_report(self, enabled, location, service, options):
+        # A fresh key prefix, so earlier runs' buckets (and live ones) don't count
+        alias = settings.BOOKING_THROTTLE_CACHE
+        throttle_cache = {**settings.CACHES[alias], "KEY_PREFIX": f"load-test-{uuid.uuid4().hex}"}
+        with override_settings(BOOKING_THROTTLE_ENABLED=enabled, CACHES={**settings.CACHES, alias: throttle_cache}):
+            result = self.run_mode(location, service, options)
+        duration = options["duration"]
+        self.stdout.write(
+            f"{'on' if enabled else 'off':<11} {len(result['client_latencies']) / duration:>12.0f} "
+            f"{self.percentiles(result['client_latencies']):>18} {result['bot_requests'] / duration:>10.0f} "
+            f"{result['bots_refused']:>13}"
+        )
+
+    def percentiles(self, latencies):
+        if len(latencies) < 2:
+            return "-"
+        cuts = statistics.quantiles(latencies, n=100)
+        return f"{cuts[49] * 1000:.1f}/{cuts[98] * 1000:.1f}"
+
+    def run_mode(self, location, service, options):
+        result = {"client_latencies": [], "bot_requests": 0, "bots_refused": 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+        submit_url = reverse("booking:submit_booking")
+        availability_urls = [
+            (reverse("booking:services_by_location"), {"location_id": location.pk}),
+            (reverse("booking:employees_for_service"), {"location_id": location.pk, "service_id": service.pk}),
+        ]
+
+        def bot(worker):
+            client = Client(REMOTE_ADDR=f"203.0.113.{worker % options['bot_ips'] + 1}")
+            requests, refused = 0, 0
+            while time.monotonic() < deadline:
+                requests += 1
+                # A date in the past never validates, so the flood writes nothing
+                response = client.post(submit_url, {
+                    "customer_first_name": "Bot", "customer_last_name": str(requests),
+                    "customer_email": f"bot{worker}-{requests}@example.com", "customer_phone": "555-0000",
+                    "location": location.pk, "service": service.pk,
+                    "preferred_date": (date.today() - timedelta(days=1)).isoformat(), "preferred_time": "10:00",
+                })
+                refused += response.status_code == 429
+            connections.close_all()
+            with lock:
+                result["bot_requests"] += requests
+                result["bots_refused"] += refused
+
+        def client(worker):
+            # Well inside the availability rate: a request every 0.5s
+            client = Client(REMOTE_ADDR=f"198.51.100.{worker + 1}")
+            latencies, i = [], 0
+            while time.monotonic() < deadline:
+                url, params = availability_urls[i % len(availability_urls)]
+                i += 1
+                start = time.perf_counter()
+                client.get(url, params)
+                latencies.append(time.perf_counter() - start)
+                time.sleep(max(0, 0.5 - (time.perf_counter() - start)))
+            connections.close_all()
+            with lock:
+                result["client_latencies"] += latencies
+
+        threads = [threading.Thread(target=bot, args=(n,)) for n in range(options["bots"])]
+        threads += [threading.Thread(target=client, args=(n,)) for n in range(options["clients"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return result
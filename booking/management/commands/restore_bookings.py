@@ -0,0 +1,66 @@
+import gzip
+import json
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from booking.models import ArchivedFormSubmission
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Restore archived booking submissions into the live table (keeping their ids)"
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument(
+            "--ids", nargs="+", type=int, metavar="ID",
+            help="Original ids of submissions in the archive table",
+        )
+        source.add_argument(
+            "--file", metavar="PATH", help="Gzipped JSONL file written by archive_bookings --to-file",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            restored, skipped = self.restore_file(options["file"], options["batch_size"])
+        else:
+            restored, skipped = self.restore_table(options["ids"], options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Restored {restored} booking submissions."))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {skipped} (already live, or their location/service page no longer exists)."
+            ))
+
+    def restore_table(self, original_ids, batch_size):
+        restored = 0
+        for batch in batched(original_ids, batch_size):
+            with transaction.atomic():
+                restored += len(ArchivedFormSubmission.restore(batch))
+        skipped = ArchivedFormSubmission.objects.filter(original_id__in=original_ids).count()
+        missing = len(set(original_ids)) - restored - skipped
+        if missing:
+            self.stdout.write(self.style.WARNING(f"{missing} ids were not in the archive."))
+        return restored, skipped
+
+    def restore_file(self, path, batch_size):
+        restored = skipped = 0
+        try:
+            with gzip.open(path, "rt") as archive_file:
+                for batch in batched(archive_file, batch_size):
+                    rows = [json.loads(line) for line in batch if line.strip()]
+                    with transaction.atomic():
+                        restored_ids = ArchivedFormSubmission.restore_rows(rows)
+                    restored += len(restored_ids)
+                    skipped += len(rows) - len(restored_ids)
+        except OSError as exc:
+            raise CommandError(f"Could not read {path}: {exc}")
+        return restored, skipped
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from booking.models import AppointmentReminder
+from booking.reminders import due_submissions, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the 24h/2h appointment reminders that are due now. Safe to run "
+        "from several places at once; each reminder is sent once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Reminders per delivery batch")
+        parser.add_argument(
+            "--every", type=int, metavar="SECONDS",
+            help="Keep running, checking for due reminders every SECONDS",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count what is due")
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            now = timezone.now()
+            for kind, label in AppointmentReminder.KIND_CHOICES:
+                due = due_submissions(kind, now).exclude(reminders__kind=kind)
+                self.stdout.write(f"{label}: {due.count()} due")
+            return
+
+        while True:
+            sent, failed = send_due_reminders(batch_size=options["batch_size"])
+            if failed:
+                self.stdout.write(self.style.WARNING(
+                    f"Sent {sent} reminders; {failed} failed and will be retried."
+                ))
+            elif sent or not options["every"]:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} reminders."))
+            if not options["every"]:
+                break
+            time.sleep(options["every"])
@@ -1,4 +1,9 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.http import JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib import messages
@@ -11,6 +16,8 @@ from modelcluster.models import ClusterableModel
 from modelcluster.fields import ParentalKey
 # Import blocks and mixins from home app
 from home.models import HeroMixin, FeaturesGridBlock, CallToActionBlock, TextBlock, ImageGalleryBlock, ServiceChooserBlock, EmployeeChooserBlock, LocationChooserBlock
+from .signals import submissions_bulk_updated
+from .transactions import write_transaction
 
 
 # ============================================================================
@@ -48,11 +55,17 @@ class BookingPage(HeroMixin, Page):
         default="<p>Thank you for your booking request! We'll contact you within 24 hours to confirm your appointment.</p>",
         help_text="Message shown after successful form submission"
     )
+    embed_availability = models.BooleanField(
+        default=True,
+        help_text="Embed which services and employees each location offers in the page, "
+                  "so the booking form dropdowns update without extra requests"
+    )
 
     content_panels = Page.content_panels + [
         MultiFieldPanel(HeroMixin.hero_panels, heading="Hero Section", classname="collapsible"),
         FieldPanel('content'),
         FieldPanel('thank_you_text'),
+        FieldPanel('embed_availability'),
     ]
     
     def serve(self, request, *args, **kwargs):
@@ -64,6 +77,23 @@ class BookingPage(HeroMixin, Page):
 # FORM SUBMISSION MODEL
 # ============================================================================
 
+class PrefixSearchIndex(models.Index):
+    """
+    An expression index that prefix searches (``LIKE 'term%'``) can use. On
+    PostgreSQL it's built with text_pattern_ops, which LIKE can use under any
+    collation, and which still serves equality lookups; other backends get a
+    plain index.
+    """
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        from django.contrib.postgres.indexes import OpClass
+
+        index = self.clone()
+        index.expressions = tuple(OpClass(expression, name='text_pattern_ops') for expression in self.expressions)
+        return super(PrefixSearchIndex, index).create_sql(model, schema_editor, using, **kwargs)
+
+
 class FormSubmission(models.Model):
     """
     Booking form submissions. References page models directly instead of snippets.
@@ -109,7 +139,29 @@ class FormSubmission(models.Model):
         ('completed', 'Completed'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Which statuses a submission may be moved to a given status from
+    STATUS_TRANSITIONS = {
+        'confirmed': ['pending'],
+        'cancelled': ['pending', 'confirmed'],
+        'completed': ['pending', 'confirmed'],
+    }
+    OPEN_STATUSES = ['pending', 'confirmed']
     staff_notes = models.TextField(blank=True, help_text="Internal notes for staff (not visible to customer)")
+
+    # Issued with the booking form, so a resubmitted form returns the booking
+    # it already made instead of making another (see BookingForm.save_once)
+    idempotency_key = models.UUIDField(null=True, blank=True, editable=False)
+    # Set on submissions for the same customer, service and slot as one made
+    # shortly before (e.g. the form filled in again after a network error)
+    possible_duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="An earlier, identical booking by the same customer",
+    )
+    DUPLICATE_WINDOW = timedelta(minutes=30)
     
     # Timestamps
     submitted_at = models.DateTimeField(auto_now_add=True)
@@ -135,6 +187,7 @@ class FormSubmission(models.Model):
         MultiFieldPanel([
             FieldPanel('status'),
             FieldPanel('staff_notes'),
+            FieldPanel('possible_duplicate_of', read_only=True),
         ], heading="Status & Notes"),
     ]
 
@@ -142,6 +195,29 @@ class FormSubmission(models.Model):
         verbose_name = "Booking Submission"
         verbose_name_plural = "Booking Submissions"
         ordering = ['-submitted_at']
+        indexes = [
+            # Admin listing order, optionally filtered by status
+            models.Index(fields=['-submitted_at'], name='booking_sub_submitted_idx'),
+            models.Index(fields=['status', '-submitted_at'], name='booking_sub_status_idx'),
+            # Appointment-time range scans (see starting_between)
+            models.Index(fields=['status', 'preferred_date', 'preferred_time'], name='booking_sub_slot_idx'),
+            # Calendar feed windows and the overlap sweep (see booking/calendar_feeds.py
+            # and booking/conflicts.py)
+            models.Index(
+                fields=['preferred_employee', 'preferred_date', 'preferred_time'],
+                name='booking_sub_employee_day_idx',
+            ),
+            models.Index(fields=['location', 'preferred_date'], name='booking_sub_location_day_idx'),
+            # Prefix search in the admin (see FormSubmissionIndexView)
+            PrefixSearchIndex(Lower('customer_first_name'), name='booking_sub_first_name_idx'),
+            PrefixSearchIndex(Lower('customer_last_name'), name='booking_sub_last_name_idx'),
+            PrefixSearchIndex(Lower('customer_email'), name='booking_sub_email_idx'),
+            PrefixSearchIndex(Lower('customer_phone'), name='booking_sub_phone_idx'),
+        ]
+        constraints = [
+            # Null for submissions not made through the booking form
+            models.UniqueConstraint(fields=['idempotency_key'], name='booking_sub_idempotency_key_unique'),
+        ]
 
     def __str__(self):
         return f"{self.customer_full_name} - {self.service.display_name} at {self.location.display_name}"
@@ -155,4 +231,415 @@ class FormSubmission(models.Model):
         if self.preferred_employee:
             return self.preferred_employee.display_name
         return "Any Available"
-    get_employee_preference.short_description = "Preferred Employee"
\ No newline at end of file
+    get_employee_preference.short_description = "Preferred Employee"
+
+    def get_duplicate_flag(self):
+        if self.possible_duplicate_of_id:
+            return f"Possible duplicate of #{self.possible_duplicate_of_id}"
+        return ""
+    get_duplicate_flag.short_description = "Duplicate?"
+
+    def find_near_duplicate(self, now=None):
+        """
+        The latest submission made within DUPLICATE_WINDOW before ``now`` for
+        the same customer email, service, date and time, if any. Looked up by
+        LOWER(customer_email), so it's a seek on booking_sub_email_idx.
+        """
+        now = now or timezone.now()
+        return (
+            FormSubmission.objects
+            .alias(email_lower=Lower('customer_email'))
+            .filter(
+                email_lower=self.customer_email.lower(),
+                service_id=self.service_id,
+                preferred_date=self.preferred_date,
+                preferred_time=self.preferred_time,
+                submitted_at__gte=now - self.DUPLICATE_WINDOW,
+            )
+            .exclude(pk=self.pk)
+            .order_by('-submitted_at')
+            .first()
+        )
+
+    @staticmethod
+    def starting_between(start, end):
+        """
+        Q for appointments starting within [start, end] (naive local datetimes),
+        written as a range over (preferred_date, preferred_time) so it can use
+        booking_sub_slot_idx.
+        """
+        if start.date() == end.date():
+            return Q(preferred_date=start.date(), preferred_time__gte=start.time(), preferred_time__lte=end.time())
+        return (
+            Q(preferred_date=start.date(), preferred_time__gte=start.time())
+            | Q(preferred_date__gt=start.date(), preferred_date__lt=end.date())
+            | Q(preferred_date=end.date(), preferred_time__lte=end.time())
+        )
+
+    @classmethod
+    def bulk_set_status(cls, submission_ids, status):
+        """
+        Move the given submissions to ``status`` in a single UPDATE, skipping any
+        that can't make that transition. Returns the ids that were changed.
+        """
+        queryset = cls.objects.filter(pk__in=submission_ids, status__in=cls.STATUS_TRANSITIONS[status])
+        return cls._bulk_apply(queryset, status=status)
+
+    @classmethod
+    def bulk_reassign(cls, submission_ids, employee):
+        """
+        Set the preferred employee (None for "any available") on the given open
+        submissions, skipping those at a location the employee doesn't work at.
+        Returns the ids that were changed.
+        """
+        queryset = cls.objects.filter(pk__in=submission_ids, status__in=cls.OPEN_STATUSES)
+        if employee and employee.work_location_id:
+            queryset = queryset.filter(location_id=employee.work_location_id)
+        return cls._bulk_apply(queryset, preferred_employee=employee)
+
+    @classmethod
+    def _bulk_apply(cls, queryset, **changes):
+        # The rows stay locked from the SELECT to the UPDATE, whose WHERE
+        # repeats the queryset's conditions (the statuses a transition starts
+        # from), so a concurrent change can't be reported as ours. (SQLite has
+        # no row locks: there the write lock is taken at BEGIN instead.)
+        with write_transaction():
+            changed_ids = list(queryset.select_for_update().values_list('pk', flat=True))
+            if changed_ids:
+                # update() bypasses auto_now, so maintain updated_at here
+                queryset.filter(pk__in=changed_ids).update(updated_at=timezone.now(), **changes)
+                submissions_bulk_updated.send(sender=cls, submission_ids=changed_ids, changes=changes)
+        return changed_ids
+
+
+# ============================================================================
+# APPOINTMENT REMINDERS
+# ============================================================================
+
+class AppointmentReminder(models.Model):
+    """
+    A reminder sent (or being sent) for a confirmed booking. Creating the row
+    is the claim: the unique (submission, kind) constraint lets only one
+    runner create it, and ``claim_token`` says which runner owns it until
+    ``sent_at`` is set. See booking/reminders.py.
+    """
+    KIND_CHOICES = [
+        ('24h', '24 hours before'),
+        ('2h', '2 hours before'),
+    ]
+    LEAD_TIMES = {
+        '24h': timedelta(hours=24),
+        '2h': timedelta(hours=2),
+    }
+
+    submission = models.ForeignKey(FormSubmission, on_delete=models.CASCADE, related_name='reminders')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    claim_token = models.UUIDField(db_index=True)
+    claimed_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Appointment Reminder"
+        constraints = [
+            models.UniqueConstraint(fields=['submission', 'kind'], name='booking_reminder_unique_kind'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} reminder for submission {self.submission_id}"
+
+# ============================================================================
+# WAITLIST
+# ============================================================================
+
+class WaitlistEntry(models.Model):
+    """
+    A customer waiting for a slot for a service at a location, with a given
+    employee or anyone, on any day from ``earliest_date`` to ``latest_date``.
+    When a booking is cancelled, its slot is offered to the first eligible
+    waiter as a new pending booking (see booking/waitlist.py).
+    """
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('offered', 'Offered a Slot'),
+        ('withdrawn', 'Withdrawn'),
+    ]
+    # Longest date range a customer can wait for (one WaitlistDay row per day)
+    MAX_DAYS = 60
+
+    customer_first_name = models.CharField(max_length=50, help_text="Customer's first name")
+    customer_last_name = models.CharField(max_length=50, help_text="Customer's last name")
+    customer_email = models.EmailField(help_text="Customer's email address")
+    customer_phone = models.CharField(max_length=20, help_text="Customer's phone number")
+
+    location = models.ForeignKey(
+        'home.LocationPage',
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        help_text="Which location?"
+    )
+    service = models.ForeignKey(
+        'home.ServicePage',
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        help_text="Which service?"
+    )
+    preferred_employee = models.ForeignKey(
+        'home.EmployeePage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='waitlist_entries',
+        help_text="Preferred employee (optional - leave blank for any available)"
+    )
+    earliest_date = models.DateField(help_text="First day the customer can come in")
+    latest_date = models.DateField(help_text="Last day the customer can come in")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
+    offered_submission = models.ForeignKey(
+        FormSubmission,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="The pending booking created when a slot was offered"
+    )
+    offered_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    panels = [
+        MultiFieldPanel([
+            FieldPanel('customer_first_name'),
+            FieldPanel('customer_last_name'),
+            FieldPanel('customer_email'),
+            FieldPanel('customer_phone'),
+        ], heading="Customer Information"),
+        MultiFieldPanel([
+            FieldPanel('location'),
+            FieldPanel('service'),
+            FieldPanel('preferred_employee'),
+        ], heading="Booking Details"),
+        MultiFieldPanel([
+            FieldPanel('earliest_date'),
+            FieldPanel('latest_date'),
+        ], heading="Dates"),
+        FieldPanel('status'),
+    ]
+
+    class Meta:
+        verbose_name = "Waitlist Entry"
+        verbose_name_plural = "Waitlist Entries"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='booking_wait_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_full_name} - waiting for {self.service.display_name} at {self.location.display_name}"
+
+    @property
+    def customer_full_name(self):
+        return f"{self.customer_first_name} {self.customer_last_name}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.sync_days()
+
+    def sync_days(self):
+        """Index the entry under each day it can take, for as long as it's waiting"""
+        self.days.all().delete()
+        if self.status != 'waiting' or self.latest_date < self.earliest_date:
+            return
+        WaitlistDay.objects.bulk_create([
+            WaitlistDay(
+                entry=self,
+                location_id=self.location_id,
+                service_id=self.service_id,
+                employee_id=self.preferred_employee_id,
+                date=self.earliest_date + timedelta(days=offset),
+                created_at=self.created_at,
+            )
+            for offset in range(min((self.latest_date - self.earliest_date).days + 1, self.MAX_DAYS))
+        ])
+
+
+class WaitlistDay(models.Model):
+    """
+    One day a waiting WaitlistEntry can take. Rows exist only while the entry
+    is waiting, so finding the first waiter for a freed slot is an index seek
+    on (location, service, date, employee), already in created_at order, whatever
+    the size of the waitlist.
+    """
+    entry = models.ForeignKey(WaitlistEntry, on_delete=models.CASCADE, related_name='days')
+    location = models.ForeignKey('home.LocationPage', on_delete=models.CASCADE, related_name='+')
+    service = models.ForeignKey('home.ServicePage', on_delete=models.CASCADE, related_name='+')
+    # Null for "any available employee"
+    employee = models.ForeignKey('home.EmployeePage', on_delete=models.SET_NULL, null=True, related_name='+')
+    date = models.DateField()
+    # The entry's created_at, so waiters are served first come, first served
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['location', 'service', 'date', 'employee', 'created_at', 'entry'],
+                name='booking_wait_day_match_idx',
+            ),
+        ]
+
+
+# ============================================================================
+# ARCHIVED SUBMISSIONS
+# ============================================================================
+
+class ArchivedFormSubmission(models.Model):
+    """
+    Completed/cancelled booking submissions moved out of FormSubmission by the
+    archive_bookings command, so the live table only holds actionable bookings.
+    Page references are stored as plain ids plus their names at archive time,
+    so archived rows survive the pages being deleted.
+    """
+    # FormSubmission columns copied verbatim between the two tables
+    COPIED_FIELDS = [
+        'customer_first_name', 'customer_last_name', 'customer_email', 'customer_phone',
+        'location_id', 'service_id', 'preferred_employee_id',
+        'preferred_date', 'preferred_time', 'notes', 'status', 'staff_notes',
+        'submitted_at', 'updated_at',
+    ]
+    ARCHIVABLE_STATUSES = ['completed', 'cancelled']
+
+    original_id = models.BigIntegerField(unique=True, help_text="Id of the booking submission")
+
+    customer_first_name = models.CharField(max_length=50)
+    customer_last_name = models.CharField(max_length=50)
+    customer_email = models.EmailField()
+    customer_phone = models.CharField(max_length=20)
+
+    location_id = models.IntegerField()
+    location_name = models.CharField(max_length=255)
+    service_id = models.IntegerField()
+    service_name = models.CharField(max_length=255)
+    preferred_employee_id = models.IntegerField(null=True, blank=True)
+    employee_name = models.CharField(max_length=255, blank=True)
+
+    preferred_date = models.DateField()
+    preferred_time = models.TimeField()
+    notes = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=FormSubmission.STATUS_CHOICES)
+    staff_notes = models.TextField(blank=True)
+
+    submitted_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    panels = [
+        FieldPanel('customer_first_name', read_only=True),
+        FieldPanel('customer_last_name', read_only=True),
+        FieldPanel('customer_email', read_only=True),
+        FieldPanel('customer_phone', read_only=True),
+        FieldPanel('location_name', read_only=True),
+        FieldPanel('service_name', read_only=True),
+        FieldPanel('employee_name', read_only=True),
+        FieldPanel('preferred_date', read_only=True),
+        FieldPanel('preferred_time', read_only=True),
+        FieldPanel('status', read_only=True),
+        FieldPanel('notes', read_only=True),
+        FieldPanel('staff_notes', read_only=True),
+    ]
+
+    class Meta:
+        verbose_name = "Archived Booking"
+        verbose_name_plural = "Archived Bookings"
+        ordering = ['-preferred_date', '-original_id']
+        indexes = [
+            models.Index(fields=['-preferred_date', '-original_id'], name='booking_arch_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_first_name} {self.customer_last_name} - {self.service_name} at {self.location_name}"
+
+    @property
+    def customer_full_name(self):
+        return f"{self.customer_first_name} {self.customer_last_name}"
+
+    @classmethod
+    def archivable(cls, before_date, statuses=None):
+        """Live submissions eligible for archiving: in a terminal status, dated before ``before_date``"""
+        return FormSubmission.objects.filter(
+            preferred_date__lt=before_date,
+            status__in=statuses or cls.ARCHIVABLE_STATUSES,
+        )
+
+    @classmethod
+    def snapshot_values(cls, queryset):
+        """Rows of ``queryset`` (FormSubmissions) as dicts of archive columns"""
+        rows = queryset.order_by('pk').values(
+            'pk', *cls.COPIED_FIELDS,
+            'location__location_name', 'location__title',
+            'service__service_name', 'service__title',
+            'preferred_employee__first_name', 'preferred_employee__last_name',
+        )
+        for row in rows:
+            employee_name = " ".join(filter(None, [
+                row.pop('preferred_employee__first_name'), row.pop('preferred_employee__last_name'),
+            ]))
+            yield {
+                'original_id': row.pop('pk'),
+                'location_name': row.pop('location__location_name') or row.pop('location__title'),
+                'service_name': row.pop('service__service_name') or row.pop('service__title'),
+                'employee_name': employee_name,
+                **{field: row[field] for field in cls.COPIED_FIELDS},
+            }
+
+    @classmethod
+    def restore_rows(cls, rows):
+        """
+        Recreate FormSubmissions (with their original ids) from archive rows.
+        Rows whose location or service page no longer exists, or whose id is
+        already live, are skipped; a preferred employee whose page was deleted
+        is left out ("any available"), as deleting it would have done on the
+        live row. Returns the restored original ids.
+        """
+        from home.models import EmployeePage, LocationPage, ServicePage
+
+        rows = list(rows)
+        location_ids = set(LocationPage.objects.filter(
+            id__in={row['location_id'] for row in rows}).values_list('id', flat=True))
+        service_ids = set(ServicePage.objects.filter(
+            id__in={row['service_id'] for row in rows}).values_list('id', flat=True))
+        employee_ids = set(EmployeePage.objects.filter(
+            id__in={row['preferred_employee_id'] for row in rows}).values_list('id', flat=True))
+        rows = [
+            row if row['preferred_employee_id'] in employee_ids else {**row, 'preferred_employee_id': None}
+            for row in rows
+        ]
+        live_ids = set(FormSubmission.objects.filter(
+            pk__in=[row['original_id'] for row in rows]).values_list('pk', flat=True))
+
+        restorable = [
+            row for row in rows
+            if row['location_id'] in location_ids
+            and row['service_id'] in service_ids
+            and row['original_id'] not in live_ids
+        ]
+        restored = FormSubmission.objects.bulk_create([
+            FormSubmission(pk=row['original_id'], **{field: row[field] for field in cls.COPIED_FIELDS})
+            for row in restorable
+        ])
+        # bulk_create still applies auto_now_add/auto_now; put the original
+        # timestamps back
+        for submission, row in zip(restored, restorable):
+            submission.submitted_at = row['submitted_at']
+            submission.updated_at = row['updated_at']
+        FormSubmission.objects.bulk_update(restored, ['submitted_at', 'updated_at'])
+        return [submission.pk for submission in restored]
+
+    @classmethod
+    def restore(cls, original_ids):
+        """
+        Move the given archived submissions back into FormSubmission.
+        Returns the restored original ids; rows that can't be restored stay archived.
+        """
+        rows = cls.objects.filter(original_id__in=original_ids).values('original_id', *cls.COPIED_FIELDS)
+        restored_ids = cls.restore_rows(rows)
+        cls.objects.filter(original_id__in=restored_ids).delete()
+        return restored_ids
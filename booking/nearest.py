@@ -0,0 +1,144 @@
+"""
+Nearest-location lookup for the booking form.
+
+Live locations with coordinates (and at least one open day) are kept in
+memory in k-d trees: one over every location, and one per service over the
+locations offering it. Points are unit vectors on the sphere, so the
+straight-line (chord) distance the tree works with orders locations exactly
+like the great-circle distance. Finding the k nearest visits O(log n) nodes
+for small k, rather than every location.
+
+Each process builds its index on first use, and rebuilds it after a
+location or service page is published, unpublished or deleted (see
+booking/catalog_index.py).
+"""
+import heapq
+import math
+from itertools import count
+
+from home.models import LocationPage, ServiceLocation
+
+from .catalog_index import CatalogIndex
+
+EARTH_RADIUS_KM = 6371.0088
+
+WEEKDAY_HOURS_FIELDS = [
+    'monday_hours', 'tuesday_hours', 'wednesday_hours', 'thursday_hours',
+    'friday_hours', 'saturday_hours', 'sunday_hours',
+]
+
+
+def to_unit_vector(latitude, longitude):
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class KDTree:
+    """Static 3-d tree over (point, item) pairs"""
+
+    def __init__(self, entries):
+        self.size = len(entries)
+        self.root = self._build(list(entries), depth=0)
+
+    def _build(self, entries, depth):
+        if not entries:
+            return None
+        axis = depth % 3
+        entries.sort(key=lambda entry: entry[0][axis])
+        middle = len(entries) // 2
+        return (
+            entries[middle],
+            axis,
+            self._build(entries[:middle], depth + 1),
+            self._build(entries[middle + 1:], depth + 1),
+        )
+
+    def nearest(self, point, k):
+        """The ``k`` (squared distance, item) pairs nearest ``point``, closest first"""
+        # Max-heap (by negated distance) of the best k so far; the counter
+        # breaks ties so items are never compared
+        best = []
+        tiebreak = count()
+
+        def visit(node):
+            if node is None:
+                return
+            (node_point, item), axis, left, right = node
+            distance = sum((a - b) ** 2 for a, b in zip(point, node_point))
+            if len(best) < k:
+                heapq.heappush(best, (-distance, next(tiebreak), item))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, next(tiebreak), item))
+
+            offset = point[axis] - node_point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            visit(near)
+            # The far side can only hold closer points if the splitting plane is closer
+            if len(best) < k or offset * offset < -best[0][0]:
+                visit(far)
+
+        if k > 0:
+            visit(self.root)
+        return [(-negated, item) for negated, _, item in sorted(best, key=lambda entry: (-entry[0], entry[1]))]
+
+
+class LocationIndex:
+    def __init__(self, locations, service_ids_by_location):
+        entries = [(to_unit_vector(location['latitude'], location['longitude']), location) for location in locations]
+        self.all_locations = KDTree(entries)
+        entries_by_service = {}
+        for point, location in entries:
+            for service_id in service_ids_by_location.get(location['id'], ()):
+                entries_by_service.setdefault(service_id, []).append((point, location))
+        self.by_service = {service_id: KDTree(service_entries) for service_id, service_entries in entries_by_service.items()}
+
+    def nearest(self, latitude, longitude, k, service_id=None):
+        """[(distance in km, location data)] for the ``k`` nearest locations"""
+        tree = self.all_locations if service_id is None else self.by_service.get(service_id)
+        if tree is None:
+            return []
+        point = to_unit_vector(latitude, longitude)
+        return [(chord_to_km(math.sqrt(distance)), location) for distance, location in tree.nearest(point, k)]
+
+
+def build_index():
+    locations = []
+    pages = LocationPage.objects.live().filter(latitude__isnull=False, longitude__isnull=False).order_by('path')
+    for page in pages:
+        if all(getattr(page, field) == 'Closed' for field in WEEKDAY_HOURS_FIELDS):
+            continue
+        locations.append({
+            'id': page.id,
+            'name': page.display_name,
+            'address': page.address,
+            'phone': page.phone,
+            'latitude': float(page.latitude),
+            'longitude': float(page.longitude),
+        })
+
+    service_ids_by_location = {}
+    service_locations = ServiceLocation.objects.filter(
+        location_id__in=[location['id'] for location in locations], service__live=True,
+    ).values_list('location_id', 'service_id')
+    for location_id, service_id in service_locations:
+        service_ids_by_location.setdefault(location_id, set()).add(service_id)
+    return LocationIndex(locations, service_ids_by_location)
+
+
+_index = CatalogIndex('nearest', build_index)
+
+
+def get_index():
+    return _index.get()
+
+
+def invalidate_index():
+    _index.invalidate()
+
+
+def nearest_locations(latitude, longitude, k=5, service_id=None):
+    return get_index().nearest(latitude, longitude, k, service_id)
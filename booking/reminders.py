@@ -0,0 +1,149 @@
+"""
+Appointment reminders, sent 24h and 2h before each confirmed booking.
+
+Each run (``manage.py send_reminders``, e.g. every minute from cron) only
+looks at appointments whose reminder fell due within the last
+REMINDER_GRACE, through a range query on (status, preferred_date,
+preferred_time). A reminder is claimed by inserting its AppointmentReminder
+row; the unique constraint means concurrent runners can't both claim it, so
+nothing is sent twice. Claimed reminders go to the delivery backend
+(BOOKING_REMINDER_BACKEND) in batches.
+"""
+import logging
+import uuid
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import AppointmentReminder, FormSubmission
+
+logger = logging.getLogger(__name__)
+
+# How late a reminder may still go out, e.g. after the runner was down
+REMINDER_GRACE = timedelta(hours=1)
+# Claims still unsent after this long belong to a runner that died; take them over
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def due_window(kind, now):
+    """Appointment start times (naive, local) whose ``kind`` reminder is due at ``now``"""
+    due_at = timezone.localtime(now).replace(tzinfo=None) + AppointmentReminder.LEAD_TIMES[kind]
+    return due_at - REMINDER_GRACE, due_at
+
+
+def due_submissions(kind, now):
+    start, end = due_window(kind, now)
+    return FormSubmission.objects.filter(FormSubmission.starting_between(start, end), status='confirmed')
+
+
+def claim_due_reminders(kind, now, claim_token):
+    """Claim the ``kind`` reminders due at ``now`` for ``claim_token``"""
+    due = due_submissions(kind, now)
+    unclaimed_ids = due.exclude(reminders__kind=kind).order_by().values_list('pk', flat=True)
+    AppointmentReminder.objects.bulk_create(
+        [
+            AppointmentReminder(submission_id=pk, kind=kind, claim_token=claim_token, claimed_at=now)
+            for pk in unclaimed_ids
+        ],
+        ignore_conflicts=True,
+    )
+    AppointmentReminder.objects.filter(
+        kind=kind, submission__in=due, sent_at__isnull=True, claimed_at__lt=now - CLAIM_TIMEOUT,
+    ).update(claim_token=claim_token, claimed_at=now)
+
+
+def send_due_reminders(now=None, batch_size=100):
+    """Claim and send every reminder due now. Returns (sent, failed) counts."""
+    now = now or timezone.now()
+    claim_token = uuid.uuid4()
+    for kind in AppointmentReminder.LEAD_TIMES:
+        claim_due_reminders(kind, now, claim_token)
+
+    claimed = iter(
+        AppointmentReminder.objects
+        .filter(claim_token=claim_token, sent_at__isnull=True, submission__status='confirmed')
+        .select_related('submission__location', 'submission__service', 'submission__preferred_employee')
+        .order_by('submission__preferred_date', 'submission__preferred_time', 'pk')
+    )
+    backend = get_backend()
+    sent = failed = 0
+    while batch := list(islice(claimed, batch_size)):
+        batch_ids = [reminder.pk for reminder in batch]
+        try:
+            backend.send(batch)
+        except Exception:
+            logger.exception("Sending %d reminders failed; releasing them for the next run", len(batch))
+            AppointmentReminder.objects.filter(pk__in=batch_ids, claim_token=claim_token).delete()
+            failed += len(batch)
+        else:
+            AppointmentReminder.objects.filter(pk__in=batch_ids).update(sent_at=timezone.now())
+            sent += len(batch)
+    return sent, failed
+
+
+# ============================================================================
+# DELIVERY BACKENDS
+# ============================================================================
+
+class BaseReminderBackend:
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, reminders):
+        """Deliver a batch of AppointmentReminders; raise if the batch failed"""
+        raise NotImplementedError
+
+
+class EmailReminderBackend(BaseReminderBackend):
+    """Emails the customer through Django's EMAIL_BACKEND, one connection per batch"""
+
+    def send(self, reminders):
+        messages = []
+        for reminder in reminders:
+            context = {'reminder': reminder, 'submission': reminder.submission}
+            subject = render_to_string('booking/emails/reminder_subject.txt', context).strip()
+            body = render_to_string('booking/emails/reminder.txt', context)
+            messages.append(EmailMessage(
+                subject, body, self.options.get('FROM_EMAIL', settings.DEFAULT_FROM_EMAIL),
+                [reminder.submission.customer_email],
+            ))
+        with get_connection(fail_silently=False) as connection:
+            connection.send_messages(messages)
+
+
+class LocalReminderBackend(BaseReminderBackend):
+    """Keeps reminders in ``outbox`` instead of delivering them; for development and tests"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.outbox = []
+
+    def send(self, reminders):
+        self.outbox.extend(reminders)
+        for reminder in reminders:
+            logger.info("Reminder: %s", reminder)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        config = settings.BOOKING_REMINDER_BACKEND
+        _backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    global _backend
+    if setting == 'BOOKING_REMINDER_BACKEND':
+        _backend = None
@@ -0,0 +1,106 @@
+"""
+Admin reports for bookings (registered in booking/wagtail_hooks.py).
+"""
+import datetime
+from collections import namedtuple
+
+import django_filters
+from django.urls import reverse
+from wagtail.admin.filters import DateRangePickerWidget, WagtailFilterSet
+from wagtail.admin.ui.tables import Column, DateColumn, TitleColumn
+from wagtail.admin.views.reports import ReportView
+from wagtail.permission_policies import ModelPermissionPolicy
+
+from home.models import EmployeePage, LocationPage
+
+from .conflicts import find_overlaps
+from .models import FormSubmission
+
+ConflictRow = namedtuple('ConflictRow', [
+    'employee', 'date', 'first', 'first_times', 'second', 'second_times',
+])
+
+
+def submission_edit_url(submission):
+    return reverse('wagtailsnippets_booking_formsubmission:edit', args=[submission.pk])
+
+
+class BookingConflictsFilterSet(WagtailFilterSet):
+    preferred_date = django_filters.DateFromToRangeFilter(label="Date", widget=DateRangePickerWidget)
+    location = django_filters.ModelChoiceFilter(queryset=LocationPage.objects.live())
+    preferred_employee = django_filters.ModelChoiceFilter(
+        label="Employee", queryset=EmployeePage.objects.live(),
+    )
+
+    class Meta:
+        model = FormSubmission
+        fields = ['preferred_date', 'location', 'preferred_employee']
+
+
+class BookingConflictsView(ReportView):
+    """
+    Pairs of bookings that overlap for the same employee (see
+    booking/conflicts.py). Only the bookings on the current page of results
+    are loaded.
+    """
+    page_title = "Booking conflicts"
+    header_icon = "warning"
+    filterset_class = BookingConflictsFilterSet
+    index_url_name = 'booking_conflicts'
+    index_results_url_name = 'booking_conflicts_results'
+    permission_policy = ModelPermissionPolicy(FormSubmission)
+    permission_required = 'change'
+    no_results_message = "No overlapping bookings found."
+    columns = [
+        Column('employee', label="Employee"),
+        DateColumn('date', label="Date"),
+        TitleColumn('first', label="Booking", get_url=lambda row: submission_edit_url(row.first)),
+        Column('first_times', label="Time"),
+        TitleColumn('second', label="Overlaps with", get_url=lambda row: submission_edit_url(row.second)),
+        Column('second_times', label="Time"),
+    ]
+    list_export = ['employee', 'date', 'first', 'first_times', 'second', 'second_times']
+    export_headings = {
+        'first': "Booking",
+        'first_times': "Time",
+        'second': "Overlaps with",
+        'second_times': "Overlapping time",
+    }
+
+    def get_filename(self):
+        return f"booking-conflicts-{datetime.date.today():%Y-%m-%d}"
+
+    def get_queryset(self):
+        return FormSubmission.objects.all()
+
+    def get_filtered_queryset(self):
+        # The overlaps are computed in one pass; pagination then slices the list
+        return list(find_overlaps(super().get_filtered_queryset()))
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        page.object_list = self.load_rows(object_list)
+        return paginator, page, page.object_list, is_paginated
+
+    def as_spreadsheet(self, queryset, spreadsheet_format):
+        # Exports aren't paginated
+        return super().as_spreadsheet(self.load_rows(queryset), spreadsheet_format)
+
+    def load_rows(self, object_list):
+        """Table rows for a page of overlaps, with their bookings and employees"""
+        object_list = list(object_list)
+        submission_ids = {pk for overlap in object_list for pk in (overlap.first_id, overlap.second_id)}
+        employee_ids = {overlap.employee_id for overlap in object_list}
+        submissions = FormSubmission.objects.select_related('service', 'location').in_bulk(submission_ids)
+        employees = EmployeePage.objects.in_bulk(employee_ids)
+        return [
+            ConflictRow(
+                employees.get(overlap.employee_id),
+                overlap.date,
+                submissions[overlap.first_id],
+                f"{overlap.first_start:%H:%M}-{overlap.first_end:%H:%M}",
+                submissions[overlap.second_id],
+                f"{overlap.second_start:%H:%M}-{overlap.second_end:%H:%M}",
+            )
+            for overlap in object_list
+        ]
@@ -0,0 +1,8 @@
+from django.dispatch import Signal
+
+# Sent once after a set-based change to many booking submissions (e.g. the
+# admin bulk actions), rather than a post_save per row, so receivers can
+# handle the whole batch at once.
+# Arguments: sender (FormSubmission), submission_ids, changes (dict of the
+# fields that were set)
+submissions_bulk_updated = Signal()
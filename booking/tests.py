@@ -1,3 +1,1253 @@
-from django.test import TestCase
+import os
+import random
+import tempfile
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from booking import eligibility, nearest
+from booking.availability import get_availability_map
+from booking.calendar_feeds import feed_url
+from booking.checks import check_throttle_ip_header
+from booking.conflicts import find_overlaps, sweep
+from booking.forms import BookingForm
+from booking.models import AppointmentReminder, ArchivedFormSubmission, BookingPage, FormSubmission, WaitlistEntry
+from booking.reminders import claim_due_reminders, get_backend, send_due_reminders
+from booking.signals import submissions_bulk_updated
+from booking.throttling import EXEMPT_ENVIRON_KEY, take_tokens
+from booking.transactions import write_transaction
+from booking.waitlist import find_waiter
+from home.catalog_import import import_catalog
+from beauty_salon.db_routing import PrimaryReplicaRouter, replica_reads
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.cache import cache, caches
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection, models, transaction
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from home.models import (
+    EmployeePage,
+    EmployeeSkill,
+    EmployeesPage,
+    HomePage,
+    LocationPage,
+    LocationsPage,
+    ServiceLocation,
+    ServicePage,
+    ServicesPage,
+)
+
+from wagtail.models import Page, Site
+from wagtail.test.utils import WagtailPageTestCase
+
+
+# Rate limit buckets in memory rather than in the file cache under
+# BASE_DIR/cache, so test runs neither leave nor find buckets there
+@override_settings(CACHES={
+    **settings.CACHES,
+    "throttle": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "throttle-tests"},
+})
+class BookingTestCase(WagtailPageTestCase):
+    """
+    Builds a small salon page tree: one location offering one service,
+    with one employee working there, plus a booking page.
+    """
+
+    def setUp(self):
+        cache.clear()
+        caches["throttle"].clear()
+        # Each test's rollback takes the catalog version back with it, so the
+        # indexes an earlier test built would look current
+        nearest.invalidate_index()
+        eligibility.invalidate_index()
+        root_page = Page.objects.get(pk=1)
+        self.homepage = HomePage(title="Home")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.update(root_page=self.homepage)
+
+        self.locations_page = LocationsPage(title="Locations")
+        self.homepage.add_child(instance=self.locations_page)
+        self.location = LocationPage(
+            title="Downtown", location_name="Downtown Salon", address="1 Main St"
+        )
+        self.locations_page.add_child(instance=self.location)
+
+        self.services_page = ServicesPage(title="Services")
+        self.homepage.add_child(instance=self.services_page)
+        self.service = ServicePage(
+            title="Haircut",
+            service_name="Haircut",
+            price=Decimal("45.00"),
+            duration_minutes=60,
+            service_category="hair",
+        )
+        self.service.service_locations.add(ServiceLocation(location=self.location))
+        self.services_page.add_child(instance=self.service)
+
+        self.employees_page = EmployeesPage(title="Team")
+        self.homepage.add_child(instance=self.employees_page)
+        self.employee = EmployeePage(
+            title="Anna",
+            first_name="Anna",
+            last_name="Smith",
+            job_title="Stylist",
+            work_location=self.location,
+        )
+        self.employees_page.add_child(instance=self.employee)
+
+        self.booking_page = BookingPage(title="Book", slug="book")
+        self.homepage.add_child(instance=self.booking_page)
+
+
+class AvailabilityApiTests(BookingTestCase):
+    """
+    Tests for the (async) services/employees by location endpoints.
+    """
+
+    def test_services_by_location(self):
+        response = self.client.get(
+            reverse("booking:services_by_location"), {"location_id": self.location.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        services = response.json()["services"]
+        self.assertEqual([s["id"] for s in services], [self.service.id])
+        self.assertEqual(services[0]["price"], "$45.00")
+        self.assertEqual(services[0]["duration"], "1h")
+
+    def test_employees_by_location(self):
+        response = self.client.get(
+            reverse("booking:employees_by_location"), {"location_id": self.location.id}
+        )
+        self.assertEqual(
+            response.json()["employees"],
+            [{"id": self.employee.id, "name": "Anna Smith", "job_title": "Stylist"}],
+        )
+
+    def test_unknown_location_returns_empty(self):
+        response = self.client.get(
+            reverse("booking:services_by_location"), {"location_id": 999999}
+        )
+        self.assertEqual(response.json(), {"services": []})
+
+    async def test_async_client(self):
+        response = await AsyncClient().get(
+            reverse("booking:employees_by_location"), {"location_id": self.location.id}
+        )
+        self.assertEqual(len(response.json()["employees"]), 1)
+
+
+class SubmitBookingApiTests(BookingTestCase):
+    """
+    Tests for the JSON booking submission endpoint.
+    """
+
+    def booking_data(self, **overrides):
+        data = {
+            "customer_first_name": "Jane",
+            "customer_last_name": "Doe",
+            "customer_email": "jane@example.com",
+            "customer_phone": "555-1234",
+            "location": self.location.id,
+            "service": self.service.id,
+            "preferred_employee": self.employee.id,
+            "preferred_date": (date.today() + timedelta(days=7)).isoformat(),
+            "preferred_time": "14:30",
+        }
+        data.update(overrides)
+        return data
+
+    def test_valid_submission_returns_confirmation(self):
+        response = self.client.post(reverse("booking:submit_booking"), self.booking_data())
+        self.assertEqual(response.status_code, 201)
+        booking = response.json()["booking"]
+        submission = FormSubmission.objects.get()
+        self.assertEqual(booking["id"], submission.id)
+        self.assertEqual(booking["service"], "Haircut")
+        self.assertEqual(booking["time"], "14:30")
+        self.assertNotIn("sessionid", response.cookies)
+
+    def test_invalid_submission_returns_field_errors(self):
+        response = self.client.post(
+            reverse("booking:submit_booking"),
+            self.booking_data(customer_email="not-an-email", preferred_date="2000-01-01"),
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertIn("customer_email", errors)
+        self.assertEqual(errors["preferred_date"][0]["message"], "Please select a future date.")
+        self.assertFalse(FormSubmission.objects.exists())
+
+    def test_get_not_allowed(self):
+        response = self.client.get(reverse("booking:submit_booking"))
+        self.assertEqual(response.status_code, 405)
+
+
+class EmbeddedAvailabilityTests(BookingTestCase):
+    """
+    Tests for the availability map embedded in the booking page.
+    """
+
+    def test_booking_page_embeds_availability(self):
+        response = self.client.get(self.booking_page.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="booking-availability"')
+        location_data = response.context["availability_data"][self.location.id]
+        self.assertEqual([s["id"] for s in location_data["services"]], [self.service.id])
+        self.assertEqual([e["id"] for e in location_data["employees"]], [self.employee.id])
+
+    def test_embedding_can_be_disabled(self):
+        self.booking_page.embed_availability = False
+        self.booking_page.save()
+        response = self.client.get(self.booking_page.url)
+        self.assertNotContains(response, 'id="booking-availability"')
+
+    def test_map_is_cached_until_catalog_publish(self):
+        get_availability_map()
+        with self.assertNumQueries(1):
+            get_availability_map()
+
+        self.employee.unpublish()
+        self.assertEqual(get_availability_map()[self.location.id]["employees"], [])
+
+
+@override_settings(READ_REPLICA_ALIAS="replica")
+class ReplicaRoutingTests(BookingTestCase):
+    """
+    Tests for read-replica routing, using separate default and replica test
+    databases. The page tree only exists on the primary, so anything read
+    from the replica comes back empty.
+    """
+    databases = {"default", "replica"}
+
+    def test_router_sends_reads_to_replica_until_a_write(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(ServicePage), "default")
+        with replica_reads():
+            self.assertEqual(router.db_for_read(ServicePage), "replica")
+            self.assertEqual(router.db_for_read(FormSubmission), "default")
+            self.assertEqual(router.db_for_write(FormSubmission), "default")
+            self.assertEqual(router.db_for_read(ServicePage), "default")
+
+    def test_api_get_reads_from_replica(self):
+        response = self.client.get(
+            reverse("booking:employees_by_location"), {"location_id": self.location.id}
+        )
+        self.assertEqual(response.json(), {"employees": []})
+
+    def test_booking_post_uses_primary(self):
+        response = self.client.post(reverse("booking:submit_booking"), {
+            "customer_first_name": "Jane",
+            "customer_last_name": "Doe",
+            "customer_email": "jane@example.com",
+            "customer_phone": "555-1234",
+            "location": self.location.id,
+            "service": self.service.id,
+            "preferred_date": (date.today() + timedelta(days=7)).isoformat(),
+            "preferred_time": "14:30",
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(FormSubmission.objects.using("default").count(), 1)
+        self.assertEqual(FormSubmission.objects.using("replica").count(), 0)
+
+
+class SQLiteBenchmarkTests(SimpleTestCase):
+    """
+    Smoke test for the SQLite concurrency benchmark command. Its numbers
+    depend on the machine, so only the report's shape is checked.
+    """
+
+    def test_benchmark_compares_both_modes(self):
+        out = StringIO()
+        call_command(
+            "benchmark_sqlite", readers=1, writers=2, duration=0.2, rows=100, stdout=out
+        )
+        rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[2:]}
+        self.assertEqual(set(rows), {"default", "tuned"})
+        for row in rows.values():
+            self.assertGreaterEqual(int(row[-1]), 0)
+        self.assertGreater(float(rows["tuned"][2]), 0)
+
+
+class WriteTransactionTests(TransactionTestCase):
+    """
+    Tests for the IMMEDIATE transactions of the booking write paths.
+    """
+
+    def begin_statements(self, atomic):
+        with CaptureQueriesContext(connection) as queries:
+            with atomic():
+                FormSubmission.objects.exists()
+        return [q["sql"] for q in queries.captured_queries if q["sql"].startswith("BEGIN")]
+
+    def test_only_write_transactions_take_the_lock_up_front(self):
+        self.assertEqual(self.begin_statements(write_transaction), ["BEGIN IMMEDIATE"])
+        self.assertEqual(self.begin_statements(transaction.atomic), ["BEGIN"])
+
+
+class FormSubmissionAdminTests(BookingTestCase):
+    """
+    Tests for the booking submissions snippet listing.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        for first, last, email in [
+            ("Jane", "Doe", "jane@example.com"),
+            ("John", "Smith", "jsmith@example.com"),
+            ("Mary", "Goldsmith", "mary@example.com"),
+        ]:
+            FormSubmission.objects.create(
+                customer_first_name=first,
+                customer_last_name=last,
+                customer_email=email,
+                customer_phone="555-1234",
+                location=self.location,
+                service=self.service,
+                preferred_date=date.today(),
+                preferred_time="10:00",
+            )
+        self.url = reverse("wagtailsnippets_booking_formsubmission:list")
+
+    def listed_names(self, response):
+        return sorted(s.customer_last_name for s in response.context["object_list"])
+
+    def test_search_matches_prefixes_case_insensitively(self):
+        response = self.client.get(self.url, {"q": "SMI"})
+        self.assertEqual(self.listed_names(response), ["Smith"])
+
+    def test_search_requires_every_word(self):
+        response = self.client.get(self.url, {"q": "ja doe"})
+        self.assertEqual(self.listed_names(response), ["Doe"])
+
+    def test_search_only_matches_the_start_of_words(self):
+        response = self.client.get(self.url, {"q": "smith"})
+        self.assertEqual(self.listed_names(response), ["Smith"])
+        self.assertContains(response, "Search by first letters")
+
+    def test_search_uses_like_on_other_databases(self):
+        with mock.patch.object(connection, "vendor", "postgresql"), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"q": "SMI"})
+        self.assertEqual(self.listed_names(response), ["Smith"])
+        self.assertTrue(any("LIKE" in q["sql"] for q in queries.captured_queries))
+
+    def test_search_indexes_use_pattern_ops_on_postgresql(self):
+        index = next(index for index in FormSubmission._meta.indexes if index.name == "booking_sub_email_idx")
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = "postgresql"
+        with mock.patch.object(models.Index, "create_sql", autospec=True) as create_sql:
+            index.create_sql(FormSubmission, schema_editor)
+        expression = create_sql.call_args[0][0].expressions[0]
+        self.assertEqual(expression.extra["name"], "text_pattern_ops")
+
+    def listing_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        return len(queries)
+
+    def test_listing_query_count_does_not_grow_with_rows(self):
+        self.client.get(self.url)
+        before = self.listing_queries()
+        FormSubmission.objects.bulk_create([
+            FormSubmission(
+                customer_first_name="Extra", customer_last_name=str(i),
+                customer_email="extra@example.com", customer_phone="1",
+                location=self.location, service=self.service,
+                preferred_date=date.today(), preferred_time="11:00",
+            )
+            for i in range(10)
+        ])
+        self.assertEqual(self.listing_queries(), before)
+
+
+class BulkStatusActionTests(BookingTestCase):
+    """
+    Tests for the booking submission bulk actions.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.submissions = [
+            FormSubmission.objects.create(
+                customer_first_name="Jane",
+                customer_last_name=str(i),
+                customer_email="jane@example.com",
+                customer_phone="555-1234",
+                location=self.location,
+                service=self.service,
+                preferred_date=date.today(),
+                preferred_time="10:00",
+                status=status,
+            )
+            for i, status in enumerate(["pending", "pending", "cancelled"])
+        ]
+        FormSubmission.objects.update(updated_at=timezone.now() - timedelta(days=1))
+
+    def bulk_url(self, action):
+        ids = "&".join(f"id={s.pk}" for s in self.submissions)
+        url = reverse("wagtail_bulk_action", args=("booking", "formsubmission", action))
+        return f"{url}?{ids}"
+
+    def test_confirmation_page(self):
+        response = self.client.get(self.bulk_url("confirm"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Confirm these booking requests?")
+
+    def test_confirm_is_one_update_with_batched_signal(self):
+        received = []
+
+        def receiver(sender, submission_ids, changes, **kwargs):
+            received.append((sorted(submission_ids), changes))
+
+        submissions_bulk_updated.connect(receiver)
+        self.addCleanup(submissions_bulk_updated.disconnect, receiver)
+
+        response = self.client.post(self.bulk_url("confirm"), follow=True)
+        self.assertContains(response, "2 booking submission(s) confirmed. 1 skipped")
+        pending_ids = sorted(s.pk for s in self.submissions[:2])
+        self.assertEqual(received, [(pending_ids, {"status": "confirmed"})])
+
+        statuses = dict(FormSubmission.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[self.submissions[2].pk], "cancelled")
+        confirmed = FormSubmission.objects.filter(status="confirmed")
+        self.assertEqual(confirmed.count(), 2)
+        self.assertTrue(all(s.updated_at.date() == date.today() for s in confirmed))
+
+    def test_reassign_employee(self):
+        self.client.post(self.bulk_url("reassign_employee"), {"employee": self.employee.pk})
+        self.assertEqual(
+            FormSubmission.objects.filter(preferred_employee=self.employee).count(), 2
+        )
+
+
+class ArchiveBookingsTests(BookingTestCase):
+    """
+    Tests for the archive_bookings / restore_bookings commands.
+    """
+
+    def setUp(self):
+        super().setUp()
+        old = date.today() - timedelta(days=400)
+        self.old_completed = self.create_submission(old, "completed")
+        self.old_cancelled = self.create_submission(old, "cancelled")
+        self.old_pending = self.create_submission(old, "pending")
+        self.recent_completed = self.create_submission(date.today() - timedelta(days=10), "completed")
+        self.submitted_at = timezone.now() - timedelta(days=420)
+        FormSubmission.objects.update(submitted_at=self.submitted_at, updated_at=self.submitted_at)
+
+    def create_submission(self, preferred_date, status):
+        return FormSubmission.objects.create(
+            customer_first_name="Jane",
+            customer_last_name=status,
+            customer_email="jane@example.com",
+            customer_phone="555-1234",
+            location=self.location,
+            service=self.service,
+            preferred_employee=self.employee,
+            preferred_date=preferred_date,
+            preferred_time="10:00",
+            status=status,
+        )
+
+    def archive(self, *args):
+        call_command("archive_bookings", *args, stdout=StringIO())
+
+    def test_archive_moves_old_terminal_bookings(self):
+        self.archive()
+        archived_ids = {self.old_completed.pk, self.old_cancelled.pk}
+        self.assertEqual(
+            set(ArchivedFormSubmission.objects.values_list("original_id", flat=True)), archived_ids
+        )
+        self.assertEqual(
+            set(FormSubmission.objects.values_list("pk", flat=True)),
+            {self.old_pending.pk, self.recent_completed.pk},
+        )
+        archived = ArchivedFormSubmission.objects.get(original_id=self.old_completed.pk)
+        self.assertEqual(archived.location_name, "Downtown Salon")
+        self.assertEqual(archived.service_name, "Haircut")
+        self.assertEqual(archived.employee_name, "Anna Smith")
+
+    def test_dry_run_changes_nothing(self):
+        self.archive("--dry-run")
+        self.assertEqual(FormSubmission.objects.count(), 4)
+        self.assertFalse(ArchivedFormSubmission.objects.exists())
+
+    def test_restore_from_table_keeps_ids_and_timestamps(self):
+        self.archive()
+        call_command("restore_bookings", "--ids", str(self.old_completed.pk), stdout=StringIO())
+
+        restored = FormSubmission.objects.get(pk=self.old_completed.pk)
+        self.assertEqual(restored.status, "completed")
+        self.assertEqual(restored.submitted_at, self.submitted_at)
+        self.assertEqual(restored.updated_at, self.submitted_at)
+        self.assertEqual(
+            list(ArchivedFormSubmission.objects.values_list("original_id", flat=True)),
+            [self.old_cancelled.pk],
+        )
+
+    def test_restore_without_deleted_employee(self):
+        self.archive()
+        self.employee.delete()
+        call_command("restore_bookings", "--ids", str(self.old_completed.pk), stdout=StringIO())
+
+        restored = FormSubmission.objects.get(pk=self.old_completed.pk)
+        self.assertIsNone(restored.preferred_employee_id)
+        self.assertFalse(ArchivedFormSubmission.objects.filter(original_id=self.old_completed.pk).exists())
+
+    def test_archive_to_file_and_restore(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "bookings.jsonl.gz")
+            self.archive("--to-file", path)
+            self.assertFalse(ArchivedFormSubmission.objects.exists())
+            self.assertEqual(FormSubmission.objects.count(), 2)
+
+            call_command("restore_bookings", "--file", path, stdout=StringIO())
+
+        self.assertEqual(FormSubmission.objects.count(), 4)
+        restored = FormSubmission.objects.get(pk=self.old_cancelled.pk)
+        self.assertEqual(restored.status, "cancelled")
+        self.assertEqual(restored.submitted_at, self.submitted_at)
+
+    def test_restore_bulk_action(self):
+        self.login()
+        self.archive()
+        archived = ArchivedFormSubmission.objects.get(original_id=self.old_cancelled.pk)
+        url = reverse("wagtail_bulk_action", args=("booking", "archivedformsubmission", "restore"))
+        listing_url = reverse("wagtailsnippets_booking_archivedformsubmission:list")
+        response = self.client.post(f"{url}?id={archived.pk}&next={listing_url}", follow=True)
+
+        self.assertContains(response, "1 archived booking(s) restored.")
+        self.assertTrue(FormSubmission.objects.filter(pk=self.old_cancelled.pk).exists())
+        self.assertFalse(ArchivedFormSubmission.objects.filter(pk=archived.pk).exists())
+
+    def test_restore_bulk_action_needs_delete_permission_on_the_archive(self):
+        user = self.create_user("editor")
+        user.user_permissions.add(
+            Permission.objects.get(content_type__app_label="wagtailadmin", codename="access_admin"),
+            Permission.objects.get(content_type__app_label="booking", codename="add_formsubmission"),
+            Permission.objects.get(content_type__app_label="booking", codename="view_archivedformsubmission"),
+        )
+        self.client.force_login(user)
+        self.archive()
+        archived = ArchivedFormSubmission.objects.get(original_id=self.old_cancelled.pk)
+        url = reverse("wagtail_bulk_action", args=("booking", "archivedformsubmission", "restore"))
+        self.client.post(f"{url}?id={archived.pk}")
+        self.assertTrue(ArchivedFormSubmission.objects.filter(pk=archived.pk).exists())
+
+        user.user_permissions.add(
+            Permission.objects.get(content_type__app_label="booking", codename="delete_archivedformsubmission"),
+        )
+        self.client.post(f"{url}?id={archived.pk}")
+        self.assertFalse(ArchivedFormSubmission.objects.filter(pk=archived.pk).exists())
+
+
+@override_settings(BOOKING_REMINDER_BACKEND={"BACKEND": "booking.reminders.LocalReminderBackend"})
+class ReminderTests(BookingTestCase):
+    """
+    Tests for the appointment reminder scheduler.
+    """
+    now = timezone.make_aware(datetime(2030, 3, 4, 22, 30))
+
+    def book(self, starts_in, status="confirmed"):
+        start = timezone.localtime(self.now) + starts_in
+        return FormSubmission.objects.create(
+            customer_first_name="Jane",
+            customer_last_name="Doe",
+            customer_email="jane@example.com",
+            customer_phone="555-1234",
+            location=self.location,
+            service=self.service,
+            preferred_date=start.date(),
+            preferred_time=start.time().replace(microsecond=0),
+            status=status,
+        )
+
+    def sent(self):
+        return sorted((r.submission_id, r.kind) for r in get_backend().outbox)
+
+    def test_sends_due_reminders_once(self):
+        day_ahead = self.book(timedelta(hours=23, minutes=50))
+        # Starts just after midnight: the 2h window crosses into the next day
+        two_hours_ahead = self.book(timedelta(hours=1, minutes=50))
+        self.book(timedelta(hours=30))
+        self.book(timedelta(hours=23, minutes=50), status="pending")
+
+        self.assertEqual(send_due_reminders(self.now), (2, 0))
+        self.assertEqual(self.sent(), sorted([(day_ahead.pk, "24h"), (two_hours_ahead.pk, "2h")]))
+
+        self.assertEqual(send_due_reminders(self.now + timedelta(minutes=1)), (0, 0))
+        self.assertEqual(len(get_backend().outbox), 2)
+
+    def test_concurrent_runners_claim_disjoint_reminders(self):
+        submission = self.book(timedelta(hours=23, minutes=50))
+        claim_due_reminders("24h", self.now, claim_token=uuid.UUID(int=1))
+        claim_due_reminders("24h", self.now, claim_token=uuid.UUID(int=2))
+        reminder = AppointmentReminder.objects.get(submission=submission)
+        self.assertEqual(reminder.claim_token, uuid.UUID(int=1))
+
+    def test_abandoned_claims_are_taken_over(self):
+        submission = self.book(timedelta(hours=23, minutes=30))
+        claim_due_reminders("24h", self.now, claim_token=uuid.UUID(int=1))
+        self.assertEqual(send_due_reminders(self.now + timedelta(minutes=5)), (0, 0))
+        self.assertEqual(send_due_reminders(self.now + timedelta(minutes=15)), (1, 0))
+        self.assertEqual(self.sent(), [(submission.pk, "24h")])
+
+    @override_settings(BOOKING_REMINDER_BACKEND={"BACKEND": "booking.reminders.EmailReminderBackend"})
+    def test_email_backend(self):
+        self.book(timedelta(hours=1, minutes=50))
+        send_due_reminders(self.now)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["jane@example.com"])
+        self.assertIn("2 hours", mail.outbox[0].subject)
+        self.assertIn("Downtown Salon", mail.outbox[0].body)
+
+
+class WaitlistTests(BookingTestCase):
+    """
+    Tests for backfilling cancelled bookings from the waitlist.
+    """
+    def setUp(self):
+        super().setUp()
+        self.day = date.today() + timedelta(days=7)
+
+    def book(self, employee=None):
+        return FormSubmission.objects.create(
+            customer_first_name="Jane",
+            customer_last_name="Doe",
+            customer_email="jane@example.com",
+            customer_phone="555-1234",
+            location=self.location,
+            service=self.service,
+            preferred_employee=employee,
+            preferred_date=self.day,
+            preferred_time="14:00",
+            status="confirmed",
+        )
+
+    def wait(self, name, employee=None, days=(-3, 3)):
+        return WaitlistEntry.objects.create(
+            customer_first_name=name,
+            customer_last_name="Waiter",
+            customer_email=f"{name.lower()}@example.com",
+            customer_phone="555-0000",
+            location=self.location,
+            service=self.service,
+            preferred_employee=employee,
+            earliest_date=self.day + timedelta(days=days[0]),
+            latest_date=self.day + timedelta(days=days[1]),
+        )
+
+    def cancel(self, submission):
+        submission.status = "cancelled"
+        with self.captureOnCommitCallbacks(execute=True):
+            submission.save()
+
+    def test_cancellation_offers_slot_to_first_eligible_waiter(self):
+        booking = self.book()
+        self.wait("Late", days=(1, 5))
+        first = self.wait("First")
+        second = self.wait("Second")
+
+        self.cancel(booking)
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, "offered")
+        offer = first.offered_submission
+        self.assertEqual((offer.customer_first_name, offer.status), ("First", "pending"))
+        self.assertEqual((offer.preferred_date, offer.preferred_time.strftime("%H:%M")), (self.day, "14:00"))
+        self.assertFalse(first.days.exists())
+        self.assertEqual(WaitlistEntry.objects.get(pk=second.pk).status, "waiting")
+        self.assertEqual(mail.outbox[0].to, ["first@example.com"])
+        self.assertIn("Downtown Salon", mail.outbox[0].body)
+
+    def test_employee_preference(self):
+        other = EmployeePage(
+            title="Ben", first_name="Ben", last_name="Jones", job_title="Stylist", work_location=self.location,
+        )
+        self.employees_page.add_child(instance=other)
+        self.wait("Picky", employee=other)
+        anna_fan = self.wait("Fan", employee=self.employee)
+
+        # A slot with no employee only suits waiters happy with anyone
+        self.cancel(self.book())
+        self.assertFalse(WaitlistEntry.objects.filter(status="offered").exists())
+
+        self.cancel(self.book(employee=self.employee))
+        self.assertEqual(WaitlistEntry.objects.get(status="offered"), anna_fan)
+
+    def test_waiter_only_gets_one_slot(self):
+        bookings = [self.book(), self.book()]
+        first = self.wait("First")
+        self.wait("Second")
+
+        # A stale match (e.g. from a concurrent cancellation) is skipped at claim time
+        self.assertEqual(find_waiter(self.location.pk, self.service.pk, self.day).entry_id, first.pk)
+        FormSubmission.bulk_set_status([b.pk for b in bookings], "cancelled")
+
+        offers = FormSubmission.objects.filter(status="pending").order_by("customer_first_name")
+        self.assertEqual([o.customer_first_name for o in offers], ["First", "Second"])
+        self.assertIsNone(find_waiter(self.location.pk, self.service.pk, self.day))
+
+    def test_finding_a_waiter_uses_the_day_index(self):
+        for i in range(5):
+            self.wait(f"Waiter{i}")
+        with CaptureQueriesContext(connection) as queries:
+            find_waiter(self.location.pk, self.service.pk, self.day, self.employee.pk)
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            plan = connection.cursor().execute(f"EXPLAIN QUERY PLAN {query['sql']}").fetchall()
+            self.assertIn("booking_wait_day_match_idx", str(plan))
+            self.assertNotIn("TEMP B-TREE", str(plan))
+
+    def test_join_waitlist_api(self):
+        url = reverse("booking:join_waitlist")
+        data = {
+            "customer_first_name": "Jane",
+            "customer_last_name": "Doe",
+            "customer_email": "jane@example.com",
+            "customer_phone": "555-1234",
+            "location": self.location.pk,
+            "service": self.service.pk,
+            "earliest_date": self.day.isoformat(),
+            "latest_date": (self.day + timedelta(days=2)).isoformat(),
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 201)
+        entry = WaitlistEntry.objects.get(pk=response.json()["waitlist_entry"]["id"])
+        self.assertEqual(entry.days.count(), 3)
+
+        data["latest_date"] = (self.day + timedelta(days=WaitlistEntry.MAX_DAYS)).isoformat()
+        self.assertEqual(self.client.post(url, data).status_code, 400)
+
+    def test_admin_listing_query_count_does_not_grow_with_offers(self):
+        self.login()
+        url = reverse("wagtailsnippets_booking_waitlistentry:list")
+
+        def offer(name):
+            entry = self.wait(name)
+            entry.offered_submission = self.book()
+            entry.status = "offered"
+            entry.save()
+
+        offer("First")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for i in range(5):
+            offer(f"Extra{i}")
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(after), len(before))
+
+
+class CalendarFeedTests(BookingTestCase):
+    """
+    Tests for the per-employee and per-location iCalendar feeds.
+    """
+    def setUp(self):
+        super().setUp()
+        self.day = date.today() + timedelta(days=3)
+        self.url = feed_url(self.employee)
+
+    def book(self, **kwargs):
+        return FormSubmission.objects.create(**{
+            "customer_first_name": "Jane",
+            "customer_last_name": "Doe",
+            "customer_email": "jane@example.com",
+            "customer_phone": "555-1234",
+            "location": self.location,
+            "service": self.service,
+            "preferred_employee": self.employee,
+            "preferred_date": self.day,
+            "preferred_time": "14:00",
+            "status": "confirmed",
+            **kwargs,
+        })
+
+    def fetch(self, url=None, **headers):
+        response = self.client.get(url or self.url, **headers)
+        content = b"".join(response.streaming_content).decode() if response.streaming else ""
+        return response, content
+
+    def test_feed_lists_bookings_with_service_duration(self):
+        booking = self.book()
+        self.book(status="cancelled", preferred_time="16:00")
+        self.book(preferred_date=date.today() + timedelta(days=365))
+
+        response, content = self.fetch()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        self.assertEqual(content.count("BEGIN:VEVENT"), 1)
+        self.assertIn(f"UID:booking-{booking.pk}@testserver\r\n", content)
+        # Haircut takes an hour; times are in UTC
+        self.assertIn(f"DTSTART:{self.day:%Y%m%d}T140000Z\r\n", content)
+        self.assertIn(f"DTEND:{self.day:%Y%m%d}T150000Z\r\n", content)
+        self.assertIn("SUMMARY:Haircut - Jane Doe\r\n", content)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in content.split("\r\n")))
+
+    def test_location_feed(self):
+        self.book()
+        response, content = self.fetch(feed_url(self.location))
+        self.assertIn("SUMMARY:Haircut - Jane Doe (Anna Smith)\r\n", content)
+
+    def test_unchanged_feed_gets_304(self):
+        booking = self.book()
+        response, _ = self.fetch()
+        etag = response["ETag"]
+
+        response, _ = self.fetch(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response, _ = self.fetch(HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        # Cancelling removes the event, so the feed changes
+        FormSubmission.bulk_set_status([booking.pk], "cancelled")
+        response, content = self.fetch(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("BEGIN:VEVENT", content)
+
+    def test_bad_token_is_404(self):
+        response = self.client.get(self.url.replace(".ics", "x.ics"))
+        self.assertEqual(response.status_code, 404)
+
+
+class NearestLocationTests(BookingTestCase):
+    """
+    Tests for the nearest-location index and API.
+    """
+    def setUp(self):
+        super().setUp()
+        self.location.latitude, self.location.longitude = Decimal("40.712776"), Decimal("-74.005974")
+        self.location.save()
+        self.brooklyn = LocationPage(
+            title="Brooklyn", location_name="Brooklyn Salon", address="2 Court St",
+            latitude=Decimal("40.678178"), longitude=Decimal("-73.944158"),
+        )
+        self.locations_page.add_child(instance=self.brooklyn)
+        self.closed = LocationPage(
+            title="Closed", location_name="Closed Salon", address="3 Side St",
+            latitude=Decimal("40.678200"), longitude=Decimal("-73.944100"),
+            **{field: "Closed" for field in nearest.WEEKDAY_HOURS_FIELDS},
+        )
+        self.locations_page.add_child(instance=self.closed)
+        nearest.invalidate_index()
+
+    def names(self, results):
+        return [location["name"] for distance, location in results]
+
+    def test_nearest_locations(self):
+        results = nearest.nearest_locations(40.68, -73.95, k=5)
+        self.assertEqual(self.names(results), ["Brooklyn Salon", "Downtown Salon"])
+        self.assertAlmostEqual(results[1][0], 5.96, delta=0.05)
+        # Only the Downtown location offers the haircut
+        results = nearest.nearest_locations(40.68, -73.95, k=5, service_id=self.service.pk)
+        self.assertEqual(self.names(results), ["Downtown Salon"])
+
+    def test_lookups_only_read_the_catalog_version(self):
+        nearest.get_index()
+        with self.assertNumQueries(1):
+            nearest.nearest_locations(40.68, -73.95, k=1)
+
+    def test_kd_tree_matches_brute_force(self):
+        rng = random.Random(42)
+        points = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(300)]
+        tree = nearest.KDTree([(nearest.to_unit_vector(*p), i) for i, p in enumerate(points)])
+        for _ in range(20):
+            query = nearest.to_unit_vector(rng.uniform(-60, 60), rng.uniform(-180, 180))
+            expected = sorted(
+                range(len(points)),
+                key=lambda i: sum((a - b) ** 2 for a, b in zip(query, nearest.to_unit_vector(*points[i]))),
+            )[:7]
+            self.assertEqual([item for distance, item in tree.nearest(query, 7)], expected)
+
+    def test_publishing_rebuilds_the_index(self):
+        self.assertEqual(self.names(nearest.nearest_locations(40.68, -73.95, k=1)), ["Brooklyn Salon"])
+        # No signal handler or cache is involved: any process sees the change
+        cache.clear()
+        self.brooklyn.unpublish()
+        self.assertEqual(self.names(nearest.nearest_locations(40.68, -73.95, k=1)), ["Downtown Salon"])
+        self.brooklyn.save_revision().publish()
+        self.assertEqual(self.names(nearest.nearest_locations(40.68, -73.95, k=1)), ["Brooklyn Salon"])
+
+    def test_api(self):
+        url = reverse("booking:nearest_locations")
+        response = self.client.get(url, {"lat": "40.68", "lng": "-73.95", "k": "1"})
+        self.assertEqual(response.status_code, 200)
+        [location] = response.json()["locations"]
+        self.assertEqual((location["id"], location["name"]), (self.brooklyn.pk, "Brooklyn Salon"))
+        self.assertLess(location["distance_km"], 1)
+        self.assertEqual(self.client.get(url, {"lat": "north"}).status_code, 400)
+
+
+class BookingConflictTests(BookingTestCase):
+    """
+    Tests for the overlapping-booking sweep, command and admin report.
+    """
+    def book(self, preferred_time, employee=None, day=None, status="confirmed"):
+        return FormSubmission.objects.create(
+            customer_first_name="Jane",
+            customer_last_name="Doe",
+            customer_email="jane@example.com",
+            customer_phone="555-1234",
+            location=self.location,
+            service=self.service,
+            preferred_employee=employee or self.employee,
+            preferred_date=day or date(2030, 5, 6),
+            preferred_time=preferred_time,
+            status=status,
+        )
+
+    def pairs(self):
+        return [(o.first_id, o.second_id) for o in find_overlaps()]
+
+    def test_finds_every_overlapping_pair(self):
+        # The haircut takes an hour
+        nine = self.book("09:00")
+        nine_thirty = self.book("09:30")
+        nine_forty_five = self.book("09:45")
+        self.book("10:45")  # starts after the others end
+        self.book("09:15", status="cancelled")
+        self.book("09:15", day=date(2030, 5, 7))
+
+        self.assertEqual(self.pairs(), [
+            (nine.pk, nine_thirty.pk),
+            (nine.pk, nine_forty_five.pk),
+            (nine_thirty.pk, nine_forty_five.pk),
+        ])
+
+    def test_back_to_back_bookings_do_not_overlap(self):
+        self.book("09:00")
+        self.book("10:00")
+        self.assertEqual(self.pairs(), [])
+
+    def test_sweep_matches_pairwise_check(self):
+        rng = random.Random(7)
+        rows = sorted(
+            (pk, rng.randint(1, 3), date(2030, 1, rng.randint(1, 3)),
+             time(rng.randint(8, 17), rng.choice([0, 15, 30, 45])), rng.choice([15, 30, 60, 90]))
+            for pk in range(400)
+        )
+        rows.sort(key=lambda row: (row[1], row[2], row[3], row[0]))
+
+        def minutes(row):
+            return row[3].hour * 60 + row[3].minute
+
+        expected = {
+            (a[0], b[0])
+            for i, a in enumerate(rows) for b in rows[i + 1:]
+            if (a[1], a[2]) == (b[1], b[2]) and minutes(b) < minutes(a) + a[4]
+        }
+        self.assertEqual({(o.first_id, o.second_id) for o in sweep(rows)}, expected)
+
+    def test_command(self):
+        self.book("09:00")
+        self.book("09:30")
+        out = StringIO()
+        call_command("find_booking_conflicts", "--from", "2030-05-01", stdout=out)
+        self.assertIn("Anna Smith  2030-05-06", out.getvalue())
+        self.assertIn("09:00-10:00", out.getvalue())
+        self.assertIn("1 overlapping pairs found", out.getvalue())
+
+        out = StringIO()
+        call_command("find_booking_conflicts", "--to", "2030-05-01", stdout=out)
+        self.assertIn("0 overlapping pairs found", out.getvalue())
+
+    def test_admin_report(self):
+        self.login()
+        first, second = self.book("09:00"), self.book("09:30")
+        url = reverse("booking_conflicts")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        [row] = response.context["object_list"]
+        self.assertEqual((row.first, row.second, row.second_times), (first, second, "09:30-10:30"))
+        self.assertContains(response, reverse("wagtailsnippets_booking_formsubmission:edit", args=[second.pk]))
+
+        response = self.client.get(url, {"preferred_date_from": "2030-06-01"})
+        self.assertEqual(list(response.context["object_list"]), [])
+
+        response = self.client.get(url, {"export": "csv"})
+        self.assertIn("09:30-10:30", response.getvalue().decode())
+
+
+class EligibilityTests(BookingTestCase):
+    """
+    Tests for employee skills and the in-memory eligibility index.
+    """
+    def setUp(self):
+        super().setUp()
+        self.colour = ServicePage(
+            title="Colour", service_name="Colour", price=Decimal("80.00"),
+            duration_minutes=90, service_category="hair",
+        )
+        self.services_page.add_child(instance=self.colour)
+        ServiceLocation.objects.create(service=self.colour, location=self.location)
+        self.colourist = EmployeePage(
+            title="Ben", first_name="Ben", last_name="Jones", job_title="Colourist", work_location=self.location,
+        )
+        self.colourist.skills.add(EmployeeSkill(service=self.colour))
+        self.employees_page.add_child(instance=self.colourist)
+
+    def employee_ids(self, service):
+        response = self.client.get(
+            reverse("booking:employees_for_service"), {"location_id": self.location.pk, "service_id": service.pk},
+        )
+        return [employee["id"] for employee in response.json()["employees"]]
+
+    def test_employees_for_service(self):
+        # Anna has no skills listed, so she performs everything
+        self.assertEqual(self.employee_ids(self.service), [self.employee.pk])
+        self.assertEqual(self.employee_ids(self.colour), [self.employee.pk, self.colourist.pk])
+
+    def test_lookups_only_read_the_catalog_version(self):
+        eligibility.get_index()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.employee_ids(self.service), [self.employee.pk])
+
+    def test_booking_validation(self):
+        data = {
+            "customer_first_name": "Jane",
+            "customer_last_name": "Doe",
+            "customer_email": "jane@example.com",
+            "customer_phone": "555-1234",
+            "location": self.location.id,
+            "service": self.service.id,
+            "preferred_employee": self.colourist.id,
+            "preferred_date": (date.today() + timedelta(days=7)).isoformat(),
+            "preferred_time": "14:30",
+        }
+        response = self.client.post(reverse("booking:submit_booking"), data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Ben Jones doesn't offer Haircut", response.json()["errors"]["__all__"][0]["message"])
+
+        data["service"] = self.colour.id
+        self.assertEqual(self.client.post(reverse("booking:submit_booking"), data).status_code, 201)
+
+    def test_validation_sees_skills_published_by_another_process(self):
+        data = {
+            "customer_first_name": "Jane",
+            "customer_last_name": "Doe",
+            "customer_email": "jane@example.com",
+            "customer_phone": "555-1234",
+            "location": self.location.id,
+            "service": self.service.id,
+            "preferred_employee": self.colourist.id,
+            "preferred_date": (date.today() + timedelta(days=7)).isoformat(),
+            "preferred_time": "14:30",
+        }
+        self.assertFalse(BookingForm(data).is_valid())
+
+        # No on_commit callbacks run and nothing is left in this process's
+        # cache, as when another worker publishes
+        self.colourist.skills.add(EmployeeSkill(service=self.service))
+        self.colourist.save_revision().publish()
+        cache.clear()
+        self.assertTrue(BookingForm(data).is_valid())
+
+    def test_publishing_rebuilds_the_index(self):
+        self.assertEqual(self.employee_ids(self.service), [self.employee.pk])
+        self.colourist.skills.add(EmployeeSkill(service=self.service))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.colourist.save_revision().publish()
+        self.assertEqual(self.employee_ids(self.service), [self.employee.pk, self.colourist.pk])
+
+    def test_catalog_import_rebuilds_the_index(self):
+        self.assertEqual(self.employee_ids(self.colour), [self.employee.pk, self.colourist.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            import_catalog(employees=[{
+                "first_name": "Cleo", "last_name": "Ward", "job_title": "Colourist",
+                "work_location": self.location.slug, "skills": [self.colour.slug],
+            }])
+        cleo = EmployeePage.objects.get(slug="cleo-ward")
+        self.assertEqual(self.employee_ids(self.colour), [self.employee.pk, self.colourist.pk, cleo.pk])
+
+    def test_embedded_availability_lists_employees_per_service(self):
+        location_data = get_availability_map()[self.location.pk]
+        self.assertEqual(location_data["service_employees"][self.service.pk], [self.employee.pk])
+
+
+@override_settings(BOOKING_THROTTLE_RATES={"booking_ip": "3/hour", "booking_email": "2/hour", "availability_ip": "2/min"})
+class ThrottlingTests(BookingTestCase):
+    """
+    Tests for the token bucket rate limits and the honeypot field in front of
+    the booking endpoints.
+    """
+
+    def booking_data(self, **overrides):
+        data = {
+            "customer_first_name": "Jane",
+            "customer_last_name": "Doe",
+            "customer_email": "jane@example.com",
+            "customer_phone": "555-1234",
+            "location": self.location.id,
+            "service": self.service.id,
+            "preferred_date": "2000-01-01",
+            "preferred_time": "14:30",
+        }
+        data.update(overrides)
+        return data
+
+    def submit(self, ip="10.0.0.1", **overrides):
+        return self.client.post(reverse("booking:submit_booking"), self.booking_data(**overrides), REMOTE_ADDR=ip)
+
+    def test_ip_is_limited_after_burst(self):
+        for i in range(3):
+            self.assertEqual(self.submit(customer_email=f"client{i}@example.com").status_code, 400)
+        response = self.submit(customer_email="client3@example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()["errors"]["__all__"][0]["code"], "throttled")
+        # A token comes back every 20 minutes
+        self.assertEqual(response["Retry-After"], "1200")
+        self.assertEqual(self.submit(ip="10.0.0.2").status_code, 400)
+
+    def test_email_is_limited_across_ips(self):
+        self.assertEqual(self.submit(ip="10.0.0.1").status_code, 400)
+        self.assertEqual(self.submit(ip="10.0.0.2").status_code, 400)
+        self.assertEqual(self.submit(ip="10.0.0.3", customer_email=" JANE@example.com").status_code, 429)
+        self.assertEqual(self.submit(ip="10.0.0.3", customer_email="john@example.com").status_code, 400)
+
+    def test_refused_requests_take_no_tokens(self):
+        buckets = {"throttle:test": "2/min"}
+        self.assertEqual(take_tokens(buckets, now=0), 0)
+        self.assertEqual(take_tokens(buckets, now=0), 0)
+        self.assertAlmostEqual(take_tokens(buckets, now=0), 30)
+        self.assertAlmostEqual(take_tokens(buckets, now=20), 10)
+        self.assertEqual(take_tokens(buckets, now=30), 0)
+
+    def test_honeypot_is_refused_before_the_form(self):
+        with self.assertNumQueries(0):
+            response = self.submit(website="http://spam.example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"]["__all__"][0]["code"], "throttled")
+
+    def test_booking_page_is_limited(self):
+        booking_page = self.booking_page
+        for i in range(3):
+            response = self.client.post(booking_page.url, self.booking_data(customer_email=f"client{i}@example.com"))
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post(booking_page.url, self.booking_data(customer_email="client3@example.com"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertEqual(self.client.get(booking_page.url).status_code, 200)
+
+    async def test_async_availability_is_limited(self):
+        client = AsyncClient(REMOTE_ADDR="10.0.0.1")
+        url = reverse("booking:services_by_location")
+        for _ in range(2):
+            response = await client.get(url, {"location_id": self.location.id})
+            self.assertEqual(response.status_code, 200)
+        response = await client.get(url, {"location_id": self.location.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+    @override_settings(BOOKING_THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        for _ in range(4):
+            self.assertEqual(self.submit().status_code, 400)
+
+    def test_in_process_requests_are_exempt(self):
+        url = reverse("booking:services_by_location")
+        for _ in range(3):
+            response = self.client.get(url, {"location_id": self.location.id}, **{EXEMPT_ENVIRON_KEY: True})
+            self.assertEqual(response.status_code, 200)
+
+    def test_forwarded_requests_without_ip_header_are_logged(self):
+        with mock.patch("booking.throttling._warned_about_proxy", False):
+            with self.assertLogs("booking.throttling", "ERROR"):
+                self.client.post(
+                    reverse("booking:submit_booking"), self.booking_data(), HTTP_X_FORWARDED_FOR="203.0.113.7",
+                )
+
+    def test_proxy_without_ip_header_fails_the_checks(self):
+        with override_settings(SECURE_PROXY_SSL_HEADER=("HTTP_X_FORWARDED_PROTO", "https")):
+            self.assertEqual([error.id for error in check_throttle_ip_header(None)], ["booking.E001"])
+            with override_settings(BOOKING_THROTTLE_IP_HEADER="HTTP_X_FORWARDED_FOR"):
+                self.assertEqual(check_throttle_ip_header(None), [])
+
+
+class IdempotentSubmissionTests(BookingTestCase):
+    """
+    Tests for idempotency keys on booking submissions and the near-duplicate
+    flag.
+    """
+
+    def booking_data(self, **overrides):
+        data = {
+            "customer_first_name": "Jane",
+            "customer_last_name": "Doe",
+            "customer_email": "jane@example.com",
+            "customer_phone": "555-1234",
+            "location": self.location.id,
+            "service": self.service.id,
+            "preferred_date": (date.today() + timedelta(days=7)).isoformat(),
+            "preferred_time": "14:30",
+            "idempotency_key": str(uuid.uuid4()),
+        }
+        data.update(overrides)
+        return data
+
+    def test_each_rendered_form_has_a_new_key(self):
+        first = self.client.get(self.booking_page.url).context["form"]["idempotency_key"].value()
+        second = self.client.get(self.booking_page.url).context["form"]["idempotency_key"].value()
+        self.assertNotEqual(uuid.UUID(str(first)), uuid.UUID(str(second)))
+
+    def test_resubmission_returns_the_original_booking(self):
+        data = self.booking_data()
+        first = self.client.post(reverse("booking:submit_booking"), data)
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.post(reverse("booking:submit_booking"), data)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["booking"], first.json()["booking"])
+        self.assertFalse([q for q in queries.captured_queries if q["sql"].startswith("INSERT")])
+        submission = FormSubmission.objects.get()
+        self.assertEqual(str(submission.idempotency_key), data["idempotency_key"])
+
+    def test_booking_page_resubmission(self):
+        data = self.booking_data()
+        for _ in range(2):
+            response = self.client.post(self.booking_page.url, data)
+            self.assertRedirects(response, self.booking_page.url + "?success=1", fetch_redirect_response=False)
+        self.assertEqual(FormSubmission.objects.count(), 1)
+
+    def test_concurrent_retry_is_stopped_by_the_constraint(self):
+        data = self.booking_data()
+        original = BookingForm(data)
+        self.assertTrue(original.is_valid())
+        original, _ = original.save_once()
+
+        # The retry checked for a previous submission before the original was saved
+        form = BookingForm(data)
+        self.assertTrue(form.is_valid())
+        with mock.patch.object(BookingForm, "previous_submission", side_effect=[None, original]):
+            submission, created = form.save_once()
+        self.assertFalse(created)
+        self.assertEqual(submission, original)
+        self.assertEqual(FormSubmission.objects.count(), 1)
+
+    def test_submissions_without_a_key(self):
+        for _ in range(2):
+            response = self.client.post(reverse("booking:submit_booking"), self.booking_data(idempotency_key=""))
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(FormSubmission.objects.filter(idempotency_key=None).count(), 2)
+
+    def test_near_duplicates_are_flagged(self):
+        self.client.post(reverse("booking:submit_booking"), self.booking_data())
+        self.client.post(reverse("booking:submit_booking"), self.booking_data(customer_email="JANE@example.com"))
+        self.client.post(reverse("booking:submit_booking"), self.booking_data(preferred_time="15:30"))
+        first, second, other_time = FormSubmission.objects.order_by("pk")
+        self.assertIsNone(first.possible_duplicate_of)
+        self.assertEqual(second.possible_duplicate_of, first)
+        self.assertEqual(second.get_duplicate_flag(), f"Possible duplicate of #{first.pk}")
+        self.assertIsNone(other_time.possible_duplicate_of)
+
+        FormSubmission.objects.update(submitted_at=timezone.now() - FormSubmission.DUPLICATE_WINDOW - timedelta(minutes=1))
+        self.client.post(reverse("booking:submit_booking"), self.booking_data())
+        self.assertIsNone(FormSubmission.objects.latest("pk").possible_duplicate_of)
@@ -0,0 +1,165 @@
+"""
+Rate limiting of the booking endpoints, to shed spam bots before they cost
+a form, its querysets and its validation queries.
+
+Each client has a token bucket per scope: ``"10/hour"`` is a bucket of 10
+tokens that refills at 10 per hour, so a client can make a burst of 10
+requests and then one every 6 minutes. Booking submissions are limited by
+client IP and by the submitted email address; the availability APIs by
+client IP only. A bucket is a (tokens, updated at) pair in the
+BOOKING_THROTTLE_CACHE cache, which has to be shared by all worker
+processes. Reading and updating a bucket aren't atomic, so a burst of
+simultaneous requests can get a few more through than the rate allows;
+that's fine for shedding floods.
+
+Behind a reverse proxy, every request comes from the proxy's address, so
+BOOKING_THROTTLE_IP_HEADER must name the header carrying the client's; the
+booking.E001 system check and a logged error point out a missing one.
+In-process clients (the warm_cache command) set EXEMPT_ENVIRON_KEY in the
+request environ and aren't limited.
+
+The checks run in a view decorator, before the view builds a form, as does
+the honeypot check: BookingForm has a ``website`` field that people never
+see, so a filled-in one means a bot.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+HONEYPOT_FIELD = 'website'
+
+# Set in the environ of requests made in-process; remote clients can't send
+# it, as their headers all become HTTP_* keys
+EXEMPT_ENVIRON_KEY = 'booking.throttle_exempt'
+
+PERIODS = {'sec': 1, 'min': 60, 'hour': 60 * 60, 'day': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """``"10/hour"`` -> (10, 3600): bucket capacity and the seconds it takes to refill"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period]
+
+
+def get_cache():
+    return caches[settings.BOOKING_THROTTLE_CACHE]
+
+
+_warned_about_proxy = False
+
+
+def client_ip(request):
+    global _warned_about_proxy
+    header = getattr(settings, 'BOOKING_THROTTLE_IP_HEADER', None)
+    if header and request.META.get(header):
+        # The proxy appends the address it saw, so the last one can be trusted
+        return request.META[header].split(',')[-1].strip()
+    if not header and 'HTTP_X_FORWARDED_FOR' in request.META and not _warned_about_proxy:
+        _warned_about_proxy = True
+        logger.error(
+            "Booking requests carry X-Forwarded-For but BOOKING_THROTTLE_IP_HEADER isn't set: behind a "
+            "proxy, every visitor shares the proxy's rate limit. Set it to \"HTTP_X_FORWARDED_FOR\"."
+        )
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def bucket_key(scope, kind, value):
+    # Hashed, so any email is a valid cache key
+    return f"throttle:{scope}:{kind}:{hashlib.sha1(value.encode()).hexdigest()}"
+
+
+def take_tokens(buckets, now=None):
+    """
+    Take a token from each of ``buckets`` ({cache key: rate}). Returns 0 if
+    the request may go ahead, or else the seconds until it may; a refused
+    request takes no tokens, so a client that waits isn't locked out longer.
+    """
+    now = time.time() if now is None else now
+    cache = get_cache()
+    states = cache.get_many(list(buckets))
+    updated = {}
+    wait = timeout = 0
+    for key, rate in buckets.items():
+        capacity, period = parse_rate(rate)
+        timeout = max(timeout, period)
+        tokens, updated_at = states.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * capacity / period)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) * period / capacity)
+        updated[key] = (tokens - 1, now)
+    if wait:
+        return wait
+    # A bucket left alone for a whole period is full again, as is a missing one
+    cache.set_many(updated, timeout=timeout)
+    return 0
+
+
+def request_buckets(request, scope):
+    rates = settings.BOOKING_THROTTLE_RATES
+    buckets = {bucket_key(scope, 'ip', client_ip(request)): rates[f'{scope}_ip']}
+    email = request.POST.get('customer_email', '').strip().lower() if request.method == 'POST' else ''
+    if email and f'{scope}_email' in rates:
+        buckets[bucket_key(scope, 'email', email)] = rates[f'{scope}_email']
+    return buckets
+
+
+def check_request(request, scope, json):
+    """None if ``request`` may go ahead, or else the response refusing it"""
+    if not getattr(settings, 'BOOKING_THROTTLE_ENABLED', True) or request.META.get(EXEMPT_ENVIRON_KEY):
+        return None
+    if request.method == 'POST' and request.POST.get(HONEYPOT_FIELD):
+        return refused("Your request could not be processed.", 400, json)
+    wait = take_tokens(request_buckets(request, scope))
+    if wait:
+        response = refused("Too many requests. Please try again in a few minutes.", 429, json)
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
+    return None
+
+
+def refused(message, status, json):
+    if json:
+        # In the shape of form.errors.get_json_data(), for the booking page's script
+        return JsonResponse(
+            {'success': False, 'errors': {'__all__': [{'message': message, 'code': 'throttled'}]}}, status=status,
+        )
+    return HttpResponse(message, status=status, content_type='text/plain; charset=utf-8')
+
+
+def throttle(scope, methods=('POST',), json=True):
+    """
+    Refuse requests (with the given ``methods``) over the ``scope`` rates in
+    BOOKING_THROTTLE_RATES (``<scope>_ip``, and optionally ``<scope>_email``)
+    before the view runs, with a JSON or a plain text response. Works on sync
+    and async views.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    response = await sync_to_async(check_request)(request, scope, json)
+                    if response is not None:
+                        return response
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                response = check_request(request, scope, json)
+                if response is not None:
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,36 @@
+"""
+Transactions for the booking write paths.
+
+SQLite starts transactions DEFERRED: the write lock is only taken at the first
+write. A transaction that reads before writing (checking a slot, then booking
+it) can then fail with "database is locked" if another writer committed in
+between, however long the busy timeout. ``write_transaction`` begins those
+transactions IMMEDIATE instead, so they take the write lock at BEGIN and queue
+behind each other. Only these blocks take the lock up front; every other
+atomic block (the admin, middleware, read-only ones) stays DEFERRED. On other
+databases it's a plain ``transaction.atomic()``.
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+@contextmanager
+def write_transaction(using=None):
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # A nested block is a savepoint in a transaction that's already begun
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Connecting reads the mode from the settings, so connect first
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
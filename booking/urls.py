@@ -4,6 +4,11 @@ from . import views
 app_name = 'booking'
 
 urlpatterns = [
+    path('api/submit/', views.submit_booking, name='submit_booking'),
+    path('api/waitlist/', views.join_waitlist, name='join_waitlist'),
     path('api/services-by-location/', views.get_services_by_location, name='services_by_location'),
     path('api/employees-by-location/', views.get_employees_by_location, name='employees_by_location'),
+    path('api/employees-for-service/', views.get_employees_for_service, name='employees_for_service'),
+    path('api/nearest-locations/', views.get_nearest_locations, name='nearest_locations'),
+    path('calendar/<str:kind>/<int:pk>/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
 ]
@@ -1,20 +1,31 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.http import JsonResponse
-from .forms import BookingForm
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET, require_POST
+from . import calendar_feeds, eligibility, nearest
+from .availability import employee_data, get_availability_map, service_data
+from .forms import BookingForm, WaitlistForm
 from .models import FormSubmission
+from .throttling import throttle
+from .transactions import write_transaction
 from home.models import LocationPage, ServicePage, EmployeePage, ServiceLocation
 
 
+@throttle('booking', json=False)
 def booking_page_view(request, page):
     """
     Handle booking page display and form submission
     """
     if request.method == 'POST':
         form = BookingForm(request.POST)
+        if form.previous_submission() is not None:
+            # The same form posted again: the booking was already made
+            return redirect(request.path + '?success=1')
         if form.is_valid():
-            # Save the form submission
-            submission = form.save()
+            submission, _ = form.save_once()
             
             # Add success message
             messages.success(
@@ -38,58 +49,192 @@ def booking_page_view(request, page):
         'page': page,
         'form': form,
         'success': success,
+        'availability_data': get_availability_map() if page.embed_availability else None,
     })
 
 
-def get_services_by_location(request):
+@require_POST
+@throttle('booking')
+def submit_booking(request):
+    """
+    JSON endpoint for booking submissions.
+
+    Validates with the same BookingForm as the booking page, but answers with
+    field errors or a confirmation payload instead of re-rendering the page,
+    and doesn't touch the session (no flash message, no redirect). A form
+    posted again with the same idempotency key gets the booking it already
+    made (with a 200 instead of a 201).
+    """
+    form = BookingForm(request.POST)
+    submission = form.previous_submission()
+    if submission is not None:
+        created = False
+    elif not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors.get_json_data()}, status=400)
+    else:
+        submission, created = form.save_once()
+    return JsonResponse({
+        'success': True,
+        'booking': {
+            'id': submission.id,
+            'first_name': submission.customer_first_name,
+            'service': submission.service.display_name,
+            'location': submission.location.display_name,
+            'employee': submission.get_employee_preference(),
+            'date': submission.preferred_date.isoformat(),
+            'time': submission.preferred_time.strftime('%H:%M'),
+            'status': submission.status,
+        },
+    }, status=201 if created else 200)
+
+
+@require_POST
+@throttle('booking')
+def join_waitlist(request):
+    """
+    JSON endpoint for joining the waitlist. The customer is offered the first
+    matching slot that a cancellation frees up (see booking/waitlist.py).
+    """
+    form = WaitlistForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors.get_json_data()}, status=400)
+
+    with write_transaction():
+        entry = form.save()
+    return JsonResponse({
+        'success': True,
+        'waitlist_entry': {
+            'id': entry.id,
+            'first_name': entry.customer_first_name,
+            'service': entry.service.display_name,
+            'location': entry.location.display_name,
+            'employee': entry.preferred_employee.display_name if entry.preferred_employee else "Any Available",
+            'earliest_date': entry.earliest_date.isoformat(),
+            'latest_date': entry.latest_date.isoformat(),
+            'status': entry.status,
+        },
+    }, status=201)
+
+
+@throttle('availability', methods=('GET',))
+async def get_services_by_location(request):
     """
-    API endpoint to get services available at a specific location
+    API endpoint to get services available at a specific location.
+
+    Async so that under ASGI these lightweight lookups don't hold a worker
+    thread while waiting on the database.
     """
     location_id = request.GET.get('location_id')
     if not location_id:
         return JsonResponse({'services': []})
     
     try:
-        location = LocationPage.objects.get(id=location_id)
+        location = await LocationPage.objects.aget(id=location_id)
         # Get services available at this location through ServiceLocation
         service_locations = ServiceLocation.objects.filter(location=location).select_related('service')
         
         services_data = []
-        for sl in service_locations:
-            service = sl.service
-            services_data.append({
-                'id': service.id,
-                'name': service.display_name,
-                'price': str(service.price_display),
-                'duration': service.duration_display
-            })
+        async for sl in service_locations:
+            services_data.append(service_data(sl.service))
         
         return JsonResponse({'services': services_data})
     except LocationPage.DoesNotExist:
         return JsonResponse({'services': []})
 
 
-def get_employees_by_location(request):
+@throttle('availability', methods=('GET',))
+async def get_employees_by_location(request):
     """
-    API endpoint to get employees working at a specific location
+    API endpoint to get employees working at a specific location.
+
+    Async for the same reason as ``get_services_by_location``.
     """
     location_id = request.GET.get('location_id')
     if not location_id:
         return JsonResponse({'employees': []})
     
     try:
-        location = LocationPage.objects.get(id=location_id)
+        location = await LocationPage.objects.aget(id=location_id)
         # Get employees working at this location
         employees = EmployeePage.objects.filter(work_location=location, live=True)
         
         employees_data = []
-        for employee in employees:
-            employees_data.append({
-                'id': employee.id,
-                'name': employee.display_name,
-                'job_title': employee.job_title
-            })
+        async for employee in employees:
+            employees_data.append(employee_data(employee))
         
         return JsonResponse({'employees': employees_data})
     except LocationPage.DoesNotExist:
         return JsonResponse({'employees': []})
+
+
+@require_GET
+@throttle('availability', methods=('GET',))
+def get_employees_for_service(request):
+    """
+    API endpoint for the employees at a location who perform a service,
+    answered from the in-memory eligibility index (see booking/eligibility.py).
+    """
+    try:
+        location_id = int(request.GET['location_id'])
+        service_id = int(request.GET['service_id'])
+    except (KeyError, ValueError):
+        return JsonResponse({'employees': []})
+    return JsonResponse({'employees': eligibility.get_index().employees_for(location_id, service_id)})
+
+
+@require_GET
+@throttle('availability', methods=('GET',))
+def get_nearest_locations(request):
+    """
+    API endpoint for the locations nearest to ``lat``/``lng``, optionally only
+    those offering ``service_id``. Answered from an in-memory index (see
+    booking/nearest.py).
+    """
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lng'])
+        k = min(int(request.GET.get('k', 5)), 20)
+        service_id = int(request.GET['service_id']) if request.GET.get('service_id') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'lat and lng are required numbers'}, status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'lat/lng out of range'}, status=400)
+
+    results = nearest.nearest_locations(latitude, longitude, k, service_id)
+    return JsonResponse({
+        'locations': [
+            {**location, 'distance_km': round(distance, 2)}
+            for distance, location in results
+        ],
+    })
+
+
+@require_GET
+def calendar_feed(request, kind, pk, token):
+    """
+    iCalendar feed of an employee's or a location's bookings (see
+    booking/calendar_feeds.py). Unchanged feeds get a 304.
+    """
+    if kind not in calendar_feeds.FEED_MODELS or not calendar_feeds.is_valid_token(kind, pk, token):
+        raise Http404
+    page = calendar_feeds.FEED_MODELS[kind].objects.filter(pk=pk).first()
+    if page is None:
+        raise Http404
+
+    today = timezone.localdate()
+    etag, last_modified = calendar_feeds.feed_validators(kind, pk, today)
+    etag = quote_etag(etag)
+    last_modified = last_modified and int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = StreamingHttpResponse(
+            calendar_feeds.stream_feed(page, kind, request.get_host().split(':')[0], today),
+            content_type='text/calendar; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'inline; filename="{kind}-{pk}.ics"'
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # Always revalidate, so new bookings show up on the next poll
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
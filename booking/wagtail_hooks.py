@@ -0,0 +1,205 @@
+from django import forms
+from django.urls import path, reverse
+from django.utils.functional import classproperty
+from wagtail import hooks
+from wagtail.admin.menu import MenuItem
+from wagtail.snippets.bulk_actions.snippet_bulk_action import SnippetBulkAction
+from wagtail.snippets.permissions import get_permission_name
+from .models import ArchivedFormSubmission, FormSubmission
+from .reports import BookingConflictsView
+
+
+# ============================================================================
+# BOOKING SUBMISSION BULK ACTIONS
+# ============================================================================
+
+class BookingSubmissionBulkAction(SnippetBulkAction):
+    """
+    Base for bulk actions on booking submissions. Each action runs as one
+    set-based UPDATE (see FormSubmission.bulk_set_status / bulk_reassign)
+    instead of saving every row, and reports how many rows it changed.
+    """
+    template_name = 'booking/bulk_actions/confirm_bulk_status.html'
+    action_priority = 20
+    confirm_text = None
+
+    @classproperty
+    def models(cls):
+        return [FormSubmission]
+
+    @classmethod
+    def get_queryset(cls, model, object_ids):
+        # The confirmation page lists each submission's service and location
+        return model.objects.filter(pk__in=object_ids).select_related('service', 'location')
+
+    def check_perm(self, obj):
+        if getattr(self, 'can_change_items', None) is None:
+            self.can_change_items = self.request.user.has_perm(
+                get_permission_name('change', FormSubmission)
+            )
+        return self.can_change_items
+
+    def get_context_data(self, **kwargs):
+        return {
+            **super().get_context_data(**kwargs),
+            'action_name': self.display_name,
+            'confirm_text': self.confirm_text,
+        }
+
+    def get_success_message(self, num_parent_objects, num_child_objects):
+        skipped = len(self.actionable_objects) - num_parent_objects
+        message = f"{num_parent_objects} booking submission(s) {self.done_text}."
+        if skipped:
+            message += f" {skipped} skipped ({self.skipped_text})."
+        return message
+
+
+class StatusBulkAction(BookingSubmissionBulkAction):
+    target_status = None
+
+    @classmethod
+    def execute_action(cls, objects, **kwargs):
+        changed_ids = FormSubmission.bulk_set_status([obj.pk for obj in objects], cls.target_status)
+        return len(changed_ids), 0
+
+
+@hooks.register('register_bulk_action')
+class ConfirmBulkAction(StatusBulkAction):
+    display_name = "Confirm"
+    action_type = 'confirm'
+    aria_label = "Confirm selected booking submissions"
+    target_status = 'confirmed'
+    confirm_text = "Confirm these booking requests?"
+    done_text = "confirmed"
+    skipped_text = "not pending"
+
+
+@hooks.register('register_bulk_action')
+class CancelBulkAction(StatusBulkAction):
+    display_name = "Cancel"
+    action_type = 'cancel'
+    aria_label = "Cancel selected booking submissions"
+    classes = {'serious'}
+    target_status = 'cancelled'
+    confirm_text = "Cancel these bookings?"
+    done_text = "cancelled"
+    skipped_text = "already cancelled or completed"
+
+
+@hooks.register('register_bulk_action')
+class CompleteBulkAction(StatusBulkAction):
+    display_name = "Complete"
+    action_type = 'complete'
+    aria_label = "Mark selected booking submissions as completed"
+    target_status = 'completed'
+    confirm_text = "Mark these bookings as completed?"
+    done_text = "marked as completed"
+    skipped_text = "already cancelled or completed"
+
+
+class ReassignEmployeeForm(forms.Form):
+    employee = forms.ModelChoiceField(
+        queryset=None,
+        required=False,
+        empty_label="Any Available Employee",
+        help_text="Bookings at other locations than the employee's are skipped",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        from home.models import EmployeePage
+        self.fields['employee'].queryset = EmployeePage.objects.live()
+
+
+@hooks.register('register_bulk_action')
+class ReassignEmployeeBulkAction(BookingSubmissionBulkAction):
+    display_name = "Reassign employee"
+    action_type = 'reassign_employee'
+    aria_label = "Reassign the employee of selected booking submissions"
+    form_class = ReassignEmployeeForm
+    confirm_text = "Assign these bookings to:"
+    done_text = "reassigned"
+    skipped_text = "closed, or at another location"
+
+    def get_execution_context(self):
+        return {'employee': self.cleaned_form.cleaned_data['employee']}
+
+    @classmethod
+    def execute_action(cls, objects, employee=None, **kwargs):
+        changed_ids = FormSubmission.bulk_reassign([obj.pk for obj in objects], employee)
+        return len(changed_ids), 0
+
+
+@hooks.register('register_bulk_action')
+class RestoreArchivedBulkAction(SnippetBulkAction):
+    """Moves archived bookings back into the live FormSubmission table"""
+    display_name = "Restore"
+    action_type = 'restore'
+    aria_label = "Restore selected archived bookings"
+    template_name = 'booking/bulk_actions/confirm_bulk_status.html'
+    action_priority = 20
+
+    @classproperty
+    def models(cls):
+        return [ArchivedFormSubmission]
+
+    def check_perm(self, obj):
+        # Restoring adds the live booking and deletes the archived row
+        if getattr(self, 'can_restore_items', None) is None:
+            user = self.request.user
+            self.can_restore_items = (
+                FormSubmission.snippet_viewset.permission_policy.user_has_permission(user, 'add')
+                and ArchivedFormSubmission.snippet_viewset.permission_policy.user_has_permission(user, 'delete')
+            )
+        return self.can_restore_items
+
+    def get_context_data(self, **kwargs):
+        return {
+            **super().get_context_data(**kwargs),
+            'action_name': self.display_name,
+            'confirm_text': "Move these bookings back into the live booking submissions?",
+        }
+
+    @classmethod
+    def execute_action(cls, objects, **kwargs):
+        restored_ids = ArchivedFormSubmission.restore([obj.original_id for obj in objects])
+        return len(restored_ids), 0
+
+    def get_success_message(self, num_parent_objects, num_child_objects):
+        skipped = len(self.actionable_objects) - num_parent_objects
+        message = f"{num_parent_objects} archived booking(s) restored."
+        if skipped:
+            message += f" {skipped} skipped (already live, or their location/service page was deleted)."
+        return message
+
+
+# ============================================================================
+# REPORTS
+# ============================================================================
+
+class BookingReportMenuItem(MenuItem):
+    def is_shown(self, request):
+        return request.user.has_perm(get_permission_name('change', FormSubmission))
+
+
+@hooks.register('register_admin_urls')
+def register_booking_report_urls():
+    return [
+        path('reports/booking-conflicts/', BookingConflictsView.as_view(), name='booking_conflicts'),
+        path(
+            'reports/booking-conflicts/results/',
+            BookingConflictsView.as_view(results_only=True),
+            name='booking_conflicts_results',
+        ),
+    ]
+
+
+@hooks.register('register_reports_menu_item')
+def register_booking_conflicts_menu_item():
+    return BookingReportMenuItem(
+        "Booking conflicts",
+        reverse('booking_conflicts'),
+        name='booking-conflicts',
+        icon_name='warning',
+        order=1300,
+    )
@@ -0,0 +1,142 @@
+"""
+Backfilling cancelled bookings from the waitlist.
+
+When a booking is cancelled (edited in the admin, or through a bulk action),
+its slot is offered to the first customer on the waitlist for that location
+and service on that day. If the cancelled booking had a preferred employee,
+waiters who asked for that employee are eligible too; otherwise only waiters
+happy with anyone are. The offer is a new pending booking for the same date
+and time, which staff confirm as usual, and an email to the customer.
+
+Waiters are found through WaitlistDay rows with at most two index seeks, and
+claimed with a conditional UPDATE inside the cancellation's transaction, so
+two cancellations racing for the same waiter can't both offer them a slot:
+the loser moves on to the next waiter.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import FormSubmission, WaitlistDay, WaitlistEntry
+from .signals import submissions_bulk_updated
+from .transactions import write_transaction
+
+logger = logging.getLogger(__name__)
+
+
+def find_waiter(location_id, service_id, day, employee_id=None):
+    """The first-come WaitlistDay that can take this slot, or None"""
+    candidates = WaitlistDay.objects.filter(location_id=location_id, service_id=service_id, date=day)
+    employee_filters = [{'employee__isnull': True}]
+    if employee_id:
+        employee_filters.append({'employee_id': employee_id})
+    # One ordered seek per employee value (rather than an OR, which would
+    # need every match sorted)
+    matches = [
+        candidates.filter(**employee_filter).order_by('created_at', 'entry_id').first()
+        for employee_filter in employee_filters
+    ]
+    return min(
+        (match for match in matches if match is not None),
+        key=lambda match: (match.created_at, match.entry_id),
+        default=None,
+    )
+
+
+def claim_waiter(submission):
+    """
+    Claim the first waiter who can take ``submission``'s slot. Returns their
+    WaitlistEntry, now 'offered', or None if nobody can.
+    """
+    while True:
+        match = find_waiter(
+            submission.location_id, submission.service_id, submission.preferred_date,
+            submission.preferred_employee_id,
+        )
+        if match is None:
+            return None
+        claimed = WaitlistEntry.objects.filter(pk=match.entry_id, status='waiting').update(
+            status='offered', offered_at=timezone.now(),
+        )
+        WaitlistDay.objects.filter(entry_id=match.entry_id).delete()
+        if claimed:
+            return WaitlistEntry.objects.get(pk=match.entry_id)
+
+
+def backfill_slot(submission):
+    """
+    Offer a cancelled booking's slot to the first eligible waiter. Returns the
+    pending booking created for them, or None.
+    """
+    if submission.preferred_date < timezone.localdate():
+        return None
+
+    with write_transaction():
+        entry = claim_waiter(submission)
+        if entry is None:
+            return None
+        offer = FormSubmission.objects.create(
+            customer_first_name=entry.customer_first_name,
+            customer_last_name=entry.customer_last_name,
+            customer_email=entry.customer_email,
+            customer_phone=entry.customer_phone,
+            location_id=submission.location_id,
+            service_id=submission.service_id,
+            preferred_employee_id=submission.preferred_employee_id or entry.preferred_employee_id,
+            preferred_date=submission.preferred_date,
+            preferred_time=submission.preferred_time,
+            notes=f"Offered from the waitlist (slot freed by booking #{submission.pk})",
+        )
+        WaitlistEntry.objects.filter(pk=entry.pk).update(offered_submission=offer)
+        transaction.on_commit(lambda: send_offer(entry, offer))
+    return offer
+
+
+def send_offer(entry, offer):
+    context = {'entry': entry, 'submission': offer}
+    try:
+        send_mail(
+            render_to_string('booking/emails/waitlist_offer_subject.txt', context).strip(),
+            render_to_string('booking/emails/waitlist_offer.txt', context),
+            settings.DEFAULT_FROM_EMAIL,
+            [entry.customer_email],
+        )
+    except Exception:
+        # The pending booking stands either way; staff can still call the customer
+        logger.exception("Emailing the waitlist offer for booking %s failed", offer.pk)
+
+
+# ============================================================================
+# CANCELLATION RECEIVERS
+# ============================================================================
+
+@receiver(pre_save, sender=FormSubmission)
+def remember_previous_status(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._previous_status = None
+    else:
+        instance._previous_status = (
+            FormSubmission.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=FormSubmission)
+def backfill_cancelled_submission(sender, instance, created, raw=False, **kwargs):
+    previous_status = getattr(instance, '_previous_status', None)
+    if not raw and instance.status == 'cancelled' and previous_status not in (None, 'cancelled'):
+        backfill_slot(instance)
+
+
+@receiver(submissions_bulk_updated)
+def backfill_bulk_cancelled(sender, submission_ids, changes, **kwargs):
+    if changes.get('status') != 'cancelled':
+        return
+    cancelled = FormSubmission.objects.filter(pk__in=submission_ids).order_by('preferred_date', 'preferred_time', 'pk')
+    for submission in cancelled:
+        backfill_slot(submission)
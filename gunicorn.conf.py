@@ -0,0 +1,18 @@
+"""
+Gunicorn settings (read automatically from the working directory).
+
+The application is loaded once in the master and warmed up before workers
+are forked, so each new worker shares the imported code and starts with
+compiled templates and cached catalog data (see beauty_salon/warmup.py).
+"""
+
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master, after the preloaded app is imported and before the
+    # first workers are spawned
+    if server.cfg.preload_app:
+        from beauty_salon.warmup import warm_up
+
+        warm_up()
@@ -0,0 +1,302 @@
+"""
+Read-only JSON API over the live catalog pages, for the mobile app:
+
+    GET /api/v1/services/?fields=service_name,price,image&limit=500
+    GET /api/v1/services/?id=3,7,12
+    GET /api/v1/services/3/
+
+(and the same for ``locations`` and ``employees``).
+
+- ``fields`` picks the fields returned (``*`` for all of them); only the
+  columns behind them are selected.
+- ``id`` fetches a list of pages in one request.
+- Listings are ordered by id and keyset-paginated: ``after`` is the ``next``
+  of the previous response, so every batch costs the same.
+- Image fields are renditions (``rendition``, one of RENDITION_FILTERS),
+  looked up for the whole batch at once; relations are lists of ids, each
+  loaded with one query for the batch.
+
+Responses are cached under the catalog version (home.models.CatalogVersion),
+which publishing, unpublishing, moving or deleting a page, saving or deleting
+an image, or a catalog import bumps in the same transaction (see
+home/signals.py). The version is in the database, so it's the same in every
+process and survives the cache being cleared; it's also in the ETag, so an
+app syncing with If-None-Match gets a 304 until something changes.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.views.decorators.http import require_GET
+from wagtail.images import get_image_model
+from wagtail.images.models import SourceImageIOError
+from wagtail.rich_text import expand_db_html
+
+from home.models import CatalogVersion, EmployeePage, EmployeeSkill, LocationPage, ServiceLocation, ServicePage
+
+CACHE_TIMEOUT = 60 * 60
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+# Rendition filter specs the app may ask for; the first is the default
+RENDITION_FILTERS = ['max-800x800', 'fill-400x400', 'fill-160x160']
+
+
+class ApiError(Exception):
+    pass
+
+
+# ============================================================================
+# FIELDS
+# ============================================================================
+
+class ApiField:
+    """
+    A field of the API's objects. ``columns`` are the model fields it's read
+    from (to select with .only()). Its value is either ``value(page)``, or
+    from ``load(pages, options)``, which returns {page id: value} for a whole
+    batch, for values from other tables.
+    """
+    def __init__(self, columns=(), value=None, load=None):
+        self.columns = list(columns)
+        self.value = value
+        self.load = load
+
+
+def column(name):
+    return ApiField([name], lambda page: getattr(page, name))
+
+
+def decimal_column(name):
+    def value(page):
+        number = getattr(page, name)
+        return None if number is None else str(number)
+    return ApiField([name], value)
+
+
+def rich_text(name):
+    return ApiField([name], lambda page: expand_db_html(getattr(page, name)))
+
+
+def image(name):
+    """A rendition of the image in foreign key ``name``"""
+    def load(pages, options):
+        image_ids = {getattr(page, f'{name}_id') for page in pages} - {None}
+        renditions = {}
+        images = get_image_model().objects.filter(pk__in=image_ids).prefetch_renditions(options['rendition'])
+        for image in images:
+            try:
+                rendition = image.get_rendition(options['rendition'])
+            except SourceImageIOError:
+                continue
+            renditions[image.pk] = {
+                'url': rendition.full_url, 'width': rendition.width, 'height': rendition.height, 'alt': rendition.alt,
+            }
+        return {page.pk: renditions.get(getattr(page, f'{name}_id')) for page in pages}
+    return ApiField([name], load=load)
+
+
+def related_ids(through, owner, target):
+    """The ids of the live ``target`` pages linked to each page through ``through`` rows"""
+    def load(pages, options):
+        ids = {page.pk: [] for page in pages}
+        rows = (
+            through.objects
+            .filter(**{f'{owner}_id__in': ids, f'{target}__live': True})
+            .order_by('sort_order', 'pk')
+            .values_list(f'{owner}_id', f'{target}_id')
+        )
+        for owner_id, target_id in rows:
+            ids[owner_id].append(target_id)
+        return ids
+    return ApiField(load=load)
+
+
+PAGE_FIELDS = {
+    'id': ApiField(['id'], lambda page: page.pk),
+    'title': column('title'),
+    'slug': column('slug'),
+    'url': ApiField(['url_path'], lambda page: page.get_url()),
+    'last_published_at': ApiField(
+        ['last_published_at'], lambda page: page.last_published_at and page.last_published_at.isoformat(),
+    ),
+}
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+# ============================================================================
+# RESOURCES
+# ============================================================================
+
+class Resource:
+    def __init__(self, model, fields, default_fields):
+        self.model = model
+        self.fields = {**PAGE_FIELDS, **fields}
+        self.default_fields = ['id', 'title', *default_fields]
+
+    def parse_fields(self, value):
+        """The field names asked for in ``fields`` (always including id)"""
+        if not value:
+            return self.default_fields
+        if value == '*':
+            return list(self.fields)
+        names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+        return ['id', *(name for name in names if name != 'id')]
+
+    def get_queryset(self, names):
+        columns = {column for name in names for column in self.fields[name].columns}
+        return self.model.objects.live().public().only(*columns).order_by('pk')
+
+    def serialize(self, pages, names, options):
+        loaded = {name: self.fields[name].load(pages, options) for name in names if self.fields[name].load}
+        return [
+            {name: loaded[name][page.pk] if name in loaded else self.fields[name].value(page) for name in names}
+            for page in pages
+        ]
+
+
+RESOURCES = {
+    'services': Resource(
+        ServicePage,
+        {
+            'service_name': column('service_name'),
+            'service_description': rich_text('service_description'),
+            'service_category': column('service_category'),
+            'price': decimal_column('price'),
+            'duration_minutes': column('duration_minutes'),
+            'image': image('service_image'),
+            'location_ids': related_ids(ServiceLocation, 'service', 'location'),
+        },
+        default_fields=['service_name', 'service_category', 'price', 'duration_minutes'],
+    ),
+    'locations': Resource(
+        LocationPage,
+        {
+            'location_name': column('location_name'),
+            'address': column('address'),
+            'latitude': decimal_column('latitude'),
+            'longitude': decimal_column('longitude'),
+            'phone': column('phone'),
+            'email': column('email'),
+            'description': rich_text('description'),
+            'hours': ApiField(
+                [f'{day}_hours' for day in DAYS], lambda page: {day: getattr(page, f'{day}_hours') for day in DAYS},
+            ),
+            'image': image('location_image'),
+        },
+        default_fields=['location_name', 'address', 'latitude', 'longitude'],
+    ),
+    'employees': Resource(
+        EmployeePage,
+        {
+            'first_name': column('first_name'),
+            'last_name': column('last_name'),
+            'full_name': column('full_name'),
+            'job_title': column('job_title'),
+            'email': column('email'),
+            'description': rich_text('description'),
+            'image': image('employee_image'),
+            'work_location_id': ApiField(['work_location'], lambda page: page.work_location_id),
+            'service_ids': related_ids(EmployeeSkill, 'employee', 'service'),
+        },
+        default_fields=['full_name', 'job_title', 'work_location_id'],
+    ),
+}
+
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+
+def parse_ids(value):
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in value.split(',') if pk.strip()))
+    except ValueError:
+        raise ApiError("id must be a comma-separated list of ids")
+    if len(ids) > MAX_LIMIT:
+        raise ApiError(f"At most {MAX_LIMIT} ids at a time")
+    return ids
+
+
+def get_listing(resource, params):
+    """The response data for ``params`` (a QueryDict): {'items': [...], 'next': id or None}"""
+    names = resource.parse_fields(params.get('fields'))
+    options = {'rendition': params.get('rendition', RENDITION_FILTERS[0])}
+    if options['rendition'] not in RENDITION_FILTERS:
+        raise ApiError(f"rendition must be one of: {', '.join(RENDITION_FILTERS)}")
+
+    queryset = resource.get_queryset(names)
+    if 'id' in params:
+        pages = list(queryset.filter(pk__in=parse_ids(params['id'])))
+        return {'items': resource.serialize(pages, names, options), 'next': None}
+
+    try:
+        limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        after = int(params['after']) if params.get('after') else None
+    except ValueError:
+        raise ApiError("limit and after must be numbers")
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    pages = list(queryset[:limit + 1])
+    next_after = pages[limit - 1].pk if len(pages) > limit else None
+    return {'items': resource.serialize(pages[:limit], names, options), 'next': next_after}
+
+
+# ============================================================================
+# CACHING
+# ============================================================================
+
+def response_key(name, params):
+    query = '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+    return hashlib.sha1(f'{CatalogVersion.get()}:{name}:{query}'.encode()).hexdigest()
+
+
+# ============================================================================
+# VIEWS
+# ============================================================================
+
+@require_GET
+def listing(request, resource):
+    """API endpoint for the live pages of ``resource`` (see the module docstring)"""
+    if resource not in RESOURCES:
+        raise Http404
+    return cached_response(request, resource, request.GET)
+
+
+@require_GET
+def detail(request, resource, pk):
+    if resource not in RESOURCES:
+        raise Http404
+    params = request.GET.copy()
+    params['id'] = str(pk)
+    return cached_response(request, resource, params, single=True)
+
+
+def cached_response(request, name, params, single=False):
+    key = response_key(name, params)
+    etag = quote_etag(key)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        data = cache.get(f'api:response:{key}')
+        if data is None:
+            try:
+                data = get_listing(RESOURCES[name], params)
+            except ApiError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            cache.set(f'api:response:{key}', data, CACHE_TIMEOUT)
+        if single:
+            if not data['items']:
+                raise Http404
+            data = data['items'][0]
+        response = JsonResponse(data)
+    response['ETag'] = etag
+    # Shared caches may keep it, but always revalidate, so changes show up
+    # on the next request
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -0,0 +1,322 @@
+"""
+Bulk import of locations, services and employees into the page tree.
+
+Creating pages one by one (``add_child`` + ``save_revision().publish()``)
+costs a tree update, a revision, a publish and a round of signal handlers
+(search indexing, cache purges, pre-rendering, catalog indexes) per page. An
+import instead works per batch:
+
+- tree paths are computed in memory from the parent's last child, and the
+  page rows, the specific rows and the revisions are each inserted with one
+  query per batch;
+- service locations, work locations and skills are resolved by slug (to pages
+  in the same import or already in the tree) and inserted in bulk;
+- no per-page signals are sent. ``catalog_imported`` is sent once, and its
+  receivers refresh the caches and indexes for the whole import.
+
+Pages whose slug already exists under the listing page are skipped, so an
+import can be re-run. Everything is validated before anything is written, and
+the import runs in a transaction.
+"""
+import csv
+import json
+from collections import namedtuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import CharField, F, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.text import slugify
+from wagtail.models import Page, Revision
+
+from home.models import (
+    EmployeePage,
+    EmployeesPage,
+    EmployeeSkill,
+    LocationPage,
+    LocationsPage,
+    ServiceLocation,
+    ServicePage,
+    ServicesPage,
+)
+from home.signals import catalog_imported
+
+# Rows per INSERT
+BATCH_SIZE = 500
+
+LOCATION_FIELDS = [
+    'title', 'slug', 'location_name', 'address', 'latitude', 'longitude', 'phone', 'email', 'description',
+    'monday_hours', 'tuesday_hours', 'wednesday_hours', 'thursday_hours', 'friday_hours',
+    'saturday_hours', 'sunday_hours',
+]
+SERVICE_FIELDS = [
+    'title', 'slug', 'service_name', 'service_description', 'price', 'duration_minutes', 'service_category',
+]
+EMPLOYEE_FIELDS = ['title', 'slug', 'first_name', 'last_name', 'full_name', 'email', 'job_title', 'description']
+
+ImportResult = namedtuple('ImportResult', ['created', 'skipped'])
+
+
+class CatalogImportError(Exception):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid rows")
+        self.errors = errors
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+def read_records(path):
+    """The rows of a .json file (a list of objects) or a .csv file (with a header row)"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            records = json.load(f)
+        else:
+            # Empty cells fall back to the field defaults
+            records = [
+                {key: value.strip() for key, value in row.items() if key and value and value.strip()}
+                for row in csv.DictReader(f)
+            ]
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise CatalogImportError([f"{path}: expected a list of records"])
+    return records
+
+
+def split_slugs(value):
+    """A list of slugs from a JSON list or a ';'-separated CSV cell"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    return [slug.strip() for slug in value if slug.strip()]
+
+
+# ============================================================================
+# IMPORTING
+# ============================================================================
+
+class CatalogImporter:
+    def __init__(self, locations=(), services=(), employees=(), parents=None, batch_size=BATCH_SIZE):
+        """``parents``: listing page to import into by page model (default: the first one in the tree)"""
+        self.records = {LocationPage: list(locations), ServicePage: list(services), EmployeePage: list(employees)}
+        self.parents = parents or {}
+        self.batch_size = batch_size
+        self.errors = []
+
+    def get_parent(self, parent_model, model):
+        parent = self.parents.get(model) or parent_model.objects.order_by('path').first()
+        if parent is None and self.records[model]:
+            self.errors.append(f"No {parent_model._meta.verbose_name} to import {model._meta.verbose_name}s into")
+        return parent
+
+    def error(self, model, row, message):
+        self.errors.append(f"{model._meta.verbose_name}, row {row}: {message}")
+
+    def build_pages(self, model, parent, fields, defaults):
+        """Unsaved, validated pages for the records of ``model`` whose slug is new under ``parent``"""
+        existing = set(parent.get_children().values_list('slug', flat=True)) if parent else set()
+        seen = set()
+        pages, skipped = [], 0
+        for row, record in enumerate(self.records[model], start=1):
+            values = {name: record[name] for name in fields if name in record}
+            defaults(values)
+            values.setdefault('slug', slugify(values.get('title', '')))
+            if values['slug'] in existing:
+                skipped += 1
+                continue
+            if values['slug'] in seen:
+                self.error(model, row, f"duplicate slug '{values['slug']}'")
+                continue
+            seen.add(values['slug'])
+
+            page = model(**values)
+            try:
+                page.clean_fields(exclude=[f.name for f in model._meta.fields if f.name not in fields])
+            except ValidationError as e:
+                for field, messages in e.message_dict.items():
+                    self.error(model, row, f"{field}: {' '.join(messages)}")
+                continue
+            # Imported pages have no comments; saves a query per revision
+            page.wagtail_admin_comments = []
+            page._import_record = record
+            pages.append(page)
+        return pages, skipped
+
+    def resolve(self, model, row, slugs, targets):
+        """The pages for ``slugs`` in ``targets`` (slug -> page), recording unknown slugs as errors"""
+        pages = []
+        for slug in dict.fromkeys(slugs):
+            if slug in targets:
+                pages.append(targets[slug])
+            else:
+                self.error(model, row, f"unknown slug '{slug}'")
+        return pages
+
+    @transaction.atomic
+    def run(self):
+        locations_parent = self.get_parent(LocationsPage, LocationPage)
+        services_parent = self.get_parent(ServicesPage, ServicePage)
+        employees_parent = self.get_parent(EmployeesPage, EmployeePage)
+
+        def location_defaults(values):
+            values.setdefault('title', values.get('location_name', ''))
+
+        def service_defaults(values):
+            values.setdefault('title', values.get('service_name', ''))
+            values.setdefault('service_name', values['title'])
+
+        def employee_defaults(values):
+            name = f"{values.get('first_name', '')} {values.get('last_name', '')}".strip()
+            values.setdefault('title', name)
+            values.setdefault('full_name', name)
+
+        locations, skipped_locations = self.build_pages(LocationPage, locations_parent, LOCATION_FIELDS, location_defaults)
+        services, skipped_services = self.build_pages(ServicePage, services_parent, SERVICE_FIELDS, service_defaults)
+        employees, skipped_employees = self.build_pages(EmployeePage, employees_parent, EMPLOYEE_FIELDS, employee_defaults)
+
+        # References resolve to pages in this import or already in the tree;
+        # new pages only get their ids on insert, so pages are resolved first
+        location_slugs = self.existing_pages(LocationPage, locations_parent)
+        location_slugs.update({page.slug: page for page in locations})
+        service_slugs = self.existing_pages(ServicePage, services_parent)
+        service_slugs.update({page.slug: page for page in services})
+
+        for row, page in enumerate(services, start=1):
+            page._locations = self.resolve(
+                ServicePage, row, split_slugs(page._import_record.get('locations')), location_slugs,
+            )
+        for row, page in enumerate(employees, start=1):
+            work_location = split_slugs(page._import_record.get('work_location'))
+            page._work_location = (self.resolve(EmployeePage, row, work_location, location_slugs) or [None])[0]
+            page._skills = self.resolve(EmployeePage, row, split_slugs(page._import_record.get('skills')), service_slugs)
+
+        if self.errors:
+            raise CatalogImportError(self.errors)
+
+        def relate_service(page):
+            page.service_locations = [
+                ServiceLocation(location_id=location.pk, sort_order=i) for i, location in enumerate(page._locations)
+            ]
+
+        def relate_employee(page):
+            page.work_location_id = page._work_location.pk if page._work_location else None
+            page.skills = [EmployeeSkill(service_id=service.pk, sort_order=i) for i, service in enumerate(page._skills)]
+
+        self.insert_pages(locations_parent, locations)
+        self.insert_pages(services_parent, services, relate_service)
+        ServiceLocation.objects.bulk_create(
+            [service_location for page in services for service_location in page.service_locations.all()],
+            batch_size=self.batch_size,
+        )
+        self.insert_pages(employees_parent, employees, relate_employee)
+        EmployeeSkill.objects.bulk_create(
+            [skill for page in employees for skill in page.skills.all()],
+            batch_size=self.batch_size,
+        )
+
+        created = {LocationPage: len(locations), ServicePage: len(services), EmployeePage: len(employees)}
+        skipped = {LocationPage: skipped_locations, ServicePage: skipped_services, EmployeePage: skipped_employees}
+        page_ids = [page.pk for page in locations + services + employees]
+        if page_ids:
+            catalog_imported.send(sender=self.__class__, page_ids=page_ids)
+        return ImportResult(created, skipped)
+
+    def insert_specific_rows(self, model, pages):
+        """
+        Insert the rows of ``model``'s own table for ``pages``, whose Page rows
+        are already in. One parameterized INSERT, built from the model's
+        fields, run for every page.
+        """
+        connection = connections[router.db_for_write(model)]
+        quote = connection.ops.quote_name
+        fields = model._meta.local_concrete_fields
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        rows = [[field.get_db_prep_save(field.pre_save(page, True), connection) for field in fields] for page in pages]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def existing_pages(self, model, parent):
+        """slug -> page for the ``model`` pages already under ``parent``"""
+        if parent is None:
+            return {}
+        return {page.slug: page for page in model.objects.child_of(parent).only('id', 'slug')}
+
+    def insert_pages(self, parent, pages, relate=None):
+        """
+        Insert ``pages`` as live, published children of ``parent``.
+        ``relate(page)`` sets up a page's relations once it has its id, before
+        its row is inserted.
+        """
+        if not pages:
+            return
+        model = type(pages[0])
+        content_type = ContentType.objects.get_for_model(model)
+        now = timezone.now()
+
+        last_child = parent.get_last_child()
+        position = last_child._get_lastpos_in_path() if last_child else 0
+        for page in pages:
+            position += 1
+            page.path = Page._get_path(parent.path, parent.depth + 1, position)
+            page.depth = parent.depth + 1
+            page.numchild = 0
+            page.url_path = f'{parent.url_path}{page.slug}/'
+            page.draft_title = page.title
+            page.content_type = content_type
+            page.locale_id = parent.locale_id
+            page.live = True
+            page.has_unpublished_changes = False
+            page.first_published_at = page.last_published_at = page.latest_revision_created_at = now
+
+        # bulk_create() doesn't support multi-table inheritance: insert the
+        # page rows, then the specific rows with the new page ids
+        base_fields = [field.attname for field in Page._meta.concrete_fields]
+        for start in range(0, len(pages), self.batch_size):
+            batch = pages[start:start + self.batch_size]
+            rows = Page.objects.bulk_create([Page(**{name: getattr(page, name) for name in base_fields}) for page in batch])
+            for page, row in zip(batch, rows):
+                page.id = page.page_ptr_id = row.pk
+                if relate:
+                    relate(page)
+            self.insert_specific_rows(model, batch)
+        Page.objects.filter(pk=parent.pk).update(numchild=F('numchild') + len(pages))
+
+        base_content_type = ContentType.objects.get_for_model(Page)
+        revisions = Revision.objects.bulk_create(
+            [
+                Revision(
+                    content_type=content_type,
+                    base_content_type=base_content_type,
+                    object_id=str(page.pk),
+                    created_at=now,
+                    object_str=str(page),
+                    content=page.serializable_data(),
+                )
+                for page in pages
+            ],
+            batch_size=self.batch_size,
+        )
+        for page, revision in zip(pages, revisions):
+            page.latest_revision_id = page.live_revision_id = revision.pk
+        # One UPDATE per batch; bulk_update()'s CASE per row is much slower
+        revision_id = Subquery(
+            Revision.objects.filter(
+                base_content_type=base_content_type, object_id=Cast(OuterRef('pk'), CharField()),
+            ).values('pk')[:1]
+        )
+        for start in range(0, len(pages), self.batch_size):
+            Page.objects.filter(pk__in=[page.pk for page in pages[start:start + self.batch_size]]).update(
+                latest_revision_id=revision_id, live_revision_id=revision_id,
+            )
+
+
+def import_catalog(locations=(), services=(), employees=(), parents=None, batch_size=BATCH_SIZE):
+    """Import the records; returns ImportResult(created, skipped), dicts by page model"""
+    return CatalogImporter(locations, services, employees, parents, batch_size).run()
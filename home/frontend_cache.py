@@ -0,0 +1,228 @@
+"""
+Cache headers and targeted purging for a front-end (reverse proxy / CDN) cache.
+
+Page responses that are the same for every anonymous visitor get
+``Cache-Control: public, max-age=0, s-maxage=FRONTEND_CACHE_MAX_AGE`` and a
+surrogate-key header (FRONTEND_CACHE_KEY_HEADER) naming what the response
+shows: the page itself, its parent (which also covers listed children and
+siblings), a page type key for catalog pages named in numbers (e.g. location
+names on service cards) and pages picked in chooser blocks, so the header
+stays short however long a listing is. When a page is published,
+unpublished, moved or deleted, its key, its parent's (whose listing changed)
+and its page type key are purged through the FRONTEND_CACHE_PURGER backend, so
+the proxy can cache for a long time without serving stale content.
+"""
+import logging
+import urllib.error
+import urllib.request
+from itertools import islice
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.cache import patch_cache_control
+from django.utils.module_loading import import_string
+from wagtail.blocks import StreamValue, StructValue
+from wagtail.blocks.list_block import ListValue
+from wagtail.fields import StreamField
+from wagtail.models import Page
+
+from home.models import EmployeePage, EmployeesPage, LocationPage, PaginatedListingMixin, ServicePage
+
+logger = logging.getLogger(__name__)
+
+# Carried by every cacheable page response, to purge the whole site at once
+ALL_PAGES_KEY = 'pages'
+
+
+def page_key(page_id):
+    return f'page-{page_id}'
+
+
+def type_key(model):
+    """Carried by responses showing pages of ``model`` that aren't tagged one by one"""
+    return f'type-{model._meta.model_name}'
+
+
+# ============================================================================
+# KEYS
+# ============================================================================
+
+def chosen_pages(value):
+    """Pages picked anywhere inside a StreamField value"""
+    if isinstance(value, Page):
+        yield value
+    elif isinstance(value, StreamValue):
+        for child in value:
+            yield from chosen_pages(child.value)
+    elif isinstance(value, StructValue):
+        for child_value in value.values():
+            yield from chosen_pages(child_value)
+    elif isinstance(value, (ListValue, list, tuple)):
+        for child_value in value:
+            yield from chosen_pages(child_value)
+
+
+def referenced_page_ids(page):
+    """
+    Ids of the pages whose content appears in ``page``'s response and isn't
+    covered by its parent's key or a type key
+    """
+    # Listing cards (children) and the sidebar of other services (siblings)
+    # need no keys of their own: publishing them purges this page's key or
+    # the parent's
+    page_ids = {page.pk}
+    parent_path = page.path[:-page.steplen]
+    page_ids |= set(Page.objects.filter(path=parent_path).values_list('pk', flat=True))
+
+    if isinstance(page, EmployeePage) and page.work_location_id:
+        page_ids.add(page.work_location_id)
+
+    for field in page._meta.fields:
+        if isinstance(field, StreamField):
+            for chosen in chosen_pages(getattr(page, field.name)):
+                page_ids.add(chosen.pk)
+                if getattr(chosen, 'work_location_id', None):
+                    page_ids.add(chosen.work_location_id)
+    return page_ids
+
+
+def referenced_types(page):
+    """Page types named on ``page`` in numbers, tagged by type_key() instead of page by page"""
+    if isinstance(page, (PaginatedListingMixin, EmployeesPage, ServicePage)):
+        # The location names on service and employee cards, and the locations
+        # offering a service
+        return [LocationPage]
+    return []
+
+
+def get_surrogate_keys(page):
+    return [
+        ALL_PAGES_KEY,
+        *(type_key(model) for model in referenced_types(page)),
+        *(page_key(page_id) for page_id in sorted(referenced_page_ids(page))),
+    ]
+
+
+# ============================================================================
+# RESPONSE HEADERS
+# ============================================================================
+
+def is_shared_cacheable(request, response, page):
+    """True if ``response`` is the same for every anonymous visitor"""
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+        return False
+    if getattr(request, 'is_preview', False):
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return False
+    session = getattr(request, 'session', None)
+    if (
+        response.cookies
+        # The CSRF/session cookies are only added further out in the middleware stack
+        or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        or (session is not None and session.modified)
+    ):
+        return False
+    return not page.get_view_restrictions().exists()
+
+
+class FrontendCacheMiddleware:
+    """Adds Cache-Control and surrogate-key headers to Wagtail page responses"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # Set by the before_serve_page hook in home/wagtail_hooks.py
+        page = getattr(request, 'frontend_cache_page', None)
+        if page is None or response.has_header('Cache-Control'):
+            return response
+
+        if is_shared_cacheable(request, response, page):
+            patch_cache_control(response, public=True, max_age=0, s_maxage=settings.FRONTEND_CACHE_MAX_AGE)
+            response[settings.FRONTEND_CACHE_KEY_HEADER] = ' '.join(get_surrogate_keys(page))
+        else:
+            patch_cache_control(response, private=True, max_age=0)
+        return response
+
+
+# ============================================================================
+# PURGERS
+# ============================================================================
+
+class BasePurger:
+    """Purges front-end cache entries tagged with any of the given keys"""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def purge_keys(self, keys):
+        raise NotImplementedError
+
+
+class LocalPurger(BasePurger):
+    """Logs purges without contacting anything; for development and tests"""
+
+    def purge_keys(self, keys):
+        logger.info("Front-end cache purge: %s", ' '.join(sorted(keys)))
+
+
+class HTTPPurger(BasePurger):
+    """
+    Sends the keys to a purge endpoint in a request header, e.g. Varnish
+    xkey (``METHOD: PURGE``, ``KEY_HEADER: xkey``) or Fastly's purge API
+    (``METHOD: POST``, ``KEY_HEADER: Surrogate-Key``, ``HEADERS: {"Fastly-Key": ...}``).
+    """
+
+    def purge_keys(self, keys):
+        keys = iter(sorted(keys))
+        batch_size = self.options.get('BATCH_SIZE', 256)
+        while batch := list(islice(keys, batch_size)):
+            purge_request = urllib.request.Request(
+                self.options['URL'],
+                method=self.options.get('METHOD', 'PURGE'),
+                headers={
+                    **self.options.get('HEADERS', {}),
+                    self.options.get('KEY_HEADER', 'Surrogate-Key'): ' '.join(batch),
+                },
+            )
+            try:
+                with urllib.request.urlopen(purge_request, timeout=self.options.get('TIMEOUT', 5)):
+                    pass
+            except (urllib.error.URLError, TimeoutError):
+                # Publishing must not fail because the cache is unreachable;
+                # entries still expire after FRONTEND_CACHE_MAX_AGE
+                logger.exception("Front-end cache purge failed for %d keys", len(batch))
+
+
+_purger = None
+
+
+def get_purger():
+    global _purger
+    if _purger is None:
+        config = settings.FRONTEND_CACHE_PURGER
+        _purger = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _purger
+
+
+@receiver(setting_changed)
+def reset_purger(setting, **kwargs):
+    global _purger
+    if setting == 'FRONTEND_CACHE_PURGER':
+        _purger = None
+
+
+def purge_pages(*pages):
+    """Purge responses showing any of ``pages``, or listing their parents' children"""
+    keys = set()
+    for page in pages:
+        keys.add(page_key(page.pk))
+        parent_path = page.path[:-page.steplen]
+        keys |= {page_key(pk) for pk in Page.objects.filter(path=parent_path).values_list('pk', flat=True)}
+        if page.specific_class is not None:
+            keys.add(type_key(page.specific_class))
+    get_purger().purge_keys(keys)
@@ -0,0 +1,95 @@
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from wagtail.models import Page
+
+from home.catalog_import import import_catalog
+from home.models import EmployeePage, EmployeesPage, LocationPage, LocationsPage, ServicePage, ServicesPage
+
+
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a bulk catalog import of generated pages against creating and "
+        "publishing pages one by one. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=10000, help="Pages to bulk import")
+        parser.add_argument(
+            "--one-by-one", type=int, default=200,
+            help="Pages to create one by one (the rate is extrapolated to --pages)",
+        )
+
+    def handle(self, *args, **options):
+        pages = options["pages"]
+        # Roughly one location per 40 pages, with 10 services and 30 employees each
+        location_count = max(1, pages // 40)
+        service_count = location_count * 10
+        employee_count = pages - location_count - service_count
+        locations = [
+            {"location_name": f"Salon {i}", "slug": f"salon-{i}", "address": f"{i} Main Street"}
+            for i in range(location_count)
+        ]
+        services = [
+            {
+                "service_name": f"Service {i}", "slug": f"service-{i}", "price": "45.00", "duration_minutes": 60,
+                "locations": [f"salon-{i % location_count}", f"salon-{(i + 1) % location_count}"],
+            }
+            for i in range(service_count)
+        ]
+        employees = [
+            {
+                "first_name": "Employee", "last_name": str(i), "slug": f"employee-{i}", "job_title": "Stylist",
+                "work_location": f"salon-{i % location_count}",
+                "skills": [f"service-{i % service_count}", f"service-{(i * 7) % service_count}"],
+            }
+            for i in range(employee_count)
+        ]
+
+        with rolled_back():
+            parents = dict(zip([LocationPage, ServicePage, EmployeePage], self.create_listing_pages()))
+            start = time.perf_counter()
+            result = import_catalog(locations, services, employees, parents=parents)
+            bulk_seconds = time.perf_counter() - start
+        created = sum(result.created.values())
+        self.stdout.write(
+            f"Bulk import: {created} pages ({location_count} locations, {service_count} services, "
+            f"{employee_count} employees) in {bulk_seconds:.1f}s ({created / bulk_seconds:.0f} pages/s)"
+        )
+
+        count = options["one_by_one"]
+        if count:
+            with rolled_back():
+                services_page, employees_page = self.create_listing_pages()[1:]
+                start = time.perf_counter()
+                for i in range(count):
+                    if i % 2:
+                        page = ServicePage(title=f"Service {i}", price=Decimal("45.00"), duration_minutes=60)
+                        services_page.add_child(instance=page)
+                    else:
+                        page = EmployeePage(title=f"Employee {i}", first_name="Employee", last_name=str(i), job_title="Stylist")
+                        employees_page.add_child(instance=page)
+                    page.save_revision().publish()
+                seconds = time.perf_counter() - start
+            self.stdout.write(
+                f"One by one:  {count} pages in {seconds:.1f}s ({count / seconds:.0f} pages/s, "
+                f"~{pages * seconds / count:.0f}s for {pages})"
+            )
+
+    def create_listing_pages(self):
+        """Empty listing pages to import into"""
+        root = Page.get_first_root_node()
+        return [
+            root.add_child(instance=model(title=f"Benchmark {model._meta.verbose_name}", slug=f"benchmark-{slug}"))
+            for model, slug in [(LocationsPage, "locations"), (ServicesPage, "services"), (EmployeesPage, "team")]
+        ]
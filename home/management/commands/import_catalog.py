@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.catalog_import import BATCH_SIZE, CatalogImportError, import_catalog, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Import locations, services and employees from CSV or JSON files as "
+        "live pages under the locations, services and employees listing pages. "
+        "Services link to locations with a 'locations' column, employees with "
+        "'work_location' and 'skills' (slugs, ';'-separated in CSV). Pages "
+        "whose slug already exists are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--locations", metavar="FILE", help=".csv or .json file of locations")
+        parser.add_argument("--services", metavar="FILE", help=".csv or .json file of services")
+        parser.add_argument("--employees", metavar="FILE", help=".csv or .json file of employees")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows per insert")
+
+    def handle(self, *args, **options):
+        if not any(options[kind] for kind in ("locations", "services", "employees")):
+            raise CommandError("Give at least one of --locations, --services and --employees.")
+
+        start = time.perf_counter()
+        try:
+            records = {
+                kind: read_records(options[kind]) if options[kind] else []
+                for kind in ("locations", "services", "employees")
+            }
+            result = import_catalog(batch_size=options["batch_size"], **records)
+        except CatalogImportError as e:
+            for error in e.errors[:50]:
+                self.stderr.write(error)
+            raise CommandError(f"Nothing was imported: {len(e.errors)} errors.")
+
+        for model, created in result.created.items():
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural.capitalize()}: {created} created, "
+                f"{result.skipped[model]} already existed"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {sum(result.created.values())} pages in {time.perf_counter() - start:.1f}s."
+        ))
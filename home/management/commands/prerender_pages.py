@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from wagtail.models import Page
+
+from home import prerender
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the live home, listing and catalog pages to static HTML files "
+        "(STATIC_PRERENDER_ROOT) for the web server to serve directly"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", metavar="DIR",
+            help="Directory to write to (default: STATIC_PRERENDER_ROOT)",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Number of processes to render with",
+        )
+        parser.add_argument(
+            "--page", nargs="+", type=int, metavar="ID", dest="page_ids",
+            help="Only re-render these pages and the pages that show them, in place",
+        )
+        parser.add_argument(
+            "--queued", action="store_true",
+            help="Render the pages queued after publishing (STATIC_PRERENDER_ON_PUBLISH), in place",
+        )
+        parser.add_argument(
+            "--every", type=int, metavar="SECONDS",
+            help="With --queued, keep running, rendering queued pages every SECONDS",
+        )
+
+    def handle(self, *args, **options):
+        root = options["output"] or prerender.get_output_root()
+        if prerender.get_default_site() is None:
+            raise CommandError("No default site is configured.")
+
+        if options["queued"]:
+            while True:
+                rendered, skipped = prerender.process_queue(root, workers=options["workers"])
+                if rendered or skipped or not options["every"]:
+                    self.report(root, rendered, skipped)
+                if not options["every"]:
+                    return
+                time.sleep(options["every"])
+
+        if options["page_ids"]:
+            page_ids = set()
+            for page in Page.objects.filter(pk__in=options["page_ids"]):
+                page_ids |= prerender.affected_page_ids(page)
+            rendered, skipped = prerender.build_pages(page_ids, root, options["workers"])
+        else:
+            rendered, skipped = prerender.build_site(root, options["workers"])
+        self.report(root, rendered, skipped)
+
+    def report(self, root, rendered, skipped):
+        self.stdout.write(self.style.SUCCESS(f"Rendered {len(rendered)} pages into {root}."))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {len(skipped)} pages that didn't render as plain HTML (ids: "
+                f"{', '.join(map(str, skipped))}); Django will keep serving them."
+            ))
@@ -0,0 +1,63 @@
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: this process has already imported everything
+PROFILE_SCRIPT = "import cProfile, sys; cProfile.run('import beauty_salon.wsgi', sys.argv[1])"
+
+
+def module_label(filename):
+    """Short, readable name for a module's source file"""
+    if filename.startswith(settings.BASE_DIR + os.sep):
+        return os.path.relpath(filename, settings.BASE_DIR)
+    marker = f"site-packages{os.sep}"
+    return filename.split(marker, 1)[-1] if marker in filename else filename
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile what a new worker pays to import beauty_salon.wsgi (Django setup "
+        "included) and list the most expensive module imports"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument(
+            "--project-only", action="store_true", help="Only list this project's own modules",
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profile_path = os.path.join(tmpdir, "startup.prof")
+            try:
+                subprocess.run(
+                    [sys.executable, "-c", PROFILE_SCRIPT, profile_path],
+                    cwd=settings.BASE_DIR, check=True, capture_output=True, text=True,
+                )
+            except subprocess.CalledProcessError as exc:
+                raise CommandError(f"Importing beauty_salon.wsgi failed:\n{exc.stderr}")
+            stats = pstats.Stats(profile_path)
+
+        # Each module body is a "<module>" entry; its cumulative time includes
+        # everything it imports
+        modules = [
+            (cumulative, filename)
+            for (filename, lineno, function), (cc, nc, tt, cumulative, callers) in stats.stats.items()
+            if function == "<module>"
+        ]
+        if options["project_only"]:
+            modules = [
+                (cumulative, filename) for cumulative, filename in modules
+                if filename.startswith(settings.BASE_DIR + os.sep)
+            ]
+        modules.sort(reverse=True)
+
+        self.stdout.write(f"Total (under the profiler): {stats.total_tt * 1000:.0f} ms\n")
+        self.stdout.write(f"{'cumulative ms':>14}  module")
+        for cumulative, filename in modules[:options["limit"]]:
+            self.stdout.write(f"{cumulative * 1000:>14.1f}  {module_label(filename)}")
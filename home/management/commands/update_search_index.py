@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from home import search_index
+from home.models import SearchIndexState
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the queued search index updates to the search backends in "
+        "batches, or (--all) check every indexed object and remove the ones "
+        "that are gone. Objects whose indexed content hasn't changed since they "
+        "were last indexed are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Queued objects per batch")
+        parser.add_argument(
+            "--every", type=int, metavar="SECONDS",
+            help="Keep running, sending queued updates every SECONDS",
+        )
+        parser.add_argument("--all", action="store_true", help="Check every indexed object, not just the queue")
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="With --all, number of processes to index the page tree with",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="With --all, re-send unchanged objects too (e.g. after the index was reset)",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the queued updates")
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            queued = SearchIndexState.objects.filter(queued_at__isnull=False).count()
+            self.stdout.write(f"{queued} objects queued")
+            return
+
+        if options["all"]:
+            start = time.perf_counter()
+            pages_checked, pages_sent = search_index.update_pages(options["workers"], options["force"])
+            others_checked, others_sent = search_index.update_other_models(options["force"])
+            removed = search_index.remove_stale()
+            self.stdout.write(self.style.SUCCESS(
+                f"Indexed {pages_sent + others_sent} of {pages_checked + others_checked} objects "
+                f"({pages_checked} pages), removed {removed} gone, in {time.perf_counter() - start:.1f}s "
+                f"(unchanged objects are skipped)."
+            ))
+            return
+
+        while True:
+            sent, skipped, removed = search_index.process_queue(batch_size=options["batch_size"])
+            if sent or skipped or removed or not options["every"]:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Indexed {sent} objects, skipped {skipped} unchanged, removed {removed}."
+                ))
+            if not options["every"]:
+                break
+            time.sleep(options["every"])
@@ -0,0 +1,135 @@
+import queue
+import statistics
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+from wagtail.models import Page
+
+from booking.throttling import EXEMPT_ENVIRON_KEY
+from home import prerender
+from home.models import LocationPage, PaginatedListingMixin
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every live page, listing fragment and per-location booking API "
+        "URL in-process to warm the caches (and rendition files) after a deploy, "
+        "and report per-URL timings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Number of requests in flight at once",
+        )
+        parser.add_argument(
+            "--skip-fragments", action="store_true", help="Don't request listing 'show more' fragments",
+        )
+        parser.add_argument(
+            "--skip-api", action="store_true", help="Don't request the booking APIs",
+        )
+        parser.add_argument(
+            "--slowest", type=int, metavar="N",
+            help="Only list the N slowest URLs (default: all, in crawl order)",
+        )
+
+    def handle(self, *args, **options):
+        site = prerender.get_default_site()
+        if site is None:
+            raise CommandError("No default site is configured.")
+
+        urls = list(self.collect_urls(site, options))
+        start = time.perf_counter()
+        results = self.crawl(site, urls, options["concurrency"])
+        elapsed = time.perf_counter() - start
+
+        listed = results
+        if options["slowest"]:
+            listed = sorted(results, key=lambda result: result["ms"], reverse=True)[:options["slowest"]]
+        self.stdout.write(f"{'status':>6} {'ms':>8} {'bytes':>9}  url")
+        for result in listed:
+            line = f"{result['status']:>6} {result['ms']:>8.1f} {result['bytes']:>9}  {result['url']}"
+            self.stdout.write(self.style.ERROR(line) if result["failed"] else line)
+
+        timings = [result["ms"] for result in results]
+        failed = [result for result in results if result["failed"]]
+        summary = f"\n{len(results)} URLs in {elapsed:.1f}s"
+        if len(timings) >= 2:
+            cuts = statistics.quantiles(timings, n=100, method="inclusive")
+            summary += f", p50 {cuts[49]:.1f} ms, p95 {cuts[94]:.1f} ms, max {max(timings):.1f} ms"
+        self.stdout.write(summary)
+        if failed:
+            raise CommandError(f"{len(failed)} URLs failed.")
+
+    def collect_urls(self, site, options):
+        pages = (
+            Page.objects.live().public()
+            .descendant_of(site.root_page, inclusive=True)
+            .specific().order_by("path")
+        )
+        for page in pages:
+            url = prerender.page_url(prerender.page_path_for_url_path(site, page.url_path))
+            yield url
+            if isinstance(page, PaginatedListingMixin) and not options["skip_fragments"]:
+                items, after = page.get_listing_batch(size=page.listing_initial_size)
+                while after:
+                    yield f"{url}?{urlencode({'after': after})}"
+                    items, after = page.get_listing_batch(after=after)
+
+        if not options["skip_api"]:
+            locations = LocationPage.objects.live().descendant_of(site.root_page).order_by("path")
+            for location_id in locations.values_list("id", flat=True):
+                query = urlencode({"location_id": location_id})
+                yield f"{reverse('booking:services_by_location')}?{query}"
+                yield f"{reverse('booking:employees_by_location')}?{query}"
+
+    def crawl(self, site, urls, concurrency):
+        """Fetch ``urls`` with up to ``concurrency`` threads; results in crawl order"""
+        url_queue = queue.SimpleQueue()
+        for index, url in enumerate(urls):
+            url_queue.put((index, url))
+        results = [None] * len(urls)
+
+        def worker(close_connections=True):
+            # The booking APIs are rate limited per client, and every request
+            # here comes from the same one
+            client = prerender.get_client(site, **{EXEMPT_ENVIRON_KEY: True})
+            try:
+                while True:
+                    try:
+                        index, url = url_queue.get_nowait()
+                    except queue.Empty:
+                        return
+                    results[index] = self.fetch(client, site, url)
+            finally:
+                if close_connections:
+                    connections.close_all()
+
+        if concurrency <= 1:
+            worker(close_connections=False)
+        else:
+            threads = [threading.Thread(target=worker) for _ in range(min(concurrency, len(urls)))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def fetch(self, client, site, url):
+        start = time.perf_counter()
+        try:
+            response = client.get(url, secure=site.port == 443)
+        except Exception as exc:
+            status, size = type(exc).__name__, 0
+        else:
+            status, size = response.status_code, len(response.content)
+        return {
+            "url": url,
+            "status": status,
+            "ms": (time.perf_counter() - start) * 1000,
+            "bytes": size,
+            "failed": not isinstance(status, int) or status >= 400,
+        }
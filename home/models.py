@@ -1,5 +1,14 @@
+import hashlib
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import F, Prefetch, Q
 from django import forms
+from django.http import Http404
+from django.template.response import TemplateResponse
 from wagtail.models import Page, Orderable
 from wagtail.fields import RichTextField, StreamField
 from wagtail.admin.panels import FieldPanel, MultiFieldPanel, InlinePanel
@@ -95,6 +104,64 @@ class HeroMixin(models.Model):
         abstract = True
 
 
+class PaginatedListingMixin:
+    """
+    Mixin for listing pages that render their live children as cards.
+    Only the first ``listing_initial_size`` children are rendered with the page;
+    "Show more" requests ``?after=<path>`` and gets the next batch back as an
+    HTML fragment. Batches are keyset-paginated on the tree ``path``, so each
+    request costs the same no matter how deep into the listing it is.
+    """
+    listing_initial_size = 3
+    listing_page_size = 9
+    listing_card_template = None
+
+    def get_listing_queryset(self):
+        """Live children in tree order; override to add select/prefetch_related"""
+        return self.get_children().live().specific()
+
+    def get_listing_filters(self, request):
+        """
+        Filters and sort order from the query string, passed on to
+        get_listing_batch() as keyword arguments; none by default
+        """
+        return {}
+
+    def get_listing_batch(self, after=None, size=None):
+        """Return (items, next_after) for the batch following path ``after``"""
+        size = size or self.listing_page_size
+        queryset = self.get_listing_queryset().order_by('path')
+        if after:
+            queryset = queryset.filter(path__gt=after)
+        items = list(queryset[:size + 1])
+        next_after = items[size - 1].path if len(items) > size else None
+        return items[:size], next_after
+
+    def get_context(self, request, *args, **kwargs):
+        context = super().get_context(request, *args, **kwargs)
+        filters = self.get_listing_filters(request)
+        items, next_after = self.get_listing_batch(size=self.listing_initial_size, **filters)
+        context['listing_items'] = items
+        context['listing_next'] = next_after
+        context['listing_filters'] = filters
+        context['listing_card_template'] = self.listing_card_template
+        return context
+
+    def serve(self, request, *args, **kwargs):
+        after = request.GET.get('after')
+        if after is None:
+            return super().serve(request, *args, **kwargs)
+
+        items, next_after = self.get_listing_batch(after=after[:255], **self.get_listing_filters(request))
+        response = TemplateResponse(request, 'includes/listing_cards.html', {
+            'page': self,
+            'listing_items': items,
+            'listing_card_template': self.listing_card_template,
+        })
+        response['X-Listing-Next'] = next_after or ''
+        return response
+
+
 class FeatureBlock(blocks.StructBlock):
     image = ImageChooserBlock()
     title = blocks.CharBlock(max_length=100)
@@ -353,6 +420,7 @@ class EmployeePage(HeroMixin, Page):
             FieldPanel('job_title'),
             FieldPanel('work_location'),
         ], heading="Contact & Position"),
+        InlinePanel('skills', label="Services", help_text="Services this employee performs (leave empty for all services)"),
         FieldPanel('description'),
     ]
 
@@ -382,10 +450,11 @@ class EmployeePage(HeroMixin, Page):
         verbose_name = "Employee Page"
 
 
-class LocationsPage(HeroMixin, Page):
+class LocationsPage(PaginatedListingMixin, HeroMixin, Page):
     """
     Parent page for all location pages. This page displays a listing of all locations.
     """
+    listing_card_template = 'includes/location_card.html'
     intro = RichTextField(blank=True, help_text="Introduction text for the locations page")
     
     content_panels = Page.content_panels + [
@@ -395,6 +464,9 @@ class LocationsPage(HeroMixin, Page):
 
     # Constrain child pages to only LocationPage
     subpage_types = ['home.LocationPage']
+
+    def get_listing_queryset(self):
+        return LocationPage.objects.child_of(self).live().select_related('location_image')
     
     class Meta:
         verbose_name = "Locations Page"
@@ -407,6 +479,23 @@ class LocationPage(HeroMixin, Page):
     # Basic location information
     location_name = models.CharField(max_length=100, help_text="Location name (e.g. 'Downtown Salon')")
     address = models.TextField(help_text="Full address of this location")
+    # Coordinates for the nearest-location lookup (booking.nearest)
+    latitude = models.DecimalField(
+        max_digits=8,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        help_text="Latitude in decimal degrees (e.g. 40.712776)"
+    )
+    longitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        help_text="Longitude in decimal degrees (e.g. -74.005974)"
+    )
     phone = models.CharField(max_length=20, blank=True, help_text="Contact phone number")
     email = models.EmailField(blank=True, help_text="Contact email")
     
@@ -454,6 +543,8 @@ class LocationPage(HeroMixin, Page):
         MultiFieldPanel([
             FieldPanel('location_name'),
             FieldPanel('address'),
+            FieldPanel('latitude'),
+            FieldPanel('longitude'),
         ], heading="Location Information"),
         FieldPanel('location_image'),
         MultiFieldPanel([
@@ -494,8 +585,22 @@ class LocationPage(HeroMixin, Page):
 # SERVICES PAGE MODELS - Page-based Service Management
 # ============================================================================
 
-class ServicesPage(HeroMixin, Page):
-    """Listing page for all services"""
+class ServicesPage(PaginatedListingMixin, HeroMixin, Page):
+    """
+    Listing page for all services, filterable by ``?category=`` and
+    ``?location=<id>`` and sortable by price or duration with ``?sort=``
+    """
+    listing_card_template = 'includes/service_card.html'
+    # ?sort= options: key -> (label, field, descending)
+    SORT_OPTIONS = {
+        'price': ('Price: low to high', 'price', False),
+        '-price': ('Price: high to low', 'price', True),
+        'duration': ('Duration: shortest first', 'duration_minutes', False),
+        '-duration': ('Duration: longest first', 'duration_minutes', True),
+    }
+    # Batches are cached (as page ids) per filter combination, until the
+    # catalog changes
+    LISTING_CACHE_TIMEOUT = 60 * 60
     intro = RichTextField(
         blank=True, 
         help_text="Introduction text for the services page"
@@ -508,6 +613,87 @@ class ServicesPage(HeroMixin, Page):
     
     # Only ServicePage can be created under this page
     subpage_types = ['home.ServicePage']
+
+    def get_context(self, request, *args, **kwargs):
+        context = super().get_context(request, *args, **kwargs)
+        context['category_choices'] = ServicePage.CATEGORY_CHOICES
+        context['location_choices'] = LocationPage.objects.live().order_by('location_name').only('id', 'location_name')
+        context['sort_choices'] = [(key, label) for key, (label, field, descending) in self.SORT_OPTIONS.items()]
+        return context
+
+    def get_listing_filters(self, request):
+        # Unknown values are ignored rather than refused
+        category = request.GET.get('category', '')
+        location = request.GET.get('location', '')
+        sort = request.GET.get('sort', '')
+        return {
+            'category': category if category in dict(ServicePage.CATEGORY_CHOICES) else '',
+            'location': int(location) if location.isdigit() else None,
+            'sort': sort if sort in self.SORT_OPTIONS else '',
+        }
+
+    def get_listing_queryset(self):
+        # The locations of the whole batch in one query
+        return (
+            ServicePage.objects.child_of(self).live()
+            .select_related('service_image')
+            .prefetch_related(
+                Prefetch('service_locations', queryset=ServiceLocation.objects.select_related('location'))
+            )
+        )
+
+    def filter_listing_queryset(self, queryset, category='', location=None):
+        if category:
+            queryset = queryset.filter(service_category=category)
+        if location:
+            queryset = queryset.filter(
+                pk__in=ServiceLocation.objects.filter(location_id=location).values('service_id')
+            )
+        return queryset
+
+    def get_listing_batch(self, after=None, size=None, category='', location=None, sort=''):
+        """
+        Return (items, next_after) like PaginatedListingMixin.get_listing_batch.
+        When sorted, ``after`` is "<value>|<path>" of the last item shown, and
+        services with the same value are in tree order.
+        """
+        # Keyed on the catalog version in the database, which every process
+        # sees bumped once a publish commits, so no process serves stale ids
+        size = size or self.listing_page_size
+        key = 'home:services-listing:' + hashlib.sha1(
+            f'{CatalogVersion.get()}:{self.pk}:{category}:{location}:{sort}:{after}:{size}'.encode()
+        ).hexdigest()
+        cached = cache.get(key)
+        if cached is not None:
+            ids, next_after = cached
+            items = self.get_listing_queryset().in_bulk(ids)
+            return [items[pk] for pk in ids if pk in items], next_after
+
+        queryset = self.filter_listing_queryset(self.get_listing_queryset(), category, location)
+        if sort:
+            label, field, descending = self.SORT_OPTIONS[sort]
+            queryset = queryset.order_by(f'-{field}' if descending else field, 'path')
+            if after:
+                value, _, path = after.partition('|')
+                try:
+                    value = ServicePage._meta.get_field(field).to_python(value)
+                except ValidationError:
+                    raise Http404
+                beyond = Q(**{f'{field}__lt' if descending else f'{field}__gt': value})
+                queryset = queryset.filter(beyond | Q(**{field: value, 'path__gt': path}))
+        else:
+            queryset = queryset.order_by('path')
+            if after:
+                queryset = queryset.filter(path__gt=after)
+
+        items = list(queryset[:size + 1])
+        next_after = None
+        if len(items) > size:
+            last = items[size - 1]
+            next_after = f'{getattr(last, field)}|{last.path}' if sort else last.path
+        items = items[:size]
+        cache.set(key, ([item.pk for item in items], next_after), self.LISTING_CACHE_TIMEOUT)
+        return items, next_after
     
     class Meta:
         verbose_name = "Services Page"
@@ -623,6 +809,13 @@ class ServicePage(HeroMixin, Page):
     
     class Meta:
         verbose_name = "Service Page"
+        indexes = [
+            # Filtering and sorting the services listing (see ServicesPage.get_listing_batch)
+            models.Index(fields=['service_category', 'price'], name='home_svc_category_price_idx'),
+            models.Index(fields=['service_category', 'duration_minutes'], name='home_svc_category_dur_idx'),
+            models.Index(fields=['price'], name='home_svc_price_idx'),
+            models.Index(fields=['duration_minutes'], name='home_svc_duration_idx'),
+        ]
 
 
 class ServiceLocation(Orderable):
@@ -650,3 +843,129 @@ class ServiceLocation(Orderable):
     
     class Meta:
         unique_together = ('service', 'location')
+
+
+class EmployeeSkill(Orderable):
+    """
+    A service an employee performs. An employee without any is taken to
+    perform every service (see booking.eligibility).
+    """
+    employee = ParentalKey(
+        'EmployeePage',
+        on_delete=models.CASCADE,
+        related_name='skills'
+    )
+    service = models.ForeignKey(
+        'ServicePage',
+        on_delete=models.CASCADE,
+        related_name='employee_skills',
+        help_text="Service this employee performs"
+    )
+
+    panels = [
+        FieldPanel('service'),
+    ]
+
+    def __str__(self):
+        return f"{self.employee.display_name}: {self.service.display_name}"
+
+    class Meta:
+        unique_together = ('employee', 'service')
+
+
+# ============================================================================
+# SEARCH INDEXING
+# ============================================================================
+
+class SearchIndexState(models.Model):
+    """
+    Search indexing state of one indexed object (page, image, document...):
+    the checksum of the content last sent to the search backends, and the
+    update waiting to be sent, if any. One row per object, so queuing the same
+    object again only moves ``queued_at``. See home/search_index.py.
+    """
+    ACTION_CHOICES = [
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.CharField(max_length=255)
+    checksum = models.CharField(max_length=40, blank=True)
+    indexed_at = models.DateTimeField(null=True, blank=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, blank=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Search Index State"
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='home_search_state_unique_object'),
+        ]
+        indexes = [
+            # The queue: only objects with a pending update
+            models.Index(
+                fields=['queued_at'], condition=models.Q(queued_at__isnull=False),
+                name='home_search_state_queue_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type} {self.object_id}"
+
+
+# ============================================================================
+# PRE-RENDERING
+# ============================================================================
+
+class PrerenderQueueEntry(models.Model):
+    """
+    A page waiting to be pre-rendered again after something it shows was
+    published, unpublished, moved or deleted. One row per page, so queuing the
+    same page again only moves ``queued_at``; ``prerender_pages --queued``
+    renders the queue and removes the rows. See home/prerender.py.
+    """
+    # A plain id: the row outlives a page deleted before it's rendered
+    page_id = models.IntegerField(unique=True)
+    queued_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Pre-render Queue Entry"
+        verbose_name_plural = "Pre-render Queue"
+
+    def __str__(self):
+        return f"Page {self.page_id}"
+
+
+# ============================================================================
+# CATALOG VERSION
+# ============================================================================
+
+class CatalogVersion(models.Model):
+    """
+    The one version of the catalog everything derived from it is keyed on:
+    the API responses and their ETags (home/api.py), the services listing
+    batches, the booking availability map and the in-memory booking indexes
+    (booking/catalog_index.py). A counter in a single row, bumped by
+    home/signals.py in the transaction that publishes, unpublishes, moves or
+    deletes a page, changes an image or imports the catalog. Every process
+    reads the new version as soon as that commits, and clearing or losing the
+    cache doesn't change it.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Catalog Version"
+
+    def __str__(self):
+        return str(self.version)
+
+    @classmethod
+    def get(cls):
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1):
+            _, created = cls.objects.get_or_create(pk=1, defaults={'version': 1})
+            if not created:
+                cls.objects.filter(pk=1).update(version=F('version') + 1)
@@ -0,0 +1,284 @@
+"""
+Pre-rendering of content pages to static HTML files.
+
+Home, listing and catalog detail pages only change when something is
+published, so they can be rendered once to
+``STATIC_PRERENDER_ROOT/<page path>/index.html`` and served by the web server
+without touching Django. Booking pages, search and the booking APIs are never
+pre-rendered. Pages are rendered through the normal request stack (middleware
+and views, in-process) as an anonymous visitor of the default site, so the
+files match what Django serves.
+
+After a publish, the affected pages are queued (PrerenderQueueEntry) rather
+than rendered in the editor's request; ``prerender_pages --queued`` renders
+the queue.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.db import connections
+from django.test import RequestFactory
+from django.utils import timezone
+from wagtail.models import Page, Site
+
+from home.models import (
+    EmployeePage,
+    EmployeesPage,
+    HomePage,
+    LocationPage,
+    LocationsPage,
+    PrerenderQueueEntry,
+    ServiceLocation,
+    ServicePage,
+    ServicesPage,
+)
+
+PRERENDER_PAGE_MODELS = (
+    HomePage,
+    EmployeesPage,
+    EmployeePage,
+    LocationsPage,
+    LocationPage,
+    ServicesPage,
+    ServicePage,
+)
+
+# Pages handed to a worker process at a time in parallel builds
+CHUNK_SIZE = 20
+
+
+def get_output_root():
+    return settings.STATIC_PRERENDER_ROOT
+
+
+def get_default_site():
+    return Site.objects.select_related('root_page').filter(is_default_site=True).first()
+
+
+def prerenderable_pages(site):
+    """Live, public content pages of ``site`` that can be served as static files"""
+    return (
+        Page.objects.live().public()
+        .type(*PRERENDER_PAGE_MODELS)
+        .descendant_of(site.root_page, inclusive=True)
+    )
+
+
+def page_path_for_url_path(site, url_path):
+    """'/home/services/haircut/' -> 'services/haircut' (None if outside ``site``)"""
+    root_path = site.root_page.url_path
+    if not url_path.startswith(root_path):
+        return None
+    return url_path[len(root_path):].strip('/')
+
+
+def output_file(root, page_path):
+    return os.path.join(root, page_path, 'index.html')
+
+
+def page_url(page_path):
+    return f'/{page_path}/' if page_path else '/'
+
+
+class SiteClient:
+    """
+    Sends GET requests for a site through the project's middleware and views
+    in-process, as the WSGI handler would (without the test client's
+    instrumentation). ``defaults`` are added to every request's environ.
+    """
+
+    def __init__(self, site, **defaults):
+        host = site.hostname if site.port in (80, 443) else f'{site.hostname}:{site.port}'
+        self.factory = RequestFactory(HTTP_HOST=host, **defaults)
+        self.handler = BaseHandler()
+        self.handler.load_middleware()
+
+    def get(self, path, data=None, secure=False, **extra):
+        return self.handler.get_response(self.factory.get(path, data, secure=secure, **extra))
+
+
+def get_client(site, **defaults):
+    return SiteClient(site, **defaults)
+
+
+def render_page(client, site, page_path):
+    """HTML for ``page_path`` as an anonymous visitor sees it, or None if it can't be cached"""
+    response = client.get(page_url(page_path), secure=site.port == 443)
+    if (
+        response.status_code != 200
+        or response.streaming
+        or not response.get('Content-Type', '').startswith('text/html')
+        # A page that sets cookies (CSRF, session) is per-visitor
+        or response.cookies
+    ):
+        return None
+    return response.content
+
+
+def write_file(path, content):
+    """Write atomically, so the web server never serves a half-written page"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.index-', suffix='.html')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def render_pages(page_ids, root):
+    """
+    Render the given pages into ``root``. Ids that aren't pre-renderable are
+    ignored. Returns (rendered ids, skipped ids).
+    """
+    site = get_default_site()
+    if site is None:
+        return [], []
+
+    client = get_client(site)
+    rendered, skipped = [], []
+    for page in prerenderable_pages(site).filter(pk__in=list(page_ids)).order_by('path'):
+        page_path = page_path_for_url_path(site, page.url_path)
+        content = render_page(client, site, page_path)
+        if content is None:
+            skipped.append(page.pk)
+            continue
+        write_file(output_file(root, page_path), content)
+        rendered.append(page.pk)
+    return rendered, skipped
+
+
+def _init_worker():
+    django.setup()
+
+
+def build_pages(page_ids, root, workers=1):
+    """render_pages(), split across ``workers`` processes"""
+    page_ids = list(page_ids)
+    if workers <= 1 or len(page_ids) <= CHUNK_SIZE:
+        return render_pages(page_ids, root)
+
+    chunks = [page_ids[i:i + CHUNK_SIZE] for i in range(0, len(page_ids), CHUNK_SIZE)]
+    # Worker processes must open their own database connections
+    connections.close_all()
+    rendered, skipped = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for chunk_rendered, chunk_skipped in executor.map(render_pages, chunks, [root] * len(chunks)):
+            rendered += chunk_rendered
+            skipped += chunk_skipped
+    return rendered, skipped
+
+
+def build_site(root, workers=1):
+    """
+    Render every pre-renderable page of the default site into a fresh
+    directory, then swap it in for ``root`` (so pages that are gone disappear).
+    """
+    site = get_default_site()
+    parent = os.path.dirname(os.path.abspath(root))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.prerender-', dir=parent)
+    try:
+        page_ids = prerenderable_pages(site).values_list('pk', flat=True) if site else []
+        rendered, skipped = build_pages(page_ids, staging, workers)
+        os.chmod(staging, 0o755)
+        if os.path.exists(root):
+            previous = f'{staging}-previous'
+            os.rename(root, previous)
+            os.rename(staging, root)
+            shutil.rmtree(previous)
+        else:
+            os.rename(staging, root)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return rendered, skipped
+
+
+def queue_pages(page_ids):
+    """Queue pages to be rendered again; a page already queued is only moved back"""
+    now = timezone.now()
+    PrerenderQueueEntry.objects.bulk_create(
+        [PrerenderQueueEntry(page_id=page_id, queued_at=now) for page_id in page_ids],
+        update_conflicts=True,
+        unique_fields=['page_id'],
+        update_fields=['queued_at'],
+    )
+
+
+def queue_site():
+    """Queue every pre-renderable page of the default site"""
+    site = get_default_site()
+    if site is not None:
+        queue_pages(prerenderable_pages(site).values_list('pk', flat=True))
+
+
+def process_queue(root, batch_size=100, workers=1):
+    """
+    Render the pages queued so far into ``root``, ``batch_size`` at a time.
+    Pages queued again while their batch is being rendered stay queued for
+    the next run. Returns (rendered ids, skipped ids).
+    """
+    started = timezone.now()
+    rendered, skipped = [], []
+    while True:
+        claimed_at = timezone.now()
+        rows = list(
+            PrerenderQueueEntry.objects.filter(queued_at__lte=started)
+            .order_by('queued_at')
+            .values_list('pk', 'page_id')[:batch_size]
+        )
+        if not rows:
+            return rendered, skipped
+        batch_rendered, batch_skipped = build_pages([page_id for pk, page_id in rows], root, workers)
+        rendered += batch_rendered
+        skipped += batch_skipped
+        PrerenderQueueEntry.objects.filter(pk__in=[pk for pk, page_id in rows], queued_at__lte=claimed_at).delete()
+
+
+def affected_page_ids(page):
+    """
+    Ids of the pages whose HTML shows ``page``: the page itself, its ancestors
+    (listings, home page), its siblings (related links) and the catalog pages
+    linked to it through service locations or work locations. Only uses ids
+    and tree paths, so it also works for a page that has just been deleted.
+    """
+    page_ids = set(Page.objects.ancestor_of(page, inclusive=True).values_list('pk', flat=True))
+    page_ids |= set(Page.objects.sibling_of(page).values_list('pk', flat=True))
+
+    page_class = page.specific_class
+    if page_class and issubclass(page_class, LocationPage):
+        page_ids |= set(ServiceLocation.objects.filter(location_id=page.pk).values_list('service_id', flat=True))
+        page_ids |= set(EmployeePage.objects.filter(work_location_id=page.pk).values_list('pk', flat=True))
+    elif page_class and issubclass(page_class, ServicePage):
+        page_ids |= set(ServiceLocation.objects.filter(service_id=page.pk).values_list('location_id', flat=True))
+    elif page_class and issubclass(page_class, EmployeePage):
+        page_ids |= set(
+            EmployeePage.objects.filter(pk=page.pk, work_location__isnull=False)
+            .values_list('work_location_id', flat=True)
+        )
+    return page_ids
+
+
+def remove_url_path(root, url_path, include_descendants=False):
+    """Delete the pre-rendered file of a page that is no longer served at ``url_path``"""
+    site = get_default_site()
+    page_path = page_path_for_url_path(site, url_path) if site else None
+    if page_path is None:
+        return
+    if include_descendants and page_path:
+        shutil.rmtree(os.path.join(root, page_path), ignore_errors=True)
+    else:
+        try:
+            os.remove(output_file(root, page_path))
+        except FileNotFoundError:
+            pass
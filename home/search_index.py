@@ -0,0 +1,285 @@
+"""
+Deferred, batched search index updates.
+
+The search backends are configured with ``AUTO_UPDATE: False``, so saving or
+publishing a page no longer writes to the search index inside the editor's
+request. Instead, publishing, unpublishing, moving and deleting pages (and
+saving or deleting other indexed objects, e.g. images) queue the object in
+SearchIndexState once the transaction commits; the ``update_search_index``
+command sends the queue to the backends in batches, one ``add_bulk`` per
+model.
+
+Each object's searchable text (its search fields' values) is hashed, and an
+object whose checksum matches the one last indexed isn't sent again, so
+republishing unchanged pages or re-running a full update is cheap. A full
+update splits the page tree into runs of pages in tree order and can spread
+them across worker processes, then removes the objects indexed earlier that
+are gone.
+"""
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.db.models import Manager
+from django.utils import timezone
+from wagtail.models import Page
+from wagtail.search import index
+from wagtail.search.backends import get_search_backends
+
+from home.models import SearchIndexState
+
+# Pages handed to a worker process at a time in parallel updates
+CHUNK_SIZE = 500
+
+
+def get_backends():
+    return list(get_search_backends(with_auto_update=False))
+
+
+# ============================================================================
+# CHECKSUMS
+# ============================================================================
+
+def indexed_values(obj, fields):
+    """
+    (field name, value) for the searchable text of ``obj``. Filter fields are
+    left out: the database backend filters on the model's own columns, so
+    publishing an unchanged page (which moves ``last_published_at``) doesn't
+    need re-indexing.
+    """
+    for field in fields:
+        if isinstance(field, index.FilterField):
+            continue
+        if isinstance(field, index.RelatedFields):
+            value = field.get_value(obj)
+            if isinstance(value, Manager):
+                related = value.all()
+            elif value is None:
+                related = []
+            else:
+                related = [value() if callable(value) else value]
+            yield field.field_name, [list(indexed_values(item, field.fields)) for item in related]
+        else:
+            yield field.field_name, field.get_value(obj)
+
+
+def content_checksum(obj):
+    data = list(indexed_values(obj, obj.get_search_fields()))
+    return hashlib.sha1(json.dumps(data, default=str).encode()).hexdigest()
+
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+def content_type_id_for(instance):
+    # Pages are indexed as their specific type, which the page row records
+    if isinstance(instance, Page):
+        return instance.content_type_id
+    return ContentType.objects.get_for_model(instance).pk
+
+
+def queue_objects(content_type_id, object_ids, action='update'):
+    """Queue objects for the next update; an object already queued is only moved back"""
+    now = timezone.now()
+    SearchIndexState.objects.bulk_create(
+        [
+            SearchIndexState(content_type_id=content_type_id, object_id=str(object_id), action=action, queued_at=now)
+            for object_id in object_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['content_type', 'object_id'],
+        update_fields=['action', 'queued_at'],
+    )
+
+
+def queue_on_commit(instance, action='update'):
+    if not index.class_is_indexed(type(instance)) or instance.pk is None:
+        return
+    content_type_id, object_id = content_type_id_for(instance), instance.pk
+    transaction.on_commit(lambda: queue_objects(content_type_id, [object_id], action))
+
+
+# ============================================================================
+# INDEXING
+# ============================================================================
+
+def index_objects(model, objects, force=False):
+    """
+    Send the objects whose content changed since they were last indexed (all
+    of them with ``force``) to the search backends. Returns how many were sent.
+    """
+    objects = list(objects)
+    if not objects:
+        return 0
+    content_type = ContentType.objects.get_for_model(model)
+    checksums = {str(obj.pk): content_checksum(obj) for obj in objects}
+    indexed = dict(
+        SearchIndexState.objects.filter(content_type=content_type, object_id__in=list(checksums))
+        .values_list('object_id', 'checksum')
+    )
+    changed = [obj for obj in objects if force or indexed.get(str(obj.pk)) != checksums[str(obj.pk)]]
+    if not changed:
+        return 0
+
+    for backend in get_backends():
+        backend.add_bulk(model, changed)
+    now = timezone.now()
+    SearchIndexState.objects.bulk_create(
+        [
+            SearchIndexState(
+                content_type=content_type, object_id=str(obj.pk), checksum=checksums[str(obj.pk)], indexed_at=now,
+            )
+            for obj in changed
+        ],
+        update_conflicts=True,
+        unique_fields=['content_type', 'object_id'],
+        update_fields=['checksum', 'indexed_at'],
+    )
+    return len(changed)
+
+
+def remove_objects(model, object_ids):
+    """Remove objects (which may no longer exist) from the search backends"""
+    object_ids = [str(object_id) for object_id in object_ids]
+    for backend in get_backends():
+        for object_id in object_ids:
+            # The backends only need the model and primary key
+            backend.delete(model(pk=object_id))
+    SearchIndexState.objects.filter(
+        content_type=ContentType.objects.get_for_model(model), object_id__in=object_ids,
+    ).delete()
+
+
+def process_batch(rows):
+    """Index the queued ``rows`` (dicts of SearchIndexState values). Returns (sent, skipped, removed)."""
+    sent = skipped = removed = 0
+    by_content_type = {}
+    for row in rows:
+        by_content_type.setdefault(row['content_type_id'], []).append(row)
+
+    for content_type_id, content_type_rows in by_content_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None or not index.class_is_indexed(model):
+            continue
+        update_ids = [row['object_id'] for row in content_type_rows if row['action'] == 'update']
+        objects = list(model.get_indexed_objects().filter(pk__in=update_ids)) if update_ids else []
+        count = index_objects(model, objects)
+        sent += count
+        skipped += len(objects) - count
+
+        # Deleted objects, and objects that are no longer indexed
+        found = {str(obj.pk) for obj in objects}
+        gone = [row['object_id'] for row in content_type_rows if row['object_id'] not in found]
+        if gone:
+            remove_objects(model, gone)
+            removed += len(gone)
+    return sent, skipped, removed
+
+
+def process_queue(batch_size=500):
+    """
+    Send the updates queued so far, ``batch_size`` objects at a time. Objects
+    queued again while their batch is being indexed stay queued for the next
+    run. Returns (sent, skipped as unchanged, removed).
+    """
+    started = timezone.now()
+    totals = [0, 0, 0]
+    while True:
+        claimed_at = timezone.now()
+        rows = list(
+            SearchIndexState.objects.filter(queued_at__isnull=False, queued_at__lte=started)
+            .order_by('queued_at')
+            .values('pk', 'content_type_id', 'object_id', 'action')[:batch_size]
+        )
+        if not rows:
+            return tuple(totals)
+        for i, count in enumerate(process_batch(rows)):
+            totals[i] += count
+        SearchIndexState.objects.filter(
+            pk__in=[row['pk'] for row in rows], queued_at__lte=claimed_at,
+        ).update(action='', queued_at=None)
+
+
+# ============================================================================
+# FULL UPDATES
+# ============================================================================
+
+def index_pages(page_ids, force=False):
+    """Index the given pages as their specific types. Returns (checked, sent)."""
+    page_ids = list(page_ids)
+    ids_by_content_type = {}
+    for content_type_id, page_id in Page.objects.filter(pk__in=page_ids).values_list('content_type_id', 'pk'):
+        ids_by_content_type.setdefault(content_type_id, []).append(page_id)
+
+    checked = sent = 0
+    for content_type_id, ids in ids_by_content_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None or not index.class_is_indexed(model):
+            continue
+        objects = list(model.get_indexed_objects().filter(pk__in=ids))
+        checked += len(objects)
+        sent += index_objects(model, objects, force)
+    return checked, sent
+
+
+def _init_worker():
+    django.setup()
+
+
+def update_pages(workers=1, force=False):
+    """index_pages() over the whole page tree, split across ``workers`` processes"""
+    page_ids = list(Page.objects.order_by('path').values_list('pk', flat=True))
+    # Runs of pages in tree order: each chunk is a few neighbouring subtrees
+    chunks = [page_ids[i:i + CHUNK_SIZE] for i in range(0, len(page_ids), CHUNK_SIZE)]
+    if workers <= 1 or len(chunks) <= 1:
+        results = [index_pages(chunk, force) for chunk in chunks]
+    else:
+        # Worker processes must open their own database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            results = list(executor.map(index_pages, chunks, [force] * len(chunks)))
+    return sum(checked for checked, _ in results), sum(sent for _, sent in results)
+
+
+def remove_stale(batch_size=CHUNK_SIZE):
+    """
+    Remove the objects indexed earlier (those with a SearchIndexState row)
+    that no longer exist or are no longer indexed from the search backends.
+    Returns how many were removed.
+    """
+    removed = 0
+    content_type_ids = SearchIndexState.objects.values_list('content_type_id', flat=True).distinct()
+    for content_type_id in list(content_type_ids):
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None or not index.class_is_indexed(model):
+            continue
+        object_ids = list(
+            SearchIndexState.objects.filter(content_type_id=content_type_id)
+            .order_by('pk').values_list('object_id', flat=True)
+        )
+        for start in range(0, len(object_ids), batch_size):
+            ids = object_ids[start:start + batch_size]
+            found = {str(pk) for pk in model.get_indexed_objects().filter(pk__in=ids).values_list('pk', flat=True)}
+            gone = [object_id for object_id in ids if object_id not in found]
+            if gone:
+                remove_objects(model, gone)
+                removed += len(gone)
+    return removed
+
+
+def update_other_models(force=False):
+    """Index every indexed model that isn't a page. Returns (checked, sent)."""
+    checked = sent = 0
+    for model in index.get_indexed_models():
+        if issubclass(model, Page):
+            continue
+        queryset = model.get_indexed_objects().order_by('pk')
+        for start in range(0, queryset.count(), CHUNK_SIZE):
+            objects = list(queryset[start:start + CHUNK_SIZE])
+            checked += len(objects)
+            sent += index_objects(model, objects, force)
+    return checked, sent
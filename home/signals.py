@@ -0,0 +1,231 @@
+"""
+Keeping caches of rendered pages in step with publishing, mostly once the
+transaction commits:
+
+- front-end cache purges by surrogate key (see home.frontend_cache)
+- queuing incremental pre-rendering, when STATIC_PRERENDER_ON_PUBLISH is on
+  (see home.prerender)
+- queuing search index updates (see home.search_index)
+- bumping the catalog version (home.models.CatalogVersion) that the API
+  responses, listing batches and booking indexes are keyed on, in the
+  transaction itself, so the new version commits or rolls back with the change
+
+Bulk catalog imports (home.catalog_import) send ``catalog_imported`` once
+instead of the per-page signals, and the caches are refreshed for the whole
+import.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from wagtail.images import get_image_model
+from wagtail.models import Page
+from wagtail.signals import page_published, page_slug_changed, page_unpublished, post_page_move
+
+from home.models import CatalogVersion
+
+# Sent once after a bulk catalog import, instead of the save and publish
+# signals of every imported page.
+# Arguments: sender, page_ids (the imported pages)
+catalog_imported = Signal()
+
+
+# ============================================================================
+# INCREMENTAL PRE-RENDERING
+# ============================================================================
+
+def prerender_on_publish():
+    return getattr(settings, 'STATIC_PRERENDER_ON_PUBLISH', False)
+
+
+def schedule_rebuild(page_ids, removed_url_path=None, include_descendants=False):
+    # Only removing stale files happens on commit; the pages are rendered
+    # by `prerender_pages --queued`, outside the editor's request
+    from home import prerender
+
+    def rebuild():
+        if removed_url_path:
+            prerender.remove_url_path(prerender.get_output_root(), removed_url_path, include_descendants)
+        prerender.queue_pages(page_ids)
+
+    transaction.on_commit(rebuild)
+
+
+def affected_page_ids(page):
+    # Imported on use, so worker startup doesn't load the renderer when
+    # pre-rendering on publish is off
+    from home import prerender
+
+    return prerender.affected_page_ids(page)
+
+
+def descendant_ids(page):
+    return set(Page.objects.descendant_of(page).values_list('pk', flat=True))
+
+
+@receiver(page_published)
+def prerender_published_page(sender, instance, **kwargs):
+    if prerender_on_publish():
+        schedule_rebuild(affected_page_ids(instance))
+
+
+@receiver(page_unpublished)
+def prerender_unpublished_page(sender, instance, **kwargs):
+    if prerender_on_publish():
+        schedule_rebuild(affected_page_ids(instance), removed_url_path=instance.url_path)
+
+
+@receiver(post_delete, sender=Page)
+def prerender_deleted_page(sender, instance, **kwargs):
+    if prerender_on_publish():
+        schedule_rebuild(
+            affected_page_ids(instance),
+            removed_url_path=instance.url_path,
+            include_descendants=True,
+        )
+
+
+@receiver(page_slug_changed)
+def prerender_renamed_page(sender, instance, instance_before, **kwargs):
+    # page_published re-renders the page itself; its descendants' URLs changed too
+    if prerender_on_publish():
+        schedule_rebuild(
+            descendant_ids(instance),
+            removed_url_path=instance_before.url_path,
+            include_descendants=True,
+        )
+
+
+@receiver(catalog_imported)
+def prerender_imported_pages(sender, page_ids, **kwargs):
+    # An import touches listings, catalog pages and related links all over
+    # the site: queue all of it rather than working out the affected pages
+    if prerender_on_publish():
+        from home import prerender
+
+        transaction.on_commit(prerender.queue_site)
+
+
+@receiver(post_page_move)
+def prerender_moved_page(sender, instance, parent_page_before, url_path_before, url_path_after, **kwargs):
+    if not prerender_on_publish():
+        return
+    page_ids = affected_page_ids(instance) | descendant_ids(instance)
+    # The old listing (and its other children's related links) changed as well
+    page_ids |= affected_page_ids(parent_page_before)
+    page_ids |= set(parent_page_before.get_children().values_list('pk', flat=True))
+    moved = url_path_before != url_path_after
+    schedule_rebuild(
+        page_ids,
+        removed_url_path=url_path_before if moved else None,
+        include_descendants=True,
+    )
+
+
+# ============================================================================
+# FRONT-END CACHE PURGING
+# ============================================================================
+
+def schedule_purge(*pages):
+    from home import frontend_cache
+
+    transaction.on_commit(lambda: frontend_cache.purge_pages(*pages))
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def purge_changed_page(sender, instance, **kwargs):
+    schedule_purge(instance)
+
+
+@receiver(post_delete, sender=Page)
+def purge_deleted_page(sender, instance, **kwargs):
+    schedule_purge(instance)
+
+
+@receiver(catalog_imported)
+def purge_imported_pages(sender, **kwargs):
+    from home import frontend_cache
+
+    transaction.on_commit(lambda: frontend_cache.get_purger().purge_keys({frontend_cache.ALL_PAGES_KEY}))
+
+
+@receiver(post_page_move)
+def purge_moved_page(sender, instance, parent_page_before, **kwargs):
+    schedule_purge(instance, parent_page_before)
+
+
+# ============================================================================
+# SEARCH INDEXING
+# ============================================================================
+
+def queue_search_update(instance, action='update'):
+    # Imported on use, like the renderer and the front-end cache purging
+    from home import search_index
+
+    search_index.queue_on_commit(instance, action)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+def queue_changed_page(sender, instance, **kwargs):
+    queue_search_update(instance)
+
+
+@receiver(post_delete, sender=Page)
+def queue_deleted_page(sender, instance, **kwargs):
+    queue_search_update(instance, 'delete')
+
+
+@receiver(post_save)
+def queue_saved_object(sender, instance, created=False, raw=False, **kwargs):
+    # Live pages are queued when created or published; drafts are queued on
+    # save so the admin search finds new pages
+    if raw or (isinstance(instance, Page) and instance.live and not created):
+        return
+    queue_search_update(instance)
+
+
+@receiver(post_delete)
+def queue_deleted_object(sender, instance, **kwargs):
+    if not isinstance(instance, Page):
+        queue_search_update(instance, 'delete')
+
+
+@receiver(catalog_imported)
+def queue_imported_pages(sender, page_ids, **kwargs):
+    page_ids_by_content_type = {}
+    for content_type_id, page_id in Page.objects.filter(pk__in=page_ids).values_list('content_type_id', 'pk'):
+        page_ids_by_content_type.setdefault(content_type_id, []).append(page_id)
+
+    def queue():
+        from home import search_index
+
+        for content_type_id, ids in page_ids_by_content_type.items():
+            search_index.queue_objects(content_type_id, ids)
+
+    transaction.on_commit(queue)
+
+
+# ============================================================================
+# CATALOG VERSION
+# ============================================================================
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+@receiver(catalog_imported)
+def bump_version_on_publish(sender, **kwargs):
+    CatalogVersion.bump()
+
+
+@receiver(post_delete, sender=Page)
+def bump_version_on_delete(sender, instance, **kwargs):
+    CatalogVersion.bump()
+
+
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+def bump_version_on_image_change(sender, instance, **kwargs):
+    CatalogVersion.bump()
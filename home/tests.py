@@ -1,7 +1,36 @@
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from beauty_salon.warmup import warm_up
+from booking.models import BookingPage
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.template import engines
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from home.models import HomePage
+from home.models import (
+    EmployeePage,
+    EmployeesPage,
+    HomePage,
+    LocationPage,
+    LocationsPage,
+    PrerenderQueueEntry,
+    SearchIndexState,
+    ServiceLocation,
+    ServicePage,
+    ServicesPage,
+)
 
-from wagtail.models import Page
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.images import get_image_model
+from wagtail.models import Page, Site
 from wagtail.test.utils import WagtailPageTestCase
 
 
@@ -41,3 +70,685 @@ class HomeTests(WagtailPageTestCase):
     def test_homepage_template_used(self):
         response = self.client.get(reverse("home"))
         self.assertTemplateUsed(response, "home/home_page.html")
+
+
+class PaginatedListingTests(WagtailPageTestCase):
+    """
+    Tests for server-side pagination of the services listing.
+    """
+
+    def setUp(self):
+        cache.clear()
+        root_page = Page.objects.get(pk=1)
+        homepage = HomePage(title="Home")
+        root_page.add_child(instance=homepage)
+        Site.objects.update(root_page=homepage)
+
+        self.services_page = ServicesPage(title="Services")
+        homepage.add_child(instance=self.services_page)
+        for i in range(5):
+            self.services_page.add_child(instance=ServicePage(
+                title=f"Service {i}", price=Decimal("10.00"), duration_minutes=30,
+            ))
+
+    def test_initial_response_renders_first_batch(self):
+        response = self.client.get(self.services_page.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [s.title for s in response.context["listing_items"]],
+            ["Service 0", "Service 1", "Service 2"],
+        )
+        self.assertContains(response, 'id="show-more-services"')
+        self.assertNotContains(response, "Service 3")
+
+    def test_fragment_returns_next_batch(self):
+        first = self.client.get(self.services_page.url)
+        response = self.client.get(
+            self.services_page.url, {"after": first.context["listing_next"]}
+        )
+        self.assertTemplateUsed(response, "includes/listing_cards.html")
+        self.assertTemplateNotUsed(response, "base.html")
+        self.assertContains(response, "Service 3")
+        self.assertContains(response, "Service 4")
+        self.assertNotContains(response, "Service 2")
+        self.assertEqual(response["X-Listing-Next"], "")
+
+
+class PrerenderTests(WagtailPageTestCase):
+    """
+    Tests for pre-rendering content pages to static HTML.
+    """
+
+    def setUp(self):
+        cache.clear()
+        root_page = Page.objects.get(pk=1)
+        self.homepage = HomePage(title="Home")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.update(root_page=self.homepage)
+
+        self.services_page = ServicesPage(title="Services", slug="services")
+        self.homepage.add_child(instance=self.services_page)
+        self.service = ServicePage(
+            title="Haircut", slug="haircut", price=Decimal("45.00"), duration_minutes=60,
+        )
+        self.services_page.add_child(instance=self.service)
+
+        self.root = os.path.join(tempfile.mkdtemp(), "prerendered")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.root))
+
+    def read(self, *parts):
+        with open(os.path.join(self.root, *parts, "index.html")) as f:
+            return f.read()
+
+    def test_build_renders_live_pages(self):
+        call_command("prerender_pages", "--output", self.root, stdout=StringIO())
+        self.assertIn("Haircut", self.read("services"))
+        self.assertIn("$45.00", self.read("services", "haircut"))
+        self.assertTrue(os.path.exists(os.path.join(self.root, "index.html")))
+
+    def test_full_build_drops_stale_pages(self):
+        stale = os.path.join(self.root, "old-page")
+        os.makedirs(stale)
+        call_command("prerender_pages", "--output", self.root, stdout=StringIO())
+        self.assertFalse(os.path.exists(stale))
+
+    def render_queue(self):
+        call_command("prerender_pages", "--queued", "--output", self.root, stdout=StringIO())
+
+    def test_publish_queues_affected_pages(self):
+        call_command("prerender_pages", "--output", self.root, stdout=StringIO())
+        with override_settings(STATIC_PRERENDER_ROOT=self.root, STATIC_PRERENDER_ON_PUBLISH=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.service.service_name = "Colour"
+                self.service.save_revision().publish()
+
+        # Nothing is rendered in the publishing request
+        self.assertNotIn("Colour", self.read("services", "haircut"))
+        self.assertLessEqual(
+            {self.homepage.pk, self.services_page.pk, self.service.pk},
+            set(PrerenderQueueEntry.objects.values_list("page_id", flat=True)),
+        )
+
+        self.render_queue()
+        self.assertIn("Colour", self.read("services", "haircut"))
+        self.assertIn("Colour", self.read("services"))
+        self.assertFalse(PrerenderQueueEntry.objects.exists())
+
+    def test_unpublish_removes_page(self):
+        call_command("prerender_pages", "--output", self.root, stdout=StringIO())
+        with override_settings(STATIC_PRERENDER_ROOT=self.root, STATIC_PRERENDER_ON_PUBLISH=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.service.unpublish()
+
+        self.assertFalse(os.path.exists(os.path.join(self.root, "services", "haircut", "index.html")))
+        self.render_queue()
+        self.assertNotIn("Haircut", self.read("services"))
+
+
+# Rate limit buckets in memory, as in booking's tests
+@override_settings(CACHES={
+    **settings.CACHES,
+    "throttle": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "throttle-tests"},
+})
+class SalonSiteTestCase(WagtailPageTestCase):
+    """
+    Builds a small salon site: one location offering one service, with one
+    employee working there, plus a booking page.
+    """
+
+    def setUp(self):
+        cache.clear()
+        caches["throttle"].clear()
+        root_page = Page.objects.get(pk=1)
+        self.homepage = HomePage(title="Home")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.update(root_page=self.homepage)
+
+        locations_page = LocationsPage(title="Locations")
+        self.homepage.add_child(instance=locations_page)
+        self.location = LocationPage(title="Downtown", location_name="Downtown Salon", address="1 Main St")
+        locations_page.add_child(instance=self.location)
+
+        self.services_page = ServicesPage(title="Services")
+        self.homepage.add_child(instance=self.services_page)
+        self.service = ServicePage(title="Haircut", price=Decimal("45.00"), duration_minutes=60)
+        self.service.service_locations.add(ServiceLocation(location=self.location))
+        self.services_page.add_child(instance=self.service)
+
+        self.employees_page = EmployeesPage(title="Team")
+        self.homepage.add_child(instance=self.employees_page)
+        self.employee = EmployeePage(
+            title="Anna", first_name="Anna", last_name="Smith", job_title="Stylist", work_location=self.location,
+        )
+        self.employees_page.add_child(instance=self.employee)
+
+        self.booking_page = BookingPage(title="Book", slug="book")
+        self.homepage.add_child(instance=self.booking_page)
+
+
+class WarmCacheTests(SalonSiteTestCase):
+    """
+    Tests for the warm_cache crawler.
+    """
+
+    def test_crawls_pages_and_booking_apis(self):
+        out = StringIO()
+        call_command("warm_cache", "--concurrency", "1", stdout=out)
+        output = out.getvalue()
+        for url in ["/", "/locations/downtown/", "/services/haircut/", "/team/anna/", "/book/"]:
+            self.assertIn(f"  {url}\n", output)
+        self.assertIn(f"/booking/api/services-by-location/?location_id={self.location.pk}", output)
+        self.assertIn(f"/booking/api/employees-by-location/?location_id={self.location.pk}", output)
+        self.assertIn("10 URLs in", output)
+
+    def test_crawls_listing_fragments(self):
+        for i in range(4):
+            self.services_page.add_child(instance=ServicePage(
+                title=f"Extra {i}", price=Decimal("10.00"), duration_minutes=30,
+            ))
+        out = StringIO()
+        call_command("warm_cache", "--concurrency", "1", "--skip-api", stdout=out)
+        self.assertIn("/services/?after=", out.getvalue())
+
+    @override_settings(BOOKING_THROTTLE_RATES={"booking_ip": "3/hour", "booking_email": "2/hour", "availability_ip": "1/min"})
+    def test_booking_apis_are_not_throttled(self):
+        for i in range(3):
+            self.location.get_parent().add_child(instance=LocationPage(
+                title=f"Branch {i}", location_name=f"Branch {i}", address=f"{i} High St",
+            ))
+        out = StringIO()
+        # Raises CommandError if any URL failed
+        call_command("warm_cache", "--concurrency", "1", "--skip-fragments", stdout=out)
+        self.assertEqual(out.getvalue().count("/booking/api/"), 8)
+        self.assertNotIn("   429 ", out.getvalue())
+
+
+@override_settings(FRONTEND_CACHE_PURGER={"BACKEND": "home.frontend_cache.LocalPurger"})
+class FrontendCacheTests(SalonSiteTestCase):
+    """
+    Tests for front-end cache headers and surrogate-key purging.
+    """
+
+    def surrogate_keys(self, response):
+        return set(response["Surrogate-Key"].split())
+
+    def test_detail_page_is_public_and_tagged_with_related_pages(self):
+        response = self.client.get(self.service.url)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("s-maxage=3600", response["Cache-Control"])
+        self.assertEqual(self.surrogate_keys(response), {
+            "pages",
+            "type-locationpage",
+            f"page-{self.service.pk}",
+            f"page-{self.services_page.pk}",
+        })
+
+    def test_listing_is_not_tagged_child_by_child(self):
+        response = self.client.get(self.employees_page.url)
+        keys = self.surrogate_keys(response)
+        self.assertLessEqual({f"page-{self.employees_page.pk}", "type-locationpage"}, keys)
+        self.assertNotIn(f"page-{self.employee.pk}", keys)
+
+    def test_home_page_is_tagged_with_chosen_pages(self):
+        self.homepage.content = [("service_selector", {
+            "title": "Our Services",
+            "subtitle": "",
+            "selected_services": [self.service],
+            "display_style": "grid",
+            "background_style": "white",
+        })]
+        self.homepage.save_revision().publish()
+        response = self.client.get("/")
+        self.assertIn(f"page-{self.service.pk}", self.surrogate_keys(response))
+
+    def test_booking_page_with_csrf_token_is_private(self):
+        self.booking_page.content = [("booking_form", {"title": "Book", "subtitle": ""})]
+        self.booking_page.save_revision().publish()
+        response = self.client.get(self.booking_page.url)
+        self.assertContains(response, "csrfmiddlewaretoken")
+        self.assertIn("private", response["Cache-Control"])
+        self.assertFalse(response.has_header("Surrogate-Key"))
+
+    def test_logged_in_responses_are_private(self):
+        self.login()
+        response = self.client.get(self.service.url)
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_publish_purges_page_parent_and_type_keys(self):
+        with self.assertLogs("home.frontend_cache", "INFO") as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.service.save_revision().publish()
+        keys = " ".join(sorted([f"page-{self.service.pk}", f"page-{self.services_page.pk}", "type-servicepage"]))
+        self.assertEqual(logs.output, [f"INFO:home.frontend_cache:Front-end cache purge: {keys}"])
+
+
+class StartupTests(WagtailPageTestCase):
+    """
+    Tests for the startup profile command and the preload warm-up.
+    """
+
+    def test_warm_up_compiles_project_templates(self):
+        root_page = Page.objects.get(pk=1)
+        homepage = HomePage(title="Home")
+        root_page.add_child(instance=homepage)
+        Site.objects.update(root_page=homepage)
+
+        loader = engines["django"].engine.template_loaders[0]
+        loader.reset()
+        warm_up()
+        for name in ["home/home_page.html", "includes/service_card.html", "booking/booking_page.html"]:
+            self.assertIn(name, loader.get_template_cache)
+
+    def test_profile_startup_lists_project_modules(self):
+        out = StringIO()
+        call_command("profile_startup", "--project-only", stdout=out)
+        self.assertIn("home/models.py", out.getvalue())
+
+
+class SearchIndexTests(WagtailPageTestCase):
+    """
+    Tests for the deferred search index updates.
+    """
+
+    def setUp(self):
+        root_page = Page.objects.get(pk=1)
+        self.homepage = HomePage(title="Home")
+        root_page.add_child(instance=self.homepage)
+        self.services_page = ServicesPage(title="Services", slug="services")
+        self.homepage.add_child(instance=self.services_page)
+        self.service = ServicePage(
+            title="Haircut", slug="haircut", price=Decimal("45.00"), duration_minutes=60,
+        )
+        self.services_page.add_child(instance=self.service)
+        call_command("update_search_index", "--all", stdout=StringIO())
+
+    def update_index(self):
+        out = StringIO()
+        call_command("update_search_index", stdout=out)
+        return out.getvalue()
+
+    def search(self, query):
+        return list(ServicePage.objects.search(query))
+
+    def test_publish_queues_update(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.title = "Balayage"
+            self.service.save_revision().publish()
+
+        self.assertEqual(self.search("Balayage"), [])
+        self.assertIn("Indexed 1 objects", self.update_index())
+        self.assertEqual(self.search("Balayage"), [self.service])
+        self.assertFalse(SearchIndexState.objects.filter(queued_at__isnull=False).exists())
+
+    def test_unchanged_page_is_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.save_revision().publish()
+
+        self.assertIn("Indexed 0 objects, skipped 1 unchanged", self.update_index())
+
+    def test_delete_removes_page(self):
+        self.assertEqual(self.search("Haircut"), [self.service])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.delete()
+
+        self.assertIn("removed 1", self.update_index())
+        self.assertEqual(self.search("Haircut"), [])
+        self.assertFalse(SearchIndexState.objects.filter(object_id=str(self.service.pk)).exists())
+
+    def test_full_update_removes_objects_that_are_gone(self):
+        # Deleted without its removal being queued. The database backend drops
+        # its own entries with the page; other backends (e.g. Elasticsearch)
+        # keep them until told
+        ServicePage.objects.filter(pk=self.service.pk).delete()
+        backend = mock.Mock()
+        out = StringIO()
+        with mock.patch("home.search_index.get_backends", return_value=[backend]):
+            call_command("update_search_index", "--all", stdout=out)
+        self.assertIn("removed 1 gone", out.getvalue())
+        [(removed,), _] = backend.delete.call_args
+        self.assertEqual((type(removed), str(removed.pk)), (ServicePage, str(self.service.pk)))
+        self.assertFalse(SearchIndexState.objects.filter(object_id=str(self.service.pk)).exists())
+
+    def test_full_update_skips_unchanged_objects(self):
+        out = StringIO()
+        call_command("update_search_index", "--all", stdout=out)
+        self.assertIn("Indexed 0 of", out.getvalue())
+
+        out = StringIO()
+        call_command("update_search_index", "--all", "--force", stdout=out)
+        self.assertNotIn("Indexed 0 of", out.getvalue())
+
+
+class CatalogImportTests(WagtailPageTestCase):
+    """
+    Tests for the bulk catalog import.
+    """
+
+    def setUp(self):
+        root_page = Page.objects.get(pk=1)
+        self.homepage = HomePage(title="Home")
+        root_page.add_child(instance=self.homepage)
+        self.locations_page = LocationsPage(title="Locations", slug="locations")
+        self.homepage.add_child(instance=self.locations_page)
+        self.services_page = ServicesPage(title="Services", slug="services")
+        self.homepage.add_child(instance=self.services_page)
+        self.employees_page = EmployeesPage(title="Team", slug="team")
+        self.homepage.add_child(instance=self.employees_page)
+        self.downtown = LocationPage(title="Downtown", slug="downtown", location_name="Downtown Salon", address="1 Main St")
+        self.locations_page.add_child(instance=self.downtown)
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.write("locations.csv", (
+            "location_name,slug,address,latitude,longitude,sunday_hours\n"
+            "Uptown Salon,uptown,9 High St,40.78,-73.97,Closed\n"
+        ))
+        self.write("services.json", (
+            '[{"service_name": "Haircut", "price": "45.00", "duration_minutes": 60,'
+            ' "service_category": "hair", "locations": ["downtown", "uptown"]},'
+            ' {"service_name": "Manicure", "price": 30, "duration_minutes": 45, "locations": "uptown"}]'
+        ))
+        self.write("employees.csv", (
+            "first_name,last_name,job_title,work_location,skills\n"
+            "Anna,Smith,Stylist,uptown,haircut;manicure\n"
+            "Ben,Jones,Colourist,,\n"
+        ))
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), "w") as f:
+            f.write(content)
+
+    def import_catalog(self, **files):
+        files = files or {"locations": "locations.csv", "services": "services.json", "employees": "employees.csv"}
+        args = [arg for kind, name in files.items() for arg in (f"--{kind}", os.path.join(self.directory, name))]
+        out = StringIO()
+        call_command("import_catalog", *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_import_creates_linked_live_pages(self):
+        self.assertIn("Imported 5 pages", self.import_catalog())
+
+        uptown = LocationPage.objects.get(slug="uptown")
+        haircut = ServicePage.objects.get(slug="haircut")
+        anna = EmployeePage.objects.get(slug="anna-smith")
+        self.assertTrue(haircut.live)
+        self.assertEqual(haircut.url_path, f"{self.services_page.url_path}haircut/")
+        self.assertEqual(haircut.price, Decimal("45.00"))
+        self.assertEqual(
+            {sl.location_id for sl in haircut.service_locations.all()}, {self.downtown.pk, uptown.pk},
+        )
+        self.assertEqual(anna.work_location, uptown)
+        self.assertEqual(anna.full_name, "Anna Smith")
+        self.assertEqual({skill.service.slug for skill in anna.skills.all()}, {"haircut", "manicure"})
+        self.assertIsNone(EmployeePage.objects.get(slug="ben-jones").work_location)
+
+        # The tree and revisions are as if the pages were created in the editor
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+        self.assertEqual(self.locations_page.get_children().count(), 2)
+        revision = haircut.live_revision
+        self.assertEqual(revision, haircut.latest_revision)
+        self.assertEqual(revision.as_object().service_locations.count(), 2)
+
+    def test_imported_rows_match_pages_created_in_the_editor(self):
+        self.import_catalog()
+        imported = LocationPage.objects.get(slug="uptown")
+        created = LocationPage(
+            title="Uptown Salon", slug="uptown-2", location_name="Uptown Salon", address="9 High St",
+            latitude=Decimal("40.78"), longitude=Decimal("-73.97"), sunday_hours="Closed",
+        )
+        self.locations_page.add_child(instance=created)
+        created.refresh_from_db()
+        # Every column of LocationPage's own table, whatever its type
+        for field in LocationPage._meta.local_concrete_fields:
+            if field.primary_key:
+                continue
+            with self.subTest(field=field.name):
+                self.assertEqual(field.value_to_string(imported), field.value_to_string(created))
+
+    def test_reimport_skips_existing_pages(self):
+        self.import_catalog()
+        out = self.import_catalog()
+        self.assertIn("Imported 0 pages", out)
+        self.assertIn("Service pages: 0 created, 2 already existed", out)
+
+    def test_invalid_rows_import_nothing(self):
+        self.write("bad.json", '[{"service_name": "Colour", "price": "abc", "duration_minutes": 60}]')
+        with self.assertRaisesMessage(CommandError, "1 errors"):
+            self.import_catalog(locations="locations.csv", services="bad.json")
+        self.assertFalse(LocationPage.objects.filter(slug="uptown").exists())
+
+    def test_unknown_references_are_errors(self):
+        self.write("employees.csv", "first_name,last_name,job_title,work_location\nCleo,Ward,Stylist,nowhere\n")
+        with self.assertRaisesMessage(CommandError, "1 errors"):
+            self.import_catalog(employees="employees.csv")
+
+    def test_import_queues_pages_for_search_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_catalog()
+        queued = SearchIndexState.objects.filter(queued_at__isnull=False)
+        self.assertEqual(
+            set(queued.values_list("object_id", flat=True)),
+            {str(pk) for pk in Page.objects.filter(depth=4).exclude(pk=self.downtown.pk).values_list("pk", flat=True)},
+        )
+
+
+class HeadlessApiTests(WagtailPageTestCase):
+    """
+    Tests for the read-only catalog API.
+    """
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        root_page = Page.objects.get(pk=1)
+        self.homepage = HomePage(title="Home")
+        root_page.add_child(instance=self.homepage)
+        self.locations_page = LocationsPage(title="Locations")
+        self.homepage.add_child(instance=self.locations_page)
+        self.location = LocationPage(title="Downtown", location_name="Downtown Salon", address="1 Main St")
+        self.locations_page.add_child(instance=self.location)
+        self.services_page = ServicesPage(title="Services")
+        self.homepage.add_child(instance=self.services_page)
+        self.services = []
+        for name in ["Haircut", "Manicure", "Facial"]:
+            service = ServicePage(title=name, service_name=name, price=Decimal("45.00"), duration_minutes=60)
+            service.service_locations = [ServiceLocation(location=self.location)]
+            self.services_page.add_child(instance=service)
+            self.services.append(service)
+
+    def get(self, resource, **params):
+        return self.client.get(reverse("api:listing", args=[resource]), params)
+
+    def test_default_fields(self):
+        response = self.get("services")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["items"][0], {
+            "id": self.services[0].pk, "title": "Haircut", "service_name": "Haircut",
+            "service_category": "other", "price": "45.00", "duration_minutes": 60,
+        })
+
+    def test_only_requested_columns_are_selected(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get("services", fields="service_name,location_ids")
+        self.assertEqual(
+            response.json()["items"][0],
+            {"id": self.services[0].pk, "service_name": "Haircut", "location_ids": [self.location.pk]},
+        )
+        page_query = next(q["sql"] for q in queries.captured_queries if "home_servicepage" in q["sql"])
+        self.assertIn('"service_name"', page_query)
+        self.assertNotIn('"price"', page_query)
+        self.assertNotIn('"service_description"', page_query)
+
+    def test_unknown_field(self):
+        response = self.get("services", fields="service_name,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Unknown fields: secret"})
+
+    def test_bulk_fetch_by_ids(self):
+        ids = [self.services[2].pk, self.services[0].pk, 999999]
+        response = self.get("services", id=",".join(map(str, ids)), fields="title")
+        self.assertEqual([item["title"] for item in response.json()["items"]], ["Haircut", "Facial"])
+
+    def test_keyset_pagination(self):
+        first = self.get("services", fields="title", limit=2).json()
+        self.assertEqual([item["title"] for item in first["items"]], ["Haircut", "Manicure"])
+        self.assertEqual(first["next"], self.services[1].pk)
+        second = self.get("services", fields="title", limit=2, after=first["next"]).json()
+        self.assertEqual([item["title"] for item in second["items"]], ["Facial"])
+        self.assertIsNone(second["next"])
+
+    def test_detail(self):
+        url = reverse("api:detail", args=["locations", self.location.pk])
+        response = self.client.get(url, {"fields": "location_name,hours"})
+        self.assertEqual(response.json()["hours"]["sunday"], "Closed")
+        self.location.unpublish()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api:listing", args=["bookings"])).status_code, 404)
+
+    def test_renditions_are_fetched_in_batch(self):
+        for service in self.services:
+            service.service_image = get_image_model().objects.create(title=service.title, file=get_test_image_file())
+            service.save_revision().publish()
+        # Generate the renditions
+        items = self.get("services", fields="image").json()["items"]
+        self.assertTrue(items[0]["image"]["url"].endswith(".png"))
+        self.assertEqual(items[0]["image"]["width"], 640)
+
+        query_counts = []
+        for ids in [self.services[:1], self.services]:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.get("services", fields="image", id=",".join(str(service.pk) for service in ids))
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+        self.assertEqual(self.get("services", rendition="fill-9999x9999").status_code, 400)
+
+    def test_responses_are_cached_until_a_page_is_published(self):
+        self.get("services")
+        # Only the catalog version is read
+        with self.assertNumQueries(1):
+            response = self.get("services")
+        etag = response["ETag"]
+        response = self.client.get(reverse("api:listing", args=["services"]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.services[0].title = "Cut & Style"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.services[0].save_revision().publish()
+        response = self.client.get(reverse("api:listing", args=["services"]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["items"][0]["title"], "Cut & Style")
+
+
+    def test_etag_is_the_same_in_every_process(self):
+        etag = self.get("services")["ETag"]
+        # Another process, or a cleared cache, has no cached version to go by
+        cache.clear()
+        response = self.client.get(reverse("api:listing", args=["services"]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.services[0].title = "Cut & Style"
+        self.services[0].save_revision().publish()
+        cache.clear()
+        response = self.client.get(reverse("api:listing", args=["services"]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["items"][0]["title"], "Cut & Style")
+
+
+class ServicesListingFilterTests(WagtailPageTestCase):
+    """
+    Tests for filtering and sorting the services listing.
+    """
+
+    def setUp(self):
+        cache.clear()
+        root_page = Page.objects.get(pk=1)
+        homepage = HomePage(title="Home")
+        root_page.add_child(instance=homepage)
+        Site.objects.update(root_page=homepage)
+
+        locations_page = LocationsPage(title="Locations")
+        homepage.add_child(instance=locations_page)
+        self.downtown = LocationPage(title="Downtown", location_name="Downtown Salon", address="1 Main St")
+        locations_page.add_child(instance=self.downtown)
+        self.uptown = LocationPage(title="Uptown", location_name="Uptown Salon", address="9 High St")
+        locations_page.add_child(instance=self.uptown)
+
+        self.services_page = ServicesPage(title="Services")
+        homepage.add_child(instance=self.services_page)
+        for title, category, price, duration, locations in [
+            ("Haircut", "hair", "45.00", 60, [self.downtown]),
+            ("Colour", "hair", "90.00", 120, [self.downtown, self.uptown]),
+            ("Manicure", "nails", "30.00", 45, [self.uptown]),
+            ("Blow-dry", "hair", "30.00", 30, [self.uptown]),
+            ("Facial", "skincare", "60.00", 60, [self.downtown]),
+        ]:
+            service = ServicePage(
+                title=title, service_category=category, price=Decimal(price), duration_minutes=duration,
+            )
+            service.service_locations = [ServiceLocation(location=location) for location in locations]
+            self.services_page.add_child(instance=service)
+
+    def titles(self, **params):
+        response = self.client.get(self.services_page.url, params)
+        return [service.title for service in response.context["listing_items"]], response.context["listing_next"]
+
+    def test_filter_by_category_and_location(self):
+        self.assertEqual(self.titles(category="hair"), (["Haircut", "Colour", "Blow-dry"], None))
+        self.assertEqual(self.titles(category="hair", location=self.uptown.pk), (["Colour", "Blow-dry"], None))
+        self.assertEqual(self.titles(location=self.downtown.pk), (["Haircut", "Colour", "Facial"], None))
+
+    def test_sort_with_keyset_batches(self):
+        titles, after = self.titles(sort="price")
+        # Equal prices stay in tree order
+        self.assertEqual(titles, ["Manicure", "Blow-dry", "Haircut"])
+        self.assertEqual(after, f"45.00|{ServicePage.objects.get(title='Haircut').path}")
+        response = self.client.get(self.services_page.url, {"sort": "price", "after": after})
+        self.assertContains(response, "Facial")
+        self.assertContains(response, "Colour")
+        self.assertNotContains(response, "Haircut")
+
+        self.assertEqual(self.titles(sort="-duration")[0], ["Colour", "Haircut", "Facial"])
+        self.assertEqual(self.titles(sort="-duration", category="hair")[0], ["Colour", "Haircut", "Blow-dry"])
+
+    def test_invalid_values_are_ignored(self):
+        self.assertEqual(self.titles(category="unknown", location="x", sort="title")[0], ["Haircut", "Colour", "Manicure"])
+        response = self.client.get(self.services_page.url, {"sort": "price", "after": "cheap|0001"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_batches_are_cached_per_filter_combination(self):
+        self.titles(category="hair", sort="price")
+        with CaptureQueriesContext(connection) as queries:
+            self.titles(category="hair", sort="price")
+        listing_queries = [q["sql"] for q in queries.captured_queries if "home_servicepage" in q["sql"]]
+        # Only the cached batch's pages by id, plus one query for their locations
+        self.assertEqual(len(listing_queries), 1)
+        self.assertIn('"home_servicepage"."page_ptr_id" IN', listing_queries[0])
+        self.assertNotIn('"service_category"', listing_queries[0].split("WHERE")[-1])
+        self.assertEqual(
+            sum('"home_servicelocation"' in q["sql"] and "INNER JOIN" in q["sql"] for q in queries.captured_queries), 1,
+        )
+        self.assertEqual(self.titles(category="nails")[0], ["Manicure"])
+
+    def test_cached_batches_follow_publishes_in_other_processes(self):
+        self.assertEqual(self.titles(category="hair", sort="price")[0], ["Blow-dry", "Haircut", "Colour"])
+        # Published without running on-commit callbacks, as another process
+        # would: only the version in the database changes here
+        trim = ServicePage(title="Trim", service_category="hair", price=Decimal("20.00"), duration_minutes=15)
+        self.services_page.add_child(instance=trim)
+        trim.save_revision().publish()
+        self.assertEqual(self.titles(category="hair", sort="price")[0], ["Trim", "Blow-dry", "Haircut"])
+
+    def test_filtering_uses_the_indexes(self):
+        queryset = ServicePage.objects.filter(service_category="hair").order_by("price")
+        with connection.cursor() as cursor:
+            sql, params = queryset.values("pk").query.sql_with_params()
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("home_svc_category_price_idx", plan)
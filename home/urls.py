@@ -0,0 +1,9 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('<str:resource>/', api.listing, name='listing'),
+    path('<str:resource>/<int:pk>/', api.detail, name='detail'),
+]
@@ -0,0 +1,7 @@
+from wagtail import hooks
+
+
+@hooks.register('before_serve_page')
+def remember_served_page(page, request, serve_args, serve_kwargs):
+    # Lets FrontendCacheMiddleware tag the response with the page's surrogate keys
+    request.frontend_cache_page = page